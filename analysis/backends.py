@@ -0,0 +1,502 @@
+"""
+Inference backends used by HuggingFaceLLM
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+ONNX_MODEL_FILE = 'model.onnx'
+ONNX_METADATA_FILE = 'export.json'
+
+
+def is_model_cached(model_name, cache_dir):
+    """Check whether the model files are already in the local HuggingFace cache"""
+    from huggingface_hub import try_to_load_from_cache
+
+    cached = try_to_load_from_cache(model_name, "config.json", cache_dir=cache_dir)
+    return isinstance(cached, str)
+
+
+SAFETENSORS_DTYPES = {
+    'F32': 'float32', 'F16': 'float16', 'BF16': 'bfloat16',
+    'I64': 'int64', 'I32': 'int32', 'I8': 'int8', 'U8': 'uint8', 'BOOL': 'bool',
+}
+
+
+def safetensors_files(model_dir):
+    """Weight files of a safetensors export: the single file, or the shards its index lists"""
+    single = os.path.join(model_dir, 'model.safetensors')
+    if os.path.exists(single):
+        return [single]
+    index_path = os.path.join(model_dir, 'model.safetensors.index.json')
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            shards = sorted(set(json.load(f)['weight_map'].values()))
+        return [os.path.join(model_dir, shard) for shard in shards]
+    return []
+
+
+def mmap_safetensors(path):
+    """Map a .safetensors file and return tensors that view the mapping
+
+    The file is mapped privately (copy-on-write), so processes loading the
+    same file share its pages through the page cache as long as the weights
+    are not written to.
+    """
+    import struct
+    import torch
+
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop('__metadata__', None)
+
+    file_size = os.path.getsize(path)
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=file_size)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        start, end = info['data_offsets']
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info['dtype']])
+        tensor = torch.empty(0, dtype=torch.uint8)
+        tensor.set_(storage, data_start + start, (end - start,), (1,))
+        tensors[name] = tensor.view(dtype).reshape(info['shape'])
+    return tensors
+
+
+class InferenceBackend:
+    """Turns prompts into generated text; HuggingFaceLLM only talks to this interface"""
+
+    name = 'base'
+
+    def generate(self, prompts, deadline=None, stop_at_sentence_end=False, min_new_tokens=0, **generation):
+        """Return the generated continuation for each prompt
+
+        Generation stops early at the time.monotonic() ``deadline`` and, with
+        ``stop_at_sentence_end``, at the first sentence end after
+        ``min_new_tokens``.
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt, **generation):
+        """Yield generated text chunks for a single prompt"""
+        yield from self.generate([prompt], **generation)
+
+    def prepare_prefix(self, prefix):
+        """Precompute state for a prompt prefix shared by every request"""
+
+    def memory_mb(self):
+        """Approximate memory held by the model weights"""
+        return None
+
+    def stats(self):
+        return {}
+
+    def describe(self):
+        return self.name
+
+
+class TorchBackend(InferenceBackend):
+    """Eager PyTorch AutoModelForCausalLM + model.generate"""
+
+    name = 'torch'
+
+    def __init__(self, model, tokenizer, precision):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.precision = precision
+        self.device = next(model.parameters()).device
+        self._prefix = None
+        self._prefix_hits = 0
+        self._prefix_misses = 0
+
+    @classmethod
+    def from_mmap(cls, model_dir, precision):
+        """Load a save_pretrained(safe_serialization=True) directory with memory-mapped weights
+
+        Weights stay backed by the file mapping, so every worker that loads
+        the same directory shares one copy of the pages. Precisions that
+        rewrite the weights (bf16 from an fp32 file, int8) make private copies.
+        """
+        from transformers import AutoConfig, AutoTokenizer, AutoModelForCausalLM
+        from transformers.modeling_utils import no_init_weights
+        from .precision import apply_precision, load_dtype
+
+        config = AutoConfig.from_pretrained(model_dir)
+        tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        # Skip random init; every parameter is replaced by a mapped tensor below
+        with no_init_weights():
+            model = AutoModelForCausalLM.from_config(config, torch_dtype=load_dtype(precision))
+
+        state_dict = {}
+        for path in safetensors_files(model_dir):
+            state_dict.update(mmap_safetensors(path))
+        dtype = load_dtype(precision)
+        state_dict = {k: v if v.dtype == dtype else v.to(dtype) for k, v in state_dict.items()}
+        result = model.load_state_dict(state_dict, strict=False, assign=True)
+
+        # Weights missing from the file would be left as uninitialized memory
+        tied = {'lm_head.weight'} if getattr(config, 'tie_word_embeddings', False) else set()
+        missing = [key for key in result.missing_keys if key not in tied]
+        if missing or result.unexpected_keys:
+            raise ValueError(
+                f"Safetensors export in {model_dir} does not match {config.model_type}: "
+                f"missing {missing[:5]}, unexpected {result.unexpected_keys[:5]}"
+            )
+        model.tie_weights()
+        model.eval()
+        model = apply_precision(model, precision)
+
+        backend = cls(model, tokenizer, precision)
+        backend.loaded_from_local_cache = True
+        backend.weights_mmapped = True
+        return backend
+
+    @classmethod
+    def from_pretrained(cls, model_name, cache_dir, precision):
+        """Load tokenizer and model, logging in only when a download is needed"""
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+        from huggingface_hub import login
+        from .precision import apply_precision, load_dtype
+
+        local_only = is_model_cached(model_name, cache_dir)
+        if not local_only:
+            login(token=os.getenv("HUGGINGFACE_API_KEY", ""))
+
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+        tokenizer = AutoTokenizer.from_pretrained(
+            model_name,
+            cache_dir=cache_dir,
+            local_files_only=local_only
+        )
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            cache_dir=cache_dir,
+            local_files_only=local_only,
+            torch_dtype=load_dtype(precision)
+        ).to(device)
+        model.eval()
+        model = apply_precision(model, precision)
+
+        backend = cls(model, tokenizer, precision)
+        backend.loaded_from_local_cache = local_only
+        return backend
+
+    def prepare_prefix(self, prefix):
+        """Run the prefix through the model once and keep its past key/values
+
+        The prefix should end on a token boundary (e.g. before a space), so
+        that encoding prefix and suffix separately matches encoding the
+        whole prompt.
+        """
+        import torch
+
+        input_ids = self.tokenizer(prefix, return_tensors='pt')['input_ids'].to(self.device)
+        with torch.no_grad():
+            past_key_values = self.model(input_ids, use_cache=True).past_key_values
+
+        self._prefix = (prefix, input_ids, tuple(tuple(layer) for layer in past_key_values))
+
+    def _encode(self, prompts):
+        """Tokenize prompts, starting from the cached prefix state when possible"""
+        import torch
+
+        if self._prefix is not None:
+            prefix, prefix_ids, past_key_values = self._prefix
+            if all(prompt.startswith(prefix) for prompt in prompts):
+                suffixes = [self.tokenizer(prompt[len(prefix):])['input_ids'] for prompt in prompts]
+
+                # Padding would sit between prefix and suffix, so only equal-length suffixes qualify
+                if len({len(suffix) for suffix in suffixes}) == 1:
+                    batch_size = len(prompts)
+                    suffix_ids = torch.tensor(suffixes, dtype=torch.long, device=self.device)
+                    input_ids = torch.cat([prefix_ids.expand(batch_size, -1), suffix_ids], dim=1)
+                    self._prefix_hits += 1
+                    return {
+                        'input_ids': input_ids,
+                        'attention_mask': torch.ones_like(input_ids),
+                        'past_key_values': tuple(
+                            tuple(t.expand(batch_size, -1, -1, -1) for t in layer)
+                            for layer in past_key_values
+                        ),
+                    }
+            self._prefix_misses += 1
+
+        # Left padding keeps every prompt flush against its generated tokens
+        self.tokenizer.padding_side = 'left'
+        inputs = self.tokenizer(prompts, return_tensors='pt', padding=True)
+        return {k: v.to(self.device) for k, v in inputs.items()}
+
+    def _stopping_criteria(self, prompt_length, batch_size, deadline, stop_at_sentence_end, min_new_tokens):
+        from transformers import StoppingCriteriaList
+        from .decoding import DeadlineCriteria, SentenceEndCriteria, sentence_end_token_ids
+
+        criteria = StoppingCriteriaList()
+        sentence_end = None
+        if deadline is not None:
+            criteria.append(DeadlineCriteria(deadline))
+        if stop_at_sentence_end:
+            sentence_end = SentenceEndCriteria(
+                sentence_end_token_ids(self.tokenizer), prompt_length, batch_size, min_new_tokens
+            )
+            criteria.append(sentence_end)
+        return criteria, sentence_end
+
+    def generate(self, prompts, deadline=None, stop_at_sentence_end=False, min_new_tokens=0, **generation):
+        import torch
+
+        inputs = self._encode(prompts)
+        prompt_length = inputs['input_ids'].shape[1]
+        criteria, sentence_end = self._stopping_criteria(
+            prompt_length, len(prompts), deadline, stop_at_sentence_end, min_new_tokens
+        )
+
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=criteria,
+                **generation
+            )
+
+        results = []
+        for row, tokens in enumerate(outputs):
+            # Rows that ended a sentence early are cut where they stopped
+            end = sentence_end.stopped_at[row] if sentence_end is not None else None
+            results.append(
+                self.tokenizer.decode(tokens[prompt_length:end], skip_special_tokens=True).strip()
+            )
+        return results
+
+    def stream(self, prompt, deadline=None, stop_at_sentence_end=False, min_new_tokens=0, **generation):
+        import torch
+        from transformers import TextIteratorStreamer
+
+        inputs = self._encode([prompt])
+        criteria, _ = self._stopping_criteria(
+            inputs['input_ids'].shape[1], 1, deadline, stop_at_sentence_end, min_new_tokens
+        )
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+        def run():
+            try:
+                with torch.no_grad():
+                    self.model.generate(
+                        **inputs,
+                        streamer=streamer,
+                        pad_token_id=self.tokenizer.eos_token_id,
+                        stopping_criteria=criteria,
+                        **generation
+                    )
+            except Exception as e:
+                print(f"Warning: streaming generation failed: {e}")
+                streamer.end()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        for text in streamer:
+            if text:
+                yield text
+        thread.join()
+
+    def memory_mb(self):
+        total = sum(p.numel() * p.element_size() for p in self.model.parameters())
+        total += sum(b.numel() * b.element_size() for b in self.model.buffers())
+        return total / (1024 * 1024)
+
+    def stats(self):
+        return {
+            'prefix_tokens': self._prefix[1].shape[1] if self._prefix is not None else 0,
+            'prefix_hits': self._prefix_hits,
+            'prefix_misses': self._prefix_misses,
+        }
+
+    def describe(self):
+        return f"{self.name}:{self.precision}"
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """Exported ONNX graph driven by an incremental (past key/values) decoding loop"""
+
+    name = 'onnx'
+
+    def __init__(self, model_dir, num_threads=0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, ONNX_METADATA_FILE), 'r') as f:
+            self.metadata = json.load(f)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+        self.session = ort.InferenceSession(
+            self.model_path, options, providers=['CPUExecutionProvider']
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.eos_token_id = self.metadata['eos_token_id']
+        self._rng = np.random.default_rng()
+
+    def _empty_past(self, batch_size):
+        shape = (batch_size, self.metadata['num_heads'], 0, self.metadata['head_dim'])
+        past = {}
+        for layer in range(self.metadata['num_layers']):
+            past[f'past_key_{layer}'] = np.zeros(shape, dtype=np.float32)
+            past[f'past_value_{layer}'] = np.zeros(shape, dtype=np.float32)
+        return past
+
+    def _next_tokens(self, logits, do_sample=False, temperature=1.0, **_):
+        if not do_sample:
+            return logits.argmax(axis=-1)
+        scaled = logits / max(temperature, 1e-5)
+        scaled -= scaled.max(axis=-1, keepdims=True)
+        probs = np.exp(scaled)
+        probs /= probs.sum(axis=-1, keepdims=True)
+        return np.array([self._rng.choice(len(p), p=p) for p in probs])
+
+    def _decode_steps(self, prompts, max_new_tokens=150, deadline=None, stop_at_sentence_end=False,
+                      min_new_tokens=0, **generation):
+        """Yield the next token of every row until all rows stop, the token budget or the deadline"""
+        from .decoding import DEADLINE_MARGIN_SECONDS, sentence_end_token_ids
+
+        stop_ids = None
+        if stop_at_sentence_end:
+            stop_ids = np.array(sorted(sentence_end_token_ids(self.tokenizer)))
+        if deadline is not None:
+            deadline -= DEADLINE_MARGIN_SECONDS
+
+        self.tokenizer.padding_side = 'left'
+        encoded = self.tokenizer(prompts, return_tensors='np', padding=True)
+        input_ids = encoded['input_ids'].astype(np.int64)
+        attention_mask = encoded['attention_mask'].astype(np.int64)
+        batch_size = input_ids.shape[0]
+
+        past = self._empty_past(batch_size)
+        finished = np.zeros(batch_size, dtype=bool)
+        output_names = [o.name for o in self.session.get_outputs()]
+
+        for step in range(max_new_tokens):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+            position_ids = np.clip(attention_mask.cumsum(axis=1) - 1, 0, None)[:, -input_ids.shape[1]:]
+            outputs = self.session.run(None, {
+                'input_ids': input_ids,
+                'attention_mask': attention_mask,
+                'position_ids': position_ids,
+                **past,
+            })
+            results = dict(zip(output_names, outputs))
+
+            next_tokens = self._next_tokens(results['logits'][:, -1, :], **generation)
+            next_tokens = np.where(finished, self.eos_token_id, next_tokens)
+            finished |= next_tokens == self.eos_token_id
+            yield next_tokens, finished
+
+            # Sentence ends are yielded first so the stopping token stays in the output
+            if stop_ids is not None and step + 1 >= min_new_tokens:
+                ended = np.isin(next_tokens, stop_ids)
+                next_tokens = np.where(ended, self.eos_token_id, next_tokens)
+                finished |= ended
+
+            if finished.all():
+                break
+
+            # Only the new token is fed back; attention state lives in the past tensors
+            past = {
+                name.replace('present', 'past'): value
+                for name, value in results.items() if name.startswith('present')
+            }
+            input_ids = next_tokens[:, None].astype(np.int64)
+            attention_mask = np.concatenate(
+                [attention_mask, np.ones((batch_size, 1), dtype=np.int64)], axis=1
+            )
+
+    def generate(self, prompts, **generation):
+        generated = [[] for _ in prompts]
+
+        # Finished rows keep receiving EOS, so skipping EOS drops their padding
+        for next_tokens, _ in self._decode_steps(prompts, **generation):
+            for row, token in enumerate(next_tokens):
+                if token != self.eos_token_id:
+                    generated[row].append(int(token))
+
+        return [
+            self.tokenizer.decode(tokens, skip_special_tokens=True).strip()
+            for tokens in generated
+        ]
+
+    def stream(self, prompt, **generation):
+        tokens = []
+        emitted = ''
+        for next_tokens, finished in self._decode_steps([prompt], **generation):
+            if finished[0]:
+                break
+            tokens.append(int(next_tokens[0]))
+            text = self.tokenizer.decode(tokens, skip_special_tokens=True)
+            # Hold back incomplete multi-byte characters until they decode cleanly
+            if text.endswith('�'):
+                continue
+            if len(text) > len(emitted):
+                yield text[len(emitted):]
+                emitted = text
+
+    def memory_mb(self):
+        return os.path.getsize(self.model_path) / (1024 * 1024)
+
+
+class StubBackend(InferenceBackend):
+    """Deterministic stand-in that never loads a model, for tests and local development"""
+
+    name = 'stub'
+
+    def generate(self, prompts, deadline=None, stop_at_sentence_end=False, min_new_tokens=0, **generation):
+        return [self._respond(prompt, generation.get('max_new_tokens', 150)) for prompt in prompts]
+
+    def stream(self, prompt, deadline=None, stop_at_sentence_end=False, min_new_tokens=0, **generation):
+        for word in self._respond(prompt, generation.get('max_new_tokens', 150)).split(' '):
+            yield word + ' '
+
+    def _respond(self, prompt, max_new_tokens):
+        words = f"Stub analysis of: {prompt}".split()
+        return ' '.join(words[:max_new_tokens])
+
+
+def create_backend(name, model_name, cache_dir, precision, onnx_dir=None, num_threads=0, mmap_dir=None):
+    """Instantiate the configured inference backend"""
+    name = (name or 'torch').lower()
+
+    if name == 'torch':
+        if mmap_dir:
+            if safetensors_files(mmap_dir):
+                try:
+                    return TorchBackend.from_mmap(mmap_dir, precision)
+                except ValueError as e:
+                    print(f"Warning: {e}; loading weights into private memory")
+            else:
+                print(f"Warning: no safetensors weights in {mmap_dir}, loading weights into private memory")
+        return TorchBackend.from_pretrained(model_name, cache_dir, precision)
+    if name == 'onnx':
+        return OnnxRuntimeBackend(onnx_dir, num_threads=num_threads)
+    if name == 'stub':
+        return StubBackend()
+
+    raise ValueError(f"Unknown LLM backend: {name}")
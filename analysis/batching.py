@@ -0,0 +1,165 @@
+"""
+Dynamic micro-batching for LLM inference
+"""
+
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from .decoding import DEADLINE_MARGIN_SECONDS
+
+BatchItem = namedtuple('BatchItem', 'prompt profile generation deadline future queued_at')
+
+# Generated text and whether the batch was stopped by a deadline before it finished
+Generated = namedtuple('Generated', 'text cut_short')
+
+# Requests whose deadlines are further apart than this are not batched together,
+# so one tight budget does not cut short a batch of relaxed ones
+DEADLINE_SPREAD_SECONDS = 0.5
+
+
+class InferenceBatcher:
+    """Gathers concurrent prompts and runs them through a single batched generate"""
+
+    def __init__(self, backend, max_batch_size=8, max_wait_ms=10):
+        self.backend = backend
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._expired = 0
+        self._queue_wait_total = 0.0
+        self._generate_time_total = 0.0
+        self._batch_sizes = {}
+
+    def submit(self, prompt, profile='default', generation=None, deadline=None):
+        """Queue a prompt and block until its generated continuation is ready
+
+        Returns a Generated(text, cut_short); ``cut_short`` is set when the
+        batch it ran in was stopped by the earliest deadline in it, which may
+        be another request's. Prompts are only batched with others using the
+        same decoding ``profile`` and a similar deadline. Past the
+        time.monotonic() ``deadline`` the call raises TimeoutError and the
+        queued prompt is dropped.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put(BatchItem(prompt, profile, generation or {}, deadline, future, time.monotonic()))
+
+        timeout = None
+        if deadline is not None:
+            timeout = max(0.0, deadline - time.monotonic()) + DEADLINE_MARGIN_SECONDS
+        return future.result(timeout=timeout)
+
+    def stats(self):
+        """Return batch fill and latency counters"""
+        with self._stats_lock:
+            batches = self._batches
+            avg_batch = self._requests / batches if batches else 0.0
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': batches,
+                'requests': self._requests,
+                'expired': self._expired,
+                'avg_batch_size': round(avg_batch, 2),
+                'fill_rate': round(avg_batch / self.max_batch_size, 3) if batches else 0.0,
+                'avg_queue_wait_ms': round(self._queue_wait_total / self._requests * 1000, 2) if self._requests else 0.0,
+                'avg_generate_ms': round(self._generate_time_total / batches * 1000, 2) if batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'queue_depth': self._queue.qsize(),
+            }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='llm-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._process(batch)
+
+    def _process(self, batch):
+        now = time.monotonic()
+        groups = {}
+        for item in batch:
+            if item.deadline is not None and item.deadline <= now:
+                # The caller has already fallen back; skip the wasted work
+                item.future.set_exception(TimeoutError("Inference deadline passed while queued"))
+                with self._stats_lock:
+                    self._expired += 1
+                continue
+            groups.setdefault(item.profile, []).append(item)
+
+        for items in groups.values():
+            for group in self._split_by_deadline(items):
+                self._run_group(group)
+
+    def _split_by_deadline(self, items):
+        """Split items into runs whose deadlines lie within DEADLINE_SPREAD_SECONDS of each other"""
+        unbounded = [item for item in items if item.deadline is None]
+        bounded = sorted((item for item in items if item.deadline is not None), key=lambda item: item.deadline)
+        groups = []
+        for item in bounded:
+            if groups and item.deadline - groups[-1][0].deadline <= DEADLINE_SPREAD_SECONDS:
+                groups[-1].append(item)
+            else:
+                groups.append([item])
+        # Requests without a deadline ride along with the most relaxed group
+        if unbounded:
+            if groups:
+                groups[-1].extend(unbounded)
+            else:
+                groups.append(unbounded)
+        return groups
+
+    def _run_group(self, items):
+        deadlines = [item.deadline for item in items if item.deadline is not None]
+        deadline = min(deadlines) if deadlines else None
+        started = time.monotonic()
+
+        try:
+            outputs = self.backend.generate(
+                [item.prompt for item in items],
+                deadline=deadline,
+                **items[0].generation
+            )
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            return
+
+        finished = time.monotonic()
+        # The backend stops every row together, so a deadline stop cuts short the whole batch
+        cut_short = deadline is not None and finished >= deadline - DEADLINE_MARGIN_SECONDS
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(items)
+            self._queue_wait_total += sum(started - item.queued_at for item in items)
+            self._generate_time_total += finished - started
+            self._batch_sizes[len(items)] = self._batch_sizes.get(len(items), 0) + 1
+
+        for item, text in zip(items, outputs):
+            item.future.set_result(Generated(text, cut_short))
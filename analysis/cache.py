@@ -0,0 +1,181 @@
+"""
+Two-tier (memory LRU + SQLite) result cache
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TieredCache:
+    """In-memory LRU with TTL, backed by an SQLite store that survives restarts"""
+
+    def __init__(self, name, path=None, max_entries=1024, ttl_seconds=86400, max_disk_entries=100000):
+        self.name = name
+        self.path = str(path) if path else None
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'expired': 0,
+        }
+
+        if self.path:
+            try:
+                self._db = self._open_db()
+            except sqlite3.Error as e:
+                print(f"Warning: {name} cache disk tier unavailable, using memory only: {e}")
+
+    def _open_db(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        db = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL)'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+        return db
+
+    def reopen(self):
+        """Replace the SQLite connection and lock inherited from a parent process
+
+        An SQLite handle must not be used on both sides of a fork, so the
+        child drops the inherited one without closing it.
+        """
+        self._lock = threading.Lock()
+        self._db = None
+        if self.path:
+            try:
+                self._db = self._open_db()
+            except sqlite3.Error as e:
+                print(f"Warning: {self.name} cache disk tier unavailable, using memory only: {e}")
+
+    def get(self, key):
+        """Return the cached value or None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+                self._counters['expired'] += 1
+
+            value = self._disk_get(key, now)
+            if value is None:
+                self._counters['misses'] += 1
+                return None
+
+            self._counters['disk_hits'] += 1
+            self._memory_set(key, value, now + self.ttl)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        """Store a JSON-serializable value in both tiers, for ``ttl_seconds`` if given"""
+        expires_at = time.time() + (self.ttl if ttl_seconds is None else ttl_seconds)
+
+        with self._lock:
+            self._counters['sets'] += 1
+            self._memory_set(key, value, expires_at)
+            self._disk_set(key, value, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM entries')
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+            counters['hit_ratio'] = round(
+                (counters['memory_hits'] + counters['disk_hits']) / lookups, 3
+            ) if lookups else 0.0
+            counters['memory_entries'] = len(self._memory)
+            counters['max_entries'] = self.max_entries
+            counters['disk_enabled'] = self._db is not None
+            return counters
+
+    def _memory_set(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                'SELECT value, expires_at FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._counters['expired'] += 1
+                return None
+            self._db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Warning: {self.name} cache read failed: {e}")
+            return None
+
+    def _disk_set(self, key, value, expires_at):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), expires_at, time.time())
+            )
+            self._prune_disk()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Warning: {self.name} cache write failed: {e}")
+
+    def _prune_disk(self):
+        # Counting rows is a table scan, so only check the bound periodically
+        if not self.max_disk_entries or self._counters['sets'] % 100:
+            return
+        count = self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        if count <= self.max_disk_entries:
+            return
+        self._db.execute('DELETE FROM entries WHERE expires_at <= ?', (time.time(),))
+        self._db.execute(
+            'DELETE FROM entries WHERE key IN ('
+            ' SELECT key FROM entries ORDER BY accessed_at ASC LIMIT ?)',
+            (max(0, count - self.max_disk_entries),)
+        )
+
+
+def stable_hash(data):
+    """Return a short, order-stable SHA-256 digest of JSON-serializable data"""
+    encoded = json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
@@ -0,0 +1,92 @@
+"""
+Named decoding profiles and stopping rules for bounded-latency generation
+"""
+
+import time
+
+from transformers import StoppingCriteria
+
+DECODING_PROFILES = {
+    # Greedy, short and stopped at the first sentence end after a minimum length
+    'fast': {
+        'generation': {'max_new_tokens': 80, 'do_sample': False},
+        'stop_at_sentence_end': True,
+        'min_new_tokens': 16,
+        'budget_ms': 3000,
+    },
+    # The original sampling behaviour
+    'rich': {
+        'generation': {'max_new_tokens': 150, 'temperature': 0.7, 'do_sample': True},
+        'stop_at_sentence_end': False,
+        'min_new_tokens': 0,
+        'budget_ms': 10000,
+    },
+}
+
+# Time kept back from the deadline to decode and merge the response
+DEADLINE_MARGIN_SECONDS = 0.05
+
+SENTENCE_END_CHARS = ('.', '!', '?', '\n')
+
+_sentence_end_ids = {}
+
+
+def get_profile(name):
+    """Return a decoding profile, falling back to 'fast' for unknown names"""
+    return DECODING_PROFILES.get(name) or DECODING_PROFILES['fast']
+
+
+def deadline_from_budget(budget_ms):
+    """Turn a latency budget into an absolute time.monotonic() deadline"""
+    return time.monotonic() + budget_ms / 1000.0
+
+
+def sentence_end_token_ids(tokenizer):
+    """Ids of vocabulary tokens that end a sentence or section, computed once per tokenizer
+
+    Decodes the whole vocabulary, so HuggingFaceLLM calls it while loading the model.
+    """
+    key = id(tokenizer)
+    if key not in _sentence_end_ids:
+        # EOS counts as an end so rows that finished early do not hold up the batch
+        ids = {tokenizer.eos_token_id}
+        for token_id in range(len(tokenizer)):
+            text = tokenizer.decode([token_id])
+            if text.rstrip(' ').endswith(SENTENCE_END_CHARS):
+                ids.add(token_id)
+        _sentence_end_ids[key] = frozenset(ids)
+    return _sentence_end_ids[key]
+
+
+class DeadlineCriteria(StoppingCriteria):
+    """Stop generating once the wall-clock deadline is about to pass"""
+
+    def __init__(self, deadline):
+        self.deadline = deadline - DEADLINE_MARGIN_SECONDS
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return time.monotonic() >= self.deadline
+
+
+class SentenceEndCriteria(StoppingCriteria):
+    """Stop once every row has ended a sentence after min_new_tokens
+
+    Records where each row stopped so finished rows can be cut there while
+    the rest of the batch keeps generating.
+    """
+
+    def __init__(self, stop_ids, prompt_length, batch_size, min_new_tokens=0):
+        self.stop_ids = stop_ids
+        self.prompt_length = prompt_length
+        self.min_new_tokens = min_new_tokens
+        self.stopped_at = [None] * batch_size
+
+    def __call__(self, input_ids, scores, **kwargs):
+        length = input_ids.shape[1]
+        if length - self.prompt_length < self.min_new_tokens:
+            return False
+
+        for row, token_id in enumerate(input_ids[:, -1].tolist()):
+            if self.stopped_at[row] is None and token_id in self.stop_ids:
+                self.stopped_at[row] = length
+        return all(stop is not None for stop in self.stopped_at)
@@ -0,0 +1,197 @@
+"""
+Single-pass medication mention extraction (Aho-Corasick automaton)
+"""
+
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+Mention = namedtuple('Mention', 'canonical start end text dosage')
+
+DOSAGE_PATTERN = re.compile(
+    r'[\s,:(-]*(\d+(?:[.,]\d+)?\s*'
+    r'(?:mg|mcg|µg|ug|g|ml|iu|units?|milligrams?|micrograms?|grams?|millilitres?|milliliters?)\b'
+    r'(?:\s*/\s*(?:ml|dose|tab(?:let)?))?)',
+    re.IGNORECASE
+)
+
+CHAR_BITS = 21  # Enough for any Unicode code point
+
+
+def dosage_after(text, end):
+    """Dosage written right after position ``end`` of ``text``, or ''"""
+    match = DOSAGE_PATTERN.match(text, end)
+    return ' '.join(match.group(1).split()) if match else ''
+
+
+def scan_text(text):
+    """Lowercase ``text``, turn separators into single spaces and keep the original offsets
+
+    Matches the cleaning applied to vocabulary surface forms, so a pattern
+    like "potassium chloride" also matches "Potassium  Chloride,".
+    """
+    chars = []
+    offsets = []
+    previous_space = True
+    for position, ch in enumerate(text):
+        if ch.isalnum() or ch == '-':
+            lowered = ch.lower()
+            chars.append(lowered if len(lowered) == 1 else ch)
+            offsets.append(position)
+            previous_space = False
+        elif not previous_space:
+            chars.append(' ')
+            offsets.append(position)
+            previous_space = True
+    return ''.join(chars), offsets
+
+
+class MedicationExtractor:
+    """Finds every known drug name or synonym in a text in one pass
+
+    All surface forms are compiled into one Aho-Corasick automaton, so a scan
+    costs time proportional to the text (plus matches found) no matter how
+    many names are known. Overlapping hits are resolved leftmost-longest and
+    only whole-word hits count.
+    """
+
+    def __init__(self, terms, source_version=None):
+        self.source_version = source_version
+        self._goto = {}  # (node << CHAR_BITS) | ord(char) -> child node
+        self._parent = array('l', [0])
+        self._char = array('l', [0])
+        self._depth = array('l', [0])
+        self._output = array('l', [-1])  # pattern id ending at the node
+        self._patterns = []
+        self._canonical = []
+
+        for form, canonical in terms:
+            if form:
+                self._insert(form, canonical)
+        self._build_links()
+
+    @classmethod
+    def from_normalizer(cls, normalizer):
+        version = normalizer.version  # read first so a concurrent edit triggers another rebuild
+        return cls(normalizer.surface_forms(), source_version=version)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def _insert(self, form, canonical):
+        node = 0
+        for ch in form:
+            key = (node << CHAR_BITS) | ord(ch)
+            child = self._goto.get(key)
+            if child is None:
+                child = len(self._parent)
+                self._goto[key] = child
+                self._parent.append(node)
+                self._char.append(ord(ch))
+                self._depth.append(self._depth[node] + 1)
+                self._output.append(-1)
+            node = child
+        if self._output[node] < 0:
+            self._output[node] = len(self._patterns)
+            self._patterns.append(form)
+            self._canonical.append(canonical)
+
+    def _build_links(self):
+        node_count = len(self._parent)
+        self._fail = array('l', [0]) * node_count
+        self._dict_link = array('l', [-1]) * node_count  # nearest proper suffix node with an output
+        goto = self._goto
+
+        # Parents before children: process nodes in order of depth
+        for node in sorted(range(1, node_count), key=self._depth.__getitem__):
+            parent = self._parent[node]
+            if parent:
+                ch = self._char[node]
+                state = self._fail[parent]
+                while state and ((state << CHAR_BITS) | ch) not in goto:
+                    state = self._fail[state]
+                self._fail[node] = goto.get((state << CHAR_BITS) | ch, 0)
+            fail = self._fail[node]
+            self._dict_link[node] = fail if self._output[fail] >= 0 else self._dict_link[fail]
+
+    def _raw_hits(self, scanned):
+        """(start, end, pattern id) for every whole-word pattern occurrence in scanned text"""
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        patterns = self._patterns
+        length = len(scanned)
+        hits = []
+        state = 0
+        for position, ch in enumerate(scanned):
+            code = ord(ch)
+            while state and ((state << CHAR_BITS) | code) not in goto:
+                state = fail[state]
+            state = goto.get((state << CHAR_BITS) | code, 0)
+
+            end = position + 1
+            if end < length and scanned[end] != ' ':
+                continue  # not at a word end
+            node = state if output[state] >= 0 else dict_link[state]
+            while node > 0:
+                pattern_id = output[node]
+                start = end - len(patterns[pattern_id])
+                if start == 0 or scanned[start - 1] == ' ':
+                    hits.append((start, end, pattern_id))
+                node = dict_link[node]
+        return hits
+
+    def find(self, text):
+        """Return a Mention for every drug named in ``text``, with original offsets and dosage"""
+        scanned, offsets = scan_text(text)
+        hits = self._raw_hits(scanned)
+
+        # Leftmost-longest, non-overlapping
+        hits.sort(key=lambda hit: (hit[0], hit[0] - hit[1]))
+        mentions = []
+        covered_until = 0
+        for start, end, pattern_id in hits:
+            if start < covered_until:
+                continue
+            covered_until = end
+            original_start = offsets[start]
+            original_end = offsets[end - 1] + 1
+            mentions.append(Mention(
+                self._canonical[pattern_id],
+                original_start,
+                original_end,
+                text[original_start:original_end],
+                dosage_after(text, original_end)
+            ))
+        return mentions
+
+    def stats(self):
+        return {
+            'patterns': len(self._patterns),
+            'nodes': len(self._parent),
+            'source_version': self.source_version,
+        }
+
+
+def span_covered(mentions, starts, start, end):
+    """Whether [start, end) overlaps any of the mentions, given their sorted start offsets"""
+    index = bisect_right(starts, start) - 1
+    if index >= 0 and mentions[index].end > start:
+        return True
+    return index + 1 < len(mentions) and mentions[index + 1].start < end
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_extractor():
+    """Return the process-wide extractor, rebuilt whenever the name normalizer changes"""
+    global _extractor
+    from .normalization import get_normalizer
+    normalizer = get_normalizer()
+    if _extractor is None or _extractor.source_version != normalizer.version:
+        with _extractor_lock:
+            if _extractor is None or _extractor.source_version != normalizer.version:
+                _extractor = MedicationExtractor.from_normalizer(normalizer)
+    return _extractor
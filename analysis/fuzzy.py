@@ -0,0 +1,201 @@
+"""
+Approximate drug-name matching for OCR output (symmetric-deletion index)
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+Match = namedtuple('Match', 'surface term canonical distance confidence flagged')
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9][a-z0-9-]*[a-z0-9]')
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal-string-alignment distance, or max_distance + 1 once it is exceeded
+
+    Only the diagonal band of width 2 * max_distance + 1 is filled, since
+    cells outside it cannot lead to a distance within the bound.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if a == b:
+        return 0
+
+    too_far = max_distance + 1
+    length_b = len(b)
+    previous_previous = None
+    previous = [j if j <= max_distance else too_far for j in range(length_b + 1)]
+    for i in range(1, len(a) + 1):
+        char_a = a[i - 1]
+        current = [too_far] * (length_b + 1)
+        if i <= max_distance:
+            current[0] = i
+        row_min = current[0]
+        for j in range(max(1, i - max_distance), min(length_b, i + max_distance) + 1):
+            char_b = b[j - 1]
+            value = previous[j - 1] if char_a == char_b else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if (previous_previous is not None and j > 1 and char_a == b[j - 2]
+                    and a[i - 2] == char_b and previous_previous[j - 2] + 1 < value):
+                value = previous_previous[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return too_far
+        previous_previous, previous = previous, current
+    return min(previous[-1], too_far)
+
+
+def deletes_by_level(term, max_distance):
+    """Strings reachable from ``term`` by exactly 0..max_distance deletions, one set per level"""
+    levels = [{term}]
+    seen = {term}
+    for _ in range(max_distance):
+        next_level = set()
+        for word in levels[-1]:
+            if len(word) <= 1:
+                continue
+            for i in range(len(word)):
+                next_level.add(word[:i] + word[i + 1:])
+        next_level -= seen
+        seen |= next_level
+        levels.append(next_level)
+    return levels
+
+
+def deletes(term, max_distance):
+    """Every string reachable from ``term`` by up to max_distance deletions"""
+    return set().union(*deletes_by_level(term, max_distance))
+
+
+class FuzzyDrugMatcher:
+    """Best canonical match for a garbled drug name within a bounded edit distance
+
+    Deletions of every known term's prefix are precomputed, so a lookup only
+    generates deletions of the query and verifies the few terms that share one.
+    Matches whose confidence falls below ``min_confidence`` are returned with
+    ``flagged=True`` rather than silently accepted.
+    """
+
+    def __init__(self, terms, max_distance=2, prefix_length=10, min_confidence=0.75, source_version=None):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_confidence = min_confidence
+        self.source_version = source_version
+        self._terms = []
+        self._canonical = []
+        self._exact = {}
+        self._deletes = {}
+
+        for term, canonical in terms:
+            if not term or term in self._exact:
+                continue
+            term_id = len(self._terms)
+            self._terms.append(term)
+            self._canonical.append(canonical)
+            self._exact[term] = term_id
+            for variant in deletes(term[:prefix_length], max_distance):
+                self._deletes.setdefault(variant, []).append(term_id)
+
+    @classmethod
+    def from_normalizer(cls, normalizer, **kwargs):
+        version = normalizer.version  # read first so a concurrent edit triggers another rebuild
+        return cls(normalizer.surface_forms(), source_version=version, **kwargs)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def confidence(self, query, term, distance):
+        return 1.0 - distance / max(len(query), len(term))
+
+    def lookup(self, surface):
+        """Return the closest known term as a Match, or None beyond max_distance"""
+        query = surface.lower().strip()
+        if not query:
+            return None
+
+        term_id = self._exact.get(query)
+        if term_id is not None:
+            return Match(surface, query, self._canonical[term_id], 0, 1.0, False)
+
+        best = None
+        seen = set()
+        # Walk query deletions level by level so a close match bounds the rest of the search
+        for level, variants in enumerate(deletes_by_level(query[:self.prefix_length], self.max_distance)):
+            if best is not None and level > best[0]:
+                break
+            for variant in variants:
+                for term_id in self._deletes.get(variant, ()):
+                    if term_id in seen:
+                        continue
+                    seen.add(term_id)
+                    term = self._terms[term_id]
+                    limit = self.max_distance if best is None else best[0]
+                    # The term needed at least this many deletions to reach the variant
+                    if min(len(term), self.prefix_length) - len(variant) > limit:
+                        continue
+                    distance = edit_distance(query, term, limit)
+                    if distance > limit:
+                        continue
+                    # Ties go to the term closer in length, then the shorter one
+                    rank = (distance, abs(len(term) - len(query)), len(term))
+                    if best is None or rank < best[:3]:
+                        best = (*rank, term_id)
+
+        if best is None:
+            return None
+
+        distance, term_id = best[0], best[3]
+        term = self._terms[term_id]
+        confidence = self.confidence(query, term, distance)
+        return Match(surface, term, self._canonical[term_id], distance, confidence,
+                     confidence < self.min_confidence)
+
+    def match_text(self, text, min_token_length=4):
+        """Match every word-like token of an OCR page, keeping the best match per canonical drug"""
+        found = {}
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            if len(token) < min_token_length or token.isdigit():
+                continue
+            match = self.lookup(token)
+            if match is None:
+                continue
+            current = found.get(match.canonical)
+            if current is None or match.confidence > current.confidence:
+                found[match.canonical] = match
+        return list(found.values())
+
+    def stats(self):
+        return {
+            'terms': len(self._terms),
+            'delete_keys': len(self._deletes),
+            'max_distance': self.max_distance,
+            'min_confidence': self.min_confidence,
+            'source_version': self.source_version,
+        }
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def get_fuzzy_matcher():
+    """Return the process-wide matcher, rebuilt whenever the name normalizer changes"""
+    global _matcher
+    from .normalization import get_normalizer
+    normalizer = get_normalizer()
+    if _matcher is None or _matcher.source_version != normalizer.version:
+        with _matcher_lock:
+            if _matcher is None or _matcher.source_version != normalizer.version:
+                from django.conf import settings
+                _matcher = FuzzyDrugMatcher.from_normalizer(
+                    normalizer,
+                    max_distance=getattr(settings, 'OCR_MATCH_MAX_DISTANCE', 2),
+                    min_confidence=getattr(settings, 'OCR_MATCH_MIN_CONFIDENCE', 0.75)
+                )
+    return _matcher
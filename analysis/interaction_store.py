@@ -0,0 +1,414 @@
+"""
+Memory-mapped binary drug interaction database
+
+Layout (little-endian), each section 8-byte aligned:
+
+    header          magic, format version, counts, section offsets and the
+                    version of the source data it was built from
+    name offsets    uint32[drug_count + 1] into the name blob
+    name blob       UTF-8 drug names sorted by bytes; the position is the drug id
+    pair keys       uint64[pair_count] sorted, (low id << 32) | high id
+    severities      uint8[pair_count]
+    message ids     uint32[pair_count] into the message table
+    message offsets uint32[message_count + 1] into the message blob
+    message blob    UTF-8 interaction messages, deduplicated
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from .interactions import (
+    BUILTIN_VERSION, DEFAULT_INTERACTIONS, Finding, Interaction, InteractionIndex, Severity,
+    normalize_name, read_interaction_source,
+)
+
+MAGIC = b'MEDAIIX1'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sIIII7Q16s')
+
+
+def _aligned(position):
+    return (position + 7) & ~7
+
+
+def _packed(typecode, values):
+    packed = array(typecode, values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _string_table(strings):
+    offsets = [0]
+    blob = bytearray()
+    for value in strings:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    return _packed('I', offsets), bytes(blob)
+
+
+def build_interaction_store(index, path):
+    """Write an InteractionIndex to ``path`` in the binary layout, replacing it atomically"""
+    names = sorted(index.drug_names(), key=lambda name: name.encode('utf-8'))
+    ids = {name: drug_id for drug_id, name in enumerate(names)}
+
+    message_ids = {}
+    records = []
+    for drug_a, drug_b, interaction in index.items():
+        key = InteractionIndex.pair_key(ids[drug_a], ids[drug_b])
+        message_id = message_ids.setdefault(interaction.message, len(message_ids))
+        records.append((key, int(interaction.severity), message_id))
+    records.sort()
+
+    name_offsets, name_blob = _string_table(names)
+    message_offsets, message_blob = _string_table(message_ids)
+    sections = [
+        name_offsets,
+        name_blob,
+        _packed('Q', [record[0] for record in records]),
+        bytes(record[1] for record in records),
+        _packed('I', [record[2] for record in records]),
+        message_offsets,
+        message_blob,
+    ]
+
+    positions = []
+    position = _aligned(HEADER.size)
+    for section in sections:
+        positions.append(position)
+        position = _aligned(position + len(section))
+
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, len(names), len(records), len(message_ids), *positions,
+        index.version.encode('ascii')
+    )
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        for section, section_position in zip(sections, positions):
+            f.write(b'\0' * (section_position - f.tell()))
+            f.write(section)
+    os.replace(temp_path, path)
+
+    return {
+        'drugs': len(names),
+        'pairs': len(records),
+        'messages': len(message_ids),
+        'bytes': os.path.getsize(path),
+    }
+
+
+class MappedInteractionStore:
+    """Read-only interaction index served straight from a memory-mapped file
+
+    Opening only reads the header, so startup cost does not depend on the
+    dataset size and every process mapping the file shares its pages. Drug
+    names are found by binary search over the sorted name table and pairs by
+    binary search over the sorted key array.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("Binary interaction store requires a little-endian host")
+
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            (magic, version, self._drug_count, self._pair_count, message_count,
+             name_offsets, names, keys, severities, message_ids, message_offsets, messages, data_version
+             ) = HEADER.unpack_from(self._mmap, 0)
+        except struct.error:
+            self._mmap.close()
+            raise ValueError(f"{path} is not an interaction store")
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} interaction store")
+        self.version = data_version.rstrip(b'\0').decode('ascii')
+
+        view = memoryview(self._mmap)
+        self._views = [view]
+
+        def section(start, count, fmt, size):
+            part = view[start:start + count * size].cast(fmt)
+            self._views.append(part)
+            return part
+
+        self._name_offsets = section(name_offsets, self._drug_count + 1, 'I', 4)
+        self._names_start = names
+        self._keys = section(keys, self._pair_count, 'Q', 8)
+        self._severities = section(severities, self._pair_count, 'B', 1)
+        self._message_ids = section(message_ids, self._pair_count, 'I', 4)
+        self._message_offsets = section(message_offsets, message_count + 1, 'I', 4)
+        self._messages_start = messages
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __len__(self):
+        return self._pair_count
+
+    def __contains__(self, name):
+        return self.drug_id(name) is not None
+
+    @property
+    def drug_count(self):
+        return self._drug_count
+
+    def _name_bytes(self, drug_id):
+        start = self._names_start + self._name_offsets[drug_id]
+        return self._mmap[start:self._names_start + self._name_offsets[drug_id + 1]]
+
+    def drug_id(self, name):
+        target = normalize_name(name).encode('utf-8')
+        low, high = 0, self._drug_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._name_bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._drug_count and self._name_bytes(low) == target:
+            return low
+        return None
+
+    def drug_name(self, drug_id):
+        return self._name_bytes(drug_id).decode('utf-8')
+
+    def drug_names(self):
+        return [self.drug_name(drug_id) for drug_id in range(self._drug_count)]
+
+    def _message(self, message_id):
+        start = self._messages_start + self._message_offsets[message_id]
+        end = self._messages_start + self._message_offsets[message_id + 1]
+        return self._mmap[start:end].decode('utf-8')
+
+    def key_buffer(self):
+        """Sorted uint64 pair keys, shared with the mapped file"""
+        return self._keys
+
+    def severity_buffer(self):
+        """uint8 severities parallel to key_buffer()"""
+        return self._severities
+
+    def interaction_at(self, position):
+        return Interaction(Severity(self._severities[position]), self._message(self._message_ids[position]))
+
+    def _find_key(self, key):
+        position = bisect_left(self._keys, key)
+        if position < self._pair_count and self._keys[position] == key:
+            return position
+        return None
+
+    def lookup(self, drug_a, drug_b):
+        """Return the Interaction between two drug names, in either order"""
+        a = self.drug_id(drug_a)
+        b = self.drug_id(drug_b)
+        if a is None or b is None:
+            return None
+        position = self._find_key(InteractionIndex.pair_key(a, b))
+        return None if position is None else self.interaction_at(position)
+
+    def check(self, medications):
+        """Return a Finding for every interacting pair in a regimen"""
+        known = [(med, self.drug_id(med)) for med in medications]
+        known = [(med, drug_id) for med, drug_id in known if drug_id is not None]
+        findings = []
+
+        for i, (med_a, a) in enumerate(known):
+            for med_b, b in known[i + 1:]:
+                position = self._find_key(InteractionIndex.pair_key(a, b))
+                if position is not None:
+                    interaction = self.interaction_at(position)
+                    findings.append(Finding(med_a, med_b, interaction.severity, interaction.message))
+        return findings
+
+    def items(self):
+        """(drug_a, drug_b, Interaction) for every stored pair"""
+        for position in range(self._pair_count):
+            key = self._keys[position]
+            yield self.drug_name(key >> 32), self.drug_name(key & 0xFFFFFFFF), self.interaction_at(position)
+
+
+def open_interaction_index(db_path=None, source_path=None, strict=False):
+    """Memory-map the built interaction store, or compile the JSON source if none is usable
+
+    With ``strict`` an unreadable source raises instead of falling back to
+    the built-in interactions, so a reload never replaces real data with them.
+    """
+    if db_path is None or source_path is None:
+        from django.conf import settings
+        db_path = db_path or getattr(settings, 'DRUG_INTERACTIONS_DB', None)
+        source_path = source_path or getattr(settings, 'DRUG_INTERACTIONS_FILE', 'drug_interactions.json')
+
+    if db_path and os.path.exists(db_path):
+        if os.path.exists(source_path) and os.path.getmtime(source_path) > os.path.getmtime(db_path):
+            print(f"Warning: {db_path} is older than {source_path}; run `manage.py build_interaction_db`")
+        else:
+            try:
+                return MappedInteractionStore(db_path)
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not open interaction store {db_path}: {e}")
+
+    try:
+        data, version = read_interaction_source(source_path)
+    except (OSError, ValueError):
+        if strict:
+            raise
+        data, version = DEFAULT_INTERACTIONS, BUILTIN_VERSION
+    return InteractionIndex.from_mapping(data, version)
+
+
+class InteractionIndexWatcher:
+    """Background thread that polls the interaction files and reloads when they change
+
+    A file counts as changed when its size or modification time does. Each
+    changed state is tried once, so a file caught mid-write is picked up again
+    on the poll after the writer finishes.
+    """
+
+    def __init__(self, paths, interval, reload):
+        self.paths = [path for path in paths if path]
+        self.interval = interval
+        self.reload = reload
+        self._signature = self.signature()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def signature(self):
+        states = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                states.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                states.append(None)
+        return tuple(states)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='interaction-index-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def poll(self):
+        """Reload once if any watched file changed since the last poll"""
+        signature = self.signature()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return self.reload()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Warning: interaction data watcher failed: {e}")
+
+
+_index = None
+_index_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_watcher = None
+_reload_stats = {'reloads': 0, 'failed_reloads': 0, 'last_reload': None}
+
+
+def _start_watcher():
+    global _watcher
+    from django.conf import settings
+    interval = getattr(settings, 'DRUG_INTERACTIONS_RELOAD_INTERVAL', 0)
+    if interval > 0:
+        _watcher = InteractionIndexWatcher(
+            [getattr(settings, 'DRUG_INTERACTIONS_FILE', None), getattr(settings, 'DRUG_INTERACTIONS_DB', None)],
+            interval,
+            reload_interaction_index
+        )
+        _watcher.start()
+
+
+def restart_watcher():
+    """Replace the reload watcher inherited from a parent process
+
+    Threads do not survive fork: a child that inherits a loaded index gets
+    the parent's watcher object but not its polling thread.
+    """
+    global _watcher, _index_lock, _reload_lock
+    _index_lock = threading.Lock()
+    _reload_lock = threading.Lock()
+    if _watcher is not None:
+        _watcher = None
+        _start_watcher()
+
+
+def get_interaction_index():
+    """Return the process-wide interaction index
+
+    The returned index is immutable; callers that keep a reference finish
+    their work on that version even if a reload swaps in a newer one.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = open_interaction_index()
+                _start_watcher()
+    return _index
+
+
+def reload_interaction_index():
+    """Rebuild the index from its files in this thread and swap it in if the data changed
+
+    Returns True when a new version was installed. A source that cannot be
+    read or parsed leaves the current index in place.
+    """
+    global _index
+    with _reload_lock:
+        current = get_interaction_index()
+        try:
+            index = open_interaction_index(strict=True)
+        except (OSError, ValueError) as e:
+            _reload_stats['failed_reloads'] += 1
+            print(f"Warning: interaction data reload failed, keeping version {current.version}: {e}")
+            return False
+
+        if index.version == current.version:
+            if isinstance(index, MappedInteractionStore):
+                index.close()
+            return False
+
+        # A single reference assignment, so readers see either the old or the new index
+        _index = index
+        _reload_stats['reloads'] += 1
+        _reload_stats['last_reload'] = time.time()
+
+        from .normalization import extend_vocabulary
+        extend_vocabulary(index.drug_names())
+        return True
+
+
+def knowledge_base_stats():
+    """Version and size of the interaction data currently being served"""
+    index = get_interaction_index()
+    return {
+        'version': index.version,
+        'backend': 'mmap' if isinstance(index, MappedInteractionStore) else 'memory',
+        'drugs': index.drug_count,
+        'pairs': len(index),
+        'watching': _watcher is not None and _watcher.is_alive(),
+        **_reload_stats,
+    }
@@ -0,0 +1,215 @@
+"""
+Compiled, symmetric drug interaction index
+"""
+
+import hashlib
+import json
+import sys
+from collections import namedtuple
+from enum import IntEnum
+from types import MappingProxyType
+
+
+class Severity(IntEnum):
+    """Interaction severity, ordered so that higher is worse"""
+    UNKNOWN = 0
+    LOW = 1
+    MODERATE = 2
+    HIGH = 3
+
+
+Interaction = namedtuple('Interaction', 'severity message')
+
+Finding = namedtuple('Finding', 'drug_a drug_b severity message')
+
+# Used when the interactions file is missing or unreadable
+DEFAULT_INTERACTIONS = {
+    "aspirin": {
+        "warfarin": "HIGH RISK: Increased bleeding risk. Monitor INR closely.",
+        "ibuprofen": "MODERATE: Increased GI bleeding risk.",
+        "metformin": "LOW RISK: Generally safe combination."
+    },
+    "warfarin": {
+        "aspirin": "HIGH RISK: Increased bleeding risk. Monitor INR closely.",
+        "amoxicillin": "MODERATE: May increase warfarin effect.",
+        "vitamin_k": "MODERATE: May decrease warfarin effect."
+    },
+    "lisinopril": {
+        "potassium": "MODERATE: Risk of hyperkalemia.",
+        "aspirin": "LOW: May reduce antihypertensive effect.",
+        "metformin": "LOW RISK: Generally safe combination."
+    },
+    "metformin": {
+        "aspirin": "LOW RISK: Generally safe combination.",
+        "lisinopril": "LOW RISK: Generally safe combination.",
+        "alcohol": "MODERATE: Risk of lactic acidosis."
+    }
+}
+
+
+# Data version reported while serving DEFAULT_INTERACTIONS
+BUILTIN_VERSION = 'builtin'
+
+
+def content_version(raw):
+    """Short digest identifying one exact revision of the interaction data"""
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def read_interaction_source(path):
+    """Parse an interactions file into (data, version); raises OSError or ValueError
+
+    The version is taken from the same bytes that were parsed, so it always
+    describes the data actually loaded even if the file changes meanwhile.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return json.loads(raw), content_version(raw)
+
+
+def load_interaction_data(path=None):
+    """Load the nested {drug: {other_drug: message}} interactions file"""
+    if path is None:
+        from django.conf import settings
+        path = getattr(settings, 'DRUG_INTERACTIONS_FILE', 'drug_interactions.json')
+    try:
+        return read_interaction_source(path)[0]
+    except (OSError, ValueError):
+        return DEFAULT_INTERACTIONS
+
+
+def parse_severity(message):
+    """Read the severity label from an interaction message"""
+    text = message.upper()
+    for severity in (Severity.HIGH, Severity.MODERATE, Severity.LOW):
+        if severity.name in text:
+            return severity
+    return Severity.UNKNOWN
+
+
+def normalize_name(name):
+    """Lowercase and collapse whitespace in a drug name"""
+    return ' '.join(name.lower().split())
+
+
+class InteractionIndex:
+    """Immutable, order-independent index of drug-pair interactions
+
+    Drug names are interned to integer ids and each unordered pair is stored
+    once under a single integer key, so a pair check is one dict probe
+    regardless of the order the drugs were given in. ``version`` identifies
+    the source data it was compiled from.
+    """
+
+    __slots__ = ('_drug_ids', '_names', '_pairs', 'version')
+
+    def __init__(self, drug_ids, names, pairs, version=''):
+        self._drug_ids = MappingProxyType(drug_ids)
+        self._names = tuple(names)
+        self._pairs = MappingProxyType(pairs)
+        self.version = version
+
+    @classmethod
+    def from_mapping(cls, data, version=''):
+        """Compile a nested {drug: {other_drug: message}} mapping"""
+        return cls.from_pairs(
+            (
+                (drug, other, message, None)
+                for drug, interactions in data.items()
+                for other, message in interactions.items()
+            ),
+            version=version,
+        )
+
+    @classmethod
+    def from_pairs(cls, rows, version=''):
+        """Compile (drug_a, drug_b, message, severity) rows; a None severity is read from the message"""
+        drug_ids = {}
+        names = []
+        pairs = {}
+
+        def intern_drug(name):
+            name = sys.intern(normalize_name(name))
+            drug_id = drug_ids.get(name)
+            if drug_id is None:
+                drug_id = drug_ids[name] = len(names)
+                names.append(name)
+            return drug_id
+
+        for drug, other, message, severity in rows:
+            a = intern_drug(drug)
+            b = intern_drug(other)
+            if a == b:
+                continue
+            key = cls.pair_key(a, b)
+            interaction = Interaction(
+                parse_severity(message) if severity is None else Severity(severity), message
+            )
+            # Both directions may be listed; keep the more severe description
+            existing = pairs.get(key)
+            if existing is None or interaction.severity > existing.severity:
+                pairs[key] = interaction
+
+        return cls(drug_ids, names, pairs, version)
+
+    @classmethod
+    def from_file(cls, path):
+        data, version = read_interaction_source(path)
+        return cls.from_mapping(data, version)
+
+    @staticmethod
+    def pair_key(a, b):
+        """Canonical integer key for an unordered pair of drug ids"""
+        if a > b:
+            a, b = b, a
+        return (a << 32) | b
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def __contains__(self, name):
+        return normalize_name(name) in self._drug_ids
+
+    @property
+    def drug_count(self):
+        return len(self._names)
+
+    def drug_id(self, name):
+        return self._drug_ids.get(normalize_name(name))
+
+    def drug_name(self, drug_id):
+        return self._names[drug_id]
+
+    def drug_names(self):
+        return list(self._names)
+
+    def sorted_pairs(self):
+        """(pair key, Interaction) for every stored pair, in key order"""
+        return sorted(self._pairs.items())
+
+    def items(self):
+        """(drug_a, drug_b, Interaction) for every stored pair"""
+        for key, interaction in self._pairs.items():
+            yield self._names[key >> 32], self._names[key & 0xFFFFFFFF], interaction
+
+    def lookup(self, drug_a, drug_b):
+        """Return the Interaction between two drug names, in either order"""
+        a = self.drug_id(drug_a)
+        b = self.drug_id(drug_b)
+        if a is None or b is None:
+            return None
+        return self._pairs.get(self.pair_key(a, b))
+
+    def check(self, medications):
+        """Return a Finding for every interacting pair in a regimen"""
+        ids = [(med, self._drug_ids.get(normalize_name(med))) for med in medications]
+        known = [(med, drug_id) for med, drug_id in ids if drug_id is not None]
+        pairs = self._pairs
+        findings = []
+
+        for i, (med_a, a) in enumerate(known):
+            for med_b, b in known[i + 1:]:
+                interaction = pairs.get((a << 32) | b if a < b else (b << 32) | a)
+                if interaction is not None:
+                    findings.append(Finding(med_a, med_b, interaction.severity, interaction.message))
+        return findings
@@ -0,0 +1,57 @@
+"""
+Benchmark single-pass mention extraction as the drug vocabulary grows
+"""
+
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from analysis.extraction import MedicationExtractor
+
+
+def random_word(rng, low=5, high=14):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+class Command(BaseCommand):
+    help = 'Time mention extraction over a fixed text for vocabularies of 6 to 100k names'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vocabulary-sizes', type=int, nargs='+', default=[6, 100, 1000, 10000, 100000])
+        parser.add_argument('--words', type=int, default=20000, help='Words in the scanned text')
+        parser.add_argument('--mention-rate', type=float, default=0.05,
+                            help='Fraction of words that are known drug names')
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        filler = [random_word(rng, 3, 9) for _ in range(options['words'])]
+
+        self.stdout.write(
+            f"{'vocabulary':>11}{'build s':>9}{'nodes':>10}{'chars':>9}{'scan ms':>9}{'ns/char':>9}{'mentions':>10}"
+        )
+        for size in options['vocabulary_sizes']:
+            names = list({random_word(rng) for _ in range(size)})
+            started = time.perf_counter()
+            extractor = MedicationExtractor((name, name) for name in names)
+            build_s = time.perf_counter() - started
+
+            words = [
+                rng.choice(names) if rng.random() < options['mention_rate'] else word
+                for word in filler
+            ]
+            text = ' '.join(f"{word} {rng.randint(1, 500)} mg" if rng.random() < 0.1 else word for word in words)
+
+            extractor.find(text)  # warm-up
+            started = time.perf_counter()
+            for _ in range(options['runs']):
+                mentions = extractor.find(text)
+            scan_s = (time.perf_counter() - started) / options['runs']
+
+            self.stdout.write(
+                f"{len(names):>11}{build_s:>9.2f}{extractor.stats()['nodes']:>10}{len(text):>9}"
+                f"{scan_s * 1000:>9.1f}{scan_s / len(text) * 1e9:>9.0f}{len(mentions):>10}"
+            )
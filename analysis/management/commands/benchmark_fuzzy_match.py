@@ -0,0 +1,87 @@
+"""
+Benchmark the fuzzy drug-name matcher on a large synthetic vocabulary
+"""
+
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from analysis.fuzzy import FuzzyDrugMatcher, edit_distance
+
+SYLLABLES = ('ab', 'ac', 'al', 'am', 'an', 'ar', 'az', 'ba', 'ci', 'da', 'de', 'fen', 'flo', 'ga',
+             'lo', 'lol', 'ma', 'mi', 'mycin', 'na', 'nib', 'no', 'pam', 'pine', 'pril', 'ra',
+             'sar', 'stat', 'ta', 'tan', 'ti', 'tol', 'va', 'vir', 'xa', 'zo', 'zole')
+
+# Characters Tesseract commonly confuses
+OCR_CONFUSIONS = {'l': '1', 'i': 'l', 'o': '0', 'm': 'rn', 'rn': 'm', 'n': 'h', 'e': 'c', 's': '5', 'b': '6'}
+
+
+def synthetic_names(count, rng):
+    names = set()
+    while len(names) < count:
+        names.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 5))))
+    return sorted(names)
+
+
+def garble(name, rng, edits):
+    """Apply OCR-style confusions, falling back to random substitutions"""
+    for _ in range(edits):
+        candidates = [(key, value) for key, value in OCR_CONFUSIONS.items() if key in name]
+        if candidates:
+            key, value = rng.choice(candidates)
+            position = name.find(key)
+            name = name[:position] + value + name[position + len(key):]
+        else:
+            position = rng.randrange(len(name))
+            name = name[:position] + rng.choice(string.ascii_lowercase) + name[position + 1:]
+    return name
+
+
+class Command(BaseCommand):
+    help = 'Time fuzzy lookups of OCR-garbled names against a synthetic drug vocabulary'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--max-distance', type=int, default=2)
+        parser.add_argument('--brute-force-queries', type=int, default=20,
+                            help='Queries also answered by a linear scan for comparison (0 to skip)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names = synthetic_names(options['names'], rng)
+
+        started = time.perf_counter()
+        matcher = FuzzyDrugMatcher(((name, name) for name in names), max_distance=options['max_distance'])
+        build_s = time.perf_counter() - started
+        self.stdout.write(
+            f"Indexed {len(matcher)} names ({matcher.stats()['delete_keys']} delete keys) in {build_s:.1f}s"
+        )
+
+        self.stdout.write(f"{'edits':>6}{'lookup us':>11}{'correct':>9}{'matched':>9}{'flagged':>9}")
+        for edits in range(options['max_distance'] + 1):
+            targets = [rng.choice(names) for _ in range(options['queries'])]
+            queries = [garble(name, rng, edits) for name in targets]
+
+            started = time.perf_counter()
+            matches = [matcher.lookup(query) for query in queries]
+            lookup_us = (time.perf_counter() - started) / len(queries) * 1e6
+
+            matched = [match for match in matches if match is not None]
+            correct = sum(1 for match, target in zip(matches, targets) if match and match.canonical == target)
+            flagged = sum(1 for match in matched if match.flagged)
+            self.stdout.write(
+                f"{edits:>6}{lookup_us:>11.1f}{correct / len(queries):>9.1%}"
+                f"{len(matched) / len(queries):>9.1%}{flagged:>9}"
+            )
+
+        if options['brute_force_queries']:
+            queries = [garble(rng.choice(names), rng, 1) for _ in range(options['brute_force_queries'])]
+            started = time.perf_counter()
+            for query in queries:
+                min(names, key=lambda name: edit_distance(query, name, options['max_distance']))
+            scan_ms = (time.perf_counter() - started) / len(queries) * 1000
+            self.stdout.write(f"Linear scan for comparison: {scan_ms:.1f} ms per lookup")
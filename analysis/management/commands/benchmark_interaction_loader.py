@@ -0,0 +1,98 @@
+"""
+Compare startup time and memory of the JSON and memory-mapped interaction loaders
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analysis.interaction_store import build_interaction_store
+from analysis.interactions import InteractionIndex
+from analysis.management.commands.benchmark_interactions import synthetic_interactions
+
+
+class Command(BaseCommand):
+    help = 'Time loading a synthetic interaction dataset from JSON versus the mmap binary store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=300000)
+        parser.add_argument('--drugs', type=int, default=20000)
+        parser.add_argument('--checks', type=int, default=1000, help='10-drug regimens checked after loading')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--single', nargs=2, metavar=('LOADER', 'PATH'), help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['single']:
+            # Child process: load once in a clean interpreter and report JSON
+            loader, path = options['single']
+            self.stdout.write(json.dumps(self.run_loader(loader, path, options['checks'], options['seed'])))
+            return
+
+        rng = random.Random(options['seed'])
+        _, data = synthetic_interactions(options['pairs'], options['drugs'], rng)
+
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, 'interactions.json')
+            db_path = os.path.join(directory, 'interactions.bin')
+            with open(json_path, 'w') as f:
+                json.dump(data, f)
+            build_interaction_store(InteractionIndex.from_mapping(data), db_path)
+
+            self.stdout.write(
+                f"Dataset: {options['pairs']} pairs, JSON {os.path.getsize(json_path) / 1024 / 1024:.1f} MB, "
+                f"binary {os.path.getsize(db_path) / 1024 / 1024:.1f} MB"
+            )
+            self.stdout.write(f"{'loader':>8}{'load ms':>10}{'RSS +MB':>9}{'check us':>10}")
+            for loader, path in (('json', json_path), ('mmap', db_path)):
+                result = self.run_isolated(loader, path, options)
+                self.stdout.write(
+                    f"{loader:>8}{result['load_ms']:>10.1f}{result['rss_delta_mb']:>9.1f}{result['check_us']:>10.1f}"
+                )
+
+    def run_isolated(self, loader, path, options):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_interaction_loader',
+            '--single', loader, path,
+            '--checks', str(options['checks']),
+            '--seed', str(options['seed']),
+        ]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            raise CommandError(f"{loader} run failed:\n{completed.stderr}")
+        return json.loads(lines[-1])
+
+    def run_loader(self, loader, path, checks, seed):
+        from analysis.interaction_store import MappedInteractionStore
+        from analysis.registry import current_rss_mb
+
+        rss_before = current_rss_mb()
+        started = time.perf_counter()
+        if loader == 'mmap':
+            index = MappedInteractionStore(path)
+        else:
+            with open(path, 'r') as f:
+                index = InteractionIndex.from_mapping(json.load(f))
+        load_ms = (time.perf_counter() - started) * 1000
+
+        rng = random.Random(seed)
+        names = index.drug_names()
+        regimens = [rng.sample(names, 10) for _ in range(checks)]
+        started = time.perf_counter()
+        for medications in regimens:
+            index.check(medications)
+        check_us = (time.perf_counter() - started) / max(checks, 1) * 1e6
+
+        return {
+            'load_ms': load_ms,
+            'rss_delta_mb': current_rss_mb() - rss_before,
+            'check_us': check_us,
+        }
@@ -0,0 +1,84 @@
+"""
+Benchmark regimen checks against the compiled interaction index
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from analysis.interactions import InteractionIndex
+
+SEVERITY_MESSAGES = (
+    "HIGH RISK: Synthetic interaction.",
+    "MODERATE: Synthetic interaction.",
+    "LOW RISK: Synthetic interaction.",
+)
+
+
+def synthetic_interactions(pair_count, drug_count, rng):
+    """Nested {drug: {other: message}} mapping with pair_count distinct unordered pairs"""
+    names = [f"drug{i:05d}" for i in range(drug_count)]
+    data = {}
+    seen = set()
+    while len(seen) < pair_count:
+        a, b = rng.sample(range(drug_count), 2)
+        key = (min(a, b), max(a, b))
+        if key in seen:
+            continue
+        seen.add(key)
+        # Store in a random direction, as hand-maintained files do
+        data.setdefault(names[a], {})[names[b]] = rng.choice(SEVERITY_MESSAGES)
+    return names, data
+
+
+def nested_check(data, medications):
+    """The previous one-directional nested-dict walk"""
+    findings = []
+    for i, med1 in enumerate(medications):
+        for med2 in medications[i + 1:]:
+            if med1 in data and med2 in data[med1]:
+                findings.append((med1, med2, data[med1][med2]))
+    return findings
+
+
+class Command(BaseCommand):
+    help = 'Time interaction checks for 2-50 drug regimens against a synthetic pair dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=100000)
+        parser.add_argument('--drugs', type=int, default=5000)
+        parser.add_argument('--sizes', type=int, nargs='+', default=[2, 5, 10, 20, 50])
+        parser.add_argument('--regimens', type=int, default=2000, help='Regimens checked per size')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names, data = synthetic_interactions(options['pairs'], options['drugs'], rng)
+
+        started = time.perf_counter()
+        index = InteractionIndex.from_mapping(data)
+        compile_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            f"Compiled {len(index)} pairs over {index.drug_count} drugs in {compile_ms:.0f} ms"
+        )
+
+        self.stdout.write(
+            f"{'drugs':>6}{'nested us':>12}{'index us':>11}{'found (nested)':>16}{'found (index)':>15}"
+        )
+        for size in options['sizes']:
+            regimens = [rng.sample(names, size) for _ in range(options['regimens'])]
+
+            nested_us, nested_found = self.time_us(lambda meds: nested_check(data, meds), regimens)
+            index_us, index_found = self.time_us(index.check, regimens)
+
+            self.stdout.write(
+                f"{size:>6}{nested_us:>12.1f}{index_us:>11.1f}{nested_found:>16}{index_found:>15}"
+            )
+
+    def time_us(self, check, regimens):
+        found = 0
+        started = time.perf_counter()
+        for medications in regimens:
+            found += len(check(medications))
+        return (time.perf_counter() - started) / len(regimens) * 1e6, found
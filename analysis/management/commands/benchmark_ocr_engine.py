@@ -0,0 +1,63 @@
+"""
+Compare OCR throughput of the tesseract subprocess and the in-process engine pool
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analysis.ocr_engine import SubprocessEngine, TesserocrPool, probe_ocr_engine
+from analysis.ocr_preprocess import prepare_for_ocr
+
+
+class Command(BaseCommand):
+    help = 'Time OCR of sample_prescription.png through the subprocess and tesserocr engines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', default=os.path.join(settings.BASE_DIR, 'sample_prescription.png'))
+        parser.add_argument('--images', type=int, default=40, help='Recognitions per configuration')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--pool-size', type=int, default=4, help='API handles in the tesserocr pool')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['image']):
+            raise CommandError(f"{options['image']} not found")
+
+        with open(options['image'], 'rb') as f:
+            image, _ = prepare_for_ocr(f.read())
+        language = getattr(settings, 'OCR_LANGUAGE', 'eng')
+
+        engines = []
+        name, version = probe_ocr_engine('subprocess')
+        if name is None:
+            raise CommandError("Tesseract is not installed")
+        engines.append(SubprocessEngine(version, language))
+
+        name, version = probe_ocr_engine('tesserocr')
+        if name == 'tesserocr':
+            started = time.perf_counter()
+            engines.append(TesserocrPool(version, language, options['pool_size']))
+            self.stdout.write(
+                f"tesserocr pool of {options['pool_size']} initialized in {time.perf_counter() - started:.2f}s"
+            )
+        else:
+            self.stdout.write("tesserocr not installed; only the subprocess engine is timed")
+
+        self.stdout.write(f"{image.shape[1]}x{image.shape[0]} image, {options['images']} recognitions per row")
+        self.stdout.write(f"{'engine':>11}{'threads':>9}{'total s':>9}{'img/s':>8}{'ms/img':>9}{'chars':>7}")
+        for engine in engines:
+            engine.recognize(image)  # warm-up
+            for concurrency in options['concurrency']:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    texts = list(executor.map(lambda _: engine.recognize(image), range(options['images'])))
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{engine.name:>11}{concurrency:>9}{elapsed:>9.2f}{options['images'] / elapsed:>8.1f}"
+                    f"{elapsed / options['images'] * 1000:>9.1f}{len(texts[-1].strip()):>7}"
+                )
+            if isinstance(engine, TesserocrPool):
+                engine.close()
@@ -0,0 +1,103 @@
+"""
+Compare whole-page OCR with layout-segmented parallel OCR on multi-column and long prescriptions
+"""
+
+import difflib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analysis.ocr_engine import DEFAULT_PSM, create_ocr_engine
+from analysis.ocr_layout import MAX_BLOCK_LINES, recognize_blocks, segment_blocks
+from analysis.ocr_preprocess import prepare_for_ocr
+
+
+def multi_column_page(page):
+    """Two copies of ``page`` side by side under a full-width header strip"""
+    height, width = page.shape
+    gutter = np.full((height, width // 6), 255, np.uint8)
+    body = np.hstack([page, gutter, page])
+    header = np.full((height // 4, body.shape[1]), 255, np.uint8)
+    header[:, :width] = page[:height // 4]
+    return np.vstack([header, body])
+
+
+def long_page(page, copies):
+    """``copies`` of ``page`` stacked into one long prescription"""
+    return np.vstack([page] * copies)
+
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+
+
+class Command(BaseCommand):
+    help = 'Time whole-page and block-parallel OCR of synthetic multi-column and long prescriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', default=os.path.join(settings.BASE_DIR, 'sample_prescription.png'))
+        parser.add_argument('--copies', type=int, default=4, help='Pages stacked into the long prescription')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--max-lines', type=int, default=MAX_BLOCK_LINES)
+        parser.add_argument('--runs', type=int, default=3)
+
+    def handle(self, *args, **options):
+        page = cv2.imread(options['image'], cv2.IMREAD_GRAYSCALE)
+        if page is None:
+            raise CommandError(f"Could not read {options['image']}")
+
+        engine = create_ocr_engine(
+            getattr(settings, 'OCR_ENGINE', 'auto'),
+            getattr(settings, 'OCR_LANGUAGE', 'eng'),
+            max(options['workers'])
+        )
+        if engine is None:
+            raise CommandError("Tesseract is not installed")
+        self.stdout.write(f"Engine: {engine.describe()}")
+
+        layouts = {
+            'single': page,
+            'two-column': multi_column_page(page),
+            'long': long_page(page, options['copies']),
+        }
+        self.stdout.write(
+            f"{'layout':>11}{'OCR size':>11}{'mode':>9}{'workers':>8}{'blocks':>7}{'ms':>9}{'speedup':>8}{'same':>6}"
+        )
+        for name, image in layouts.items():
+            binary, info = prepare_for_ocr(cv2.imencode('.png', image)[1].tobytes())
+            text_height = info['text_height'] * info['scale'] if info['text_height'] else None
+            size = f"{binary.shape[1]}x{binary.shape[0]}"
+
+            engine.recognize(binary, psm=DEFAULT_PSM)  # warm-up
+            whole_ms, whole_text = self.time_runs(
+                lambda: engine.recognize(binary, psm=DEFAULT_PSM).strip(), options['runs']
+            )
+            self.stdout.write(f"{name:>11}{size:>11}{'page':>9}{1:>8}{1:>7}{whole_ms:>9.1f}{1:>8.2f}{1:>6.2f}")
+
+            for workers in options['workers']:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    def segmented():
+                        blocks = segment_blocks(binary, text_height, max_lines=options['max_lines'])
+                        segmented.blocks = len(blocks)
+                        return recognize_blocks(engine, binary, blocks, executor, DEFAULT_PSM)
+
+                    ms, text = self.time_runs(segmented, options['runs'])
+                self.stdout.write(
+                    f"{name:>11}{size:>11}{'blocks':>9}{workers:>8}{segmented.blocks:>7}{ms:>9.1f}"
+                    f"{whole_ms / ms:>8.2f}{similarity(whole_text, text):>6.2f}"
+                )
+
+        if hasattr(engine, 'close'):
+            engine.close()
+
+    def time_runs(self, recognize, runs):
+        """(mean milliseconds, text of the last run)"""
+        started = time.perf_counter()
+        for _ in range(runs):
+            text = recognize()
+        return (time.perf_counter() - started) / runs * 1000, text
@@ -0,0 +1,146 @@
+"""
+Compare full-resolution and resolution-aware OCR preprocessing on phone-sized photos
+"""
+
+import argparse
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PIPELINES = ('pil', 'full', 'aware')
+
+
+def synthetic_photo(page, megapixels, rng):
+    """JPEG bytes of ``page`` photographed on a dark desk at about ``megapixels`` MP"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    frame = rng.integers(30, 70, size=(height, width), dtype=np.uint8)
+
+    # The page fills about 70% of the frame height, slightly off-centre
+    page_height = int(height * 0.7)
+    page_width = min(int(page.shape[1] * page_height / page.shape[0]), width - 20)
+    scaled = cv2.resize(page, (page_width, page_height), interpolation=cv2.INTER_CUBIC)
+    top, left = (height - page_height) // 3, (width - page_width) // 4
+    frame[top:top + page_height, left:left + page_width] = scaled
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def run_pipeline(name, data):
+    """Preprocess ``data`` the way the named pipeline does and return the binary image"""
+    if name == 'pil':
+        # The original path: PIL decode, RGB -> BGR -> gray at full resolution
+        import io
+        from PIL import Image
+        image = np.array(Image.open(io.BytesIO(data)).convert('RGB'))
+        gray = cv2.cvtColor(cv2.cvtColor(image, cv2.COLOR_RGB2BGR), cv2.COLOR_BGR2GRAY)
+    elif name == 'full':
+        gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    else:
+        from analysis.ocr_preprocess import prepare_for_ocr
+        return prepare_for_ocr(data)[0]
+
+    from analysis.ocr_preprocess import binarize
+    return binarize(gray)
+
+
+def reset_peak_rss():
+    """Restart the kernel's peak RSS counter from the current RSS (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Command(BaseCommand):
+    help = 'Time and measure peak memory of OCR preprocessing per megapixel, before and after'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', default=os.path.join(settings.BASE_DIR, 'sample_prescription.png'))
+        parser.add_argument('--megapixels', type=float, nargs='+', default=[3, 12, 24])
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--single', nargs=2, metavar=('PIPELINE', 'PATH'), help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['single']:
+            # Child process: preprocess in a clean interpreter so peak RSS belongs to one pipeline
+            pipeline, path = options['single']
+            self.stdout.write(json.dumps(self.measure(pipeline, path, options['runs'])))
+            return
+
+        page = cv2.imread(options['image'], cv2.IMREAD_GRAYSCALE)
+        if page is None:
+            raise CommandError(f"Could not read {options['image']}")
+        rng = np.random.default_rng(options['seed'])
+
+        self.stdout.write(
+            f"{'MP':>6}{'pipeline':>10}{'ms':>9}{'ms/MP':>8}{'peak MB':>9}{'MB/MP':>7}{'OCR size':>12}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for megapixels in options['megapixels']:
+                path = os.path.join(directory, f'photo_{megapixels}.jpg')
+                with open(path, 'wb') as f:
+                    f.write(synthetic_photo(page, megapixels, rng))
+
+                for pipeline in PIPELINES:
+                    result = self.run_isolated(pipeline, path, options)
+                    self.stdout.write(
+                        f"{megapixels:>6.1f}{pipeline:>10}{result['ms']:>9.1f}{result['ms'] / megapixels:>8.1f}"
+                        f"{result['peak_mb']:>9.1f}{result['peak_mb'] / megapixels:>7.1f}"
+                        f"{'x'.join(map(str, result['ocr_size'])):>12}"
+                    )
+
+    def run_isolated(self, pipeline, path, options):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_ocr_preprocess',
+            '--single', pipeline, path,
+            '--runs', str(options['runs']),
+        ]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            raise CommandError(f"{pipeline} run failed:\n{completed.stderr}")
+        return json.loads(lines[-1])
+
+    def measure(self, pipeline, path, runs):
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Import everything up front so module loading is not part of the measurement
+        for module in ('analysis.ocr_preprocess', 'PIL.Image'):
+            importlib.import_module(module)
+        from analysis.registry import current_rss_mb
+
+        baseline = current_rss_mb() if reset_peak_rss() else peak_rss_mb()
+        started = time.perf_counter()
+        for _ in range(runs):
+            binary = run_pipeline(pipeline, data)
+        return {
+            'ms': (time.perf_counter() - started) / runs * 1000,
+            'peak_mb': peak_rss_mb() - baseline,
+            'ocr_size': [binary.shape[1], binary.shape[0]],
+        }
@@ -0,0 +1,73 @@
+"""
+Benchmark prefill cost with and without the cached prompt-prefix state
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analysis.services import PROMPT_PREFIX
+
+# Stands in for a static patient-context preamble that is repeated to grow the prefix
+PREAMBLE_SENTENCE = " Consider age, allergies, chronic conditions and current medications of the patient."
+
+SUFFIX = " aspirin, warfarin, metformin. Provide warnings and recommendations:"
+
+
+class Command(BaseCommand):
+    help = 'Measure prefill time saved by reusing past key/values of the prompt prefix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preamble-repeats', type=int, nargs='+', default=[0, 4, 16, 32],
+                            help='How many preamble sentences to add to the prefix')
+        parser.add_argument('--runs', type=int, default=10)
+
+    def handle(self, *args, **options):
+        import torch
+        from analysis.backends import TorchBackend
+        from analysis.precision import resolve_precision
+
+        # Same precision the service resolves 'auto' to, so the benchmark measures what production runs
+        backend = TorchBackend.from_pretrained(
+            settings.LLM_MODEL_NAME, str(settings.LLM_CACHE_DIR), resolve_precision(settings.LLM_PRECISION)
+        )
+        tokenizer = backend.tokenizer
+        model = backend.model
+        if model is None:
+            raise CommandError("Model unavailable")
+
+        self.stdout.write(f"{'prefix tok':>10}{'suffix tok':>12}{'full ms':>10}{'cached ms':>11}{'saved':>8}")
+
+        for repeats in options['preamble_repeats']:
+            prefix = PROMPT_PREFIX + PREAMBLE_SENTENCE * repeats
+            prefix_ids = tokenizer(prefix, return_tensors='pt')['input_ids'].to(backend.device)
+            suffix_ids = tokenizer(SUFFIX, return_tensors='pt')['input_ids'].to(backend.device)
+            full_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+
+            with torch.no_grad():
+                past = model(prefix_ids, use_cache=True).past_key_values
+
+                full_ms = self.time_ms(lambda: model(full_ids, use_cache=True), options['runs'])
+                cached_ms = self.time_ms(
+                    lambda: model(
+                        suffix_ids,
+                        attention_mask=torch.ones_like(full_ids),
+                        past_key_values=past,
+                        use_cache=True
+                    ),
+                    options['runs']
+                )
+
+            saved = 1 - cached_ms / full_ms if full_ms else 0.0
+            self.stdout.write(
+                f"{prefix_ids.shape[1]:>10}{suffix_ids.shape[1]:>12}"
+                f"{full_ms:>10.1f}{cached_ms:>11.1f}{saved:>8.0%}"
+            )
+
+    def time_ms(self, fn, runs):
+        fn()  # warm-up
+        started = time.perf_counter()
+        for _ in range(runs):
+            fn()
+        return (time.perf_counter() - started) / runs * 1000
@@ -0,0 +1,63 @@
+"""
+Benchmark vectorized severity lookups against the per-pair Python loops
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from analysis.interactions import InteractionIndex
+from analysis.management.commands.benchmark_interactions import nested_check, synthetic_interactions
+from analysis.severity_matrix import DENSE_DRUG_LIMIT, SeverityMatrix
+
+
+class Command(BaseCommand):
+    help = 'Time polypharmacy regimen checks: nested dict loop, interned index loop, severity matrix and batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=100000)
+        parser.add_argument('--drugs', type=int, default=5000)
+        parser.add_argument('--sizes', type=int, nargs='+', default=[15, 20, 30, 50])
+        parser.add_argument('--regimens', type=int, default=1000, help='Regimens per size, also the batch size')
+        parser.add_argument('--dense-limit', type=int, default=DENSE_DRUG_LIMIT,
+                            help='Largest vocabulary given a dense matrix (0 forces sorted keys)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names, data = synthetic_interactions(options['pairs'], options['drugs'], rng)
+        index = InteractionIndex.from_mapping(data)
+
+        started = time.perf_counter()
+        matrix = SeverityMatrix(index, dense_limit=options['dense_limit'])
+        stats = matrix.stats()
+        self.stdout.write(
+            f"{stats['mode']} matrix over {stats['drugs']} drugs / {stats['pairs']} pairs "
+            f"built in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+        self.stdout.write(
+            f"{'drugs':>6}{'nested us':>11}{'index us':>10}{'matrix us':>11}{'batch us':>10}{'findings':>10}"
+        )
+        for size in options['sizes']:
+            regimens = [rng.sample(names, size) for _ in range(options['regimens'])]
+
+            nested_us = self.time_each(lambda meds: nested_check(data, meds), regimens)
+            index_us = self.time_each(index.check, regimens)
+            matrix_us = self.time_each(matrix.check, regimens)
+
+            started = time.perf_counter()
+            results = matrix.check_batch(regimens)
+            batch_us = (time.perf_counter() - started) / len(regimens) * 1e6
+
+            findings = sum(len(result) for result in results) / len(regimens)
+            self.stdout.write(
+                f"{size:>6}{nested_us:>11.1f}{index_us:>10.1f}{matrix_us:>11.1f}{batch_us:>10.1f}{findings:>10.1f}"
+            )
+
+    def time_each(self, check, regimens):
+        started = time.perf_counter()
+        for medications in regimens:
+            check(medications)
+        return (time.perf_counter() - started) / len(regimens) * 1e6
@@ -0,0 +1,73 @@
+"""
+Compile the drug interaction source into the memory-mapped binary store
+"""
+
+import csv
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analysis.interaction_store import MappedInteractionStore, build_interaction_store
+from analysis.interactions import InteractionIndex, Severity, content_version, read_interaction_source
+
+
+def csv_rows(path):
+    """(drug_a, drug_b, message, severity) rows from a CSV with a header
+
+    Requires drug_a, drug_b and message columns; an optional severity column
+    (HIGH, MODERATE, LOW) overrides the label in the message.
+    """
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        missing = {'drug_a', 'drug_b', 'message'} - set(reader.fieldnames or ())
+        if missing:
+            raise CommandError(f"{path} is missing columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            severity = (row.get('severity') or '').strip().upper()
+            yield row['drug_a'], row['drug_b'], row['message'], Severity[severity] if severity else None
+
+
+class Command(BaseCommand):
+    help = 'Build the binary interaction database from drug_interactions.json or a CSV of pairs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=None, help='JSON or CSV source (defaults to DRUG_INTERACTIONS_FILE)')
+        parser.add_argument('--output', default=None, help='Output path (defaults to DRUG_INTERACTIONS_DB)')
+
+    def handle(self, *args, **options):
+        source = options['source'] or settings.DRUG_INTERACTIONS_FILE
+        output = options['output'] or settings.DRUG_INTERACTIONS_DB
+        if not os.path.exists(source):
+            raise CommandError(f"Source {source} not found")
+
+        started = time.perf_counter()
+        if source.lower().endswith('.csv'):
+            with open(source, 'rb') as f:
+                version = content_version(f.read())
+            index = InteractionIndex.from_pairs(csv_rows(source), version)
+        else:
+            try:
+                data, version = read_interaction_source(source)
+            except ValueError as e:
+                raise CommandError(f"{source} is not valid JSON: {e}")
+            index = InteractionIndex.from_mapping(data, version)
+
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        stats = build_interaction_store(index, output)
+
+        # Read every pair back through the mapped file before declaring success
+        store = MappedInteractionStore(output)
+        try:
+            for drug_a, drug_b, interaction in index.items():
+                if store.lookup(drug_a, drug_b) != interaction:
+                    raise CommandError(f"Verification failed for {drug_a} + {drug_b}")
+        finally:
+            store.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {stats['pairs']} pairs over {stats['drugs']} drugs "
+            f"({stats['messages']} distinct messages, {stats['bytes'] / 1024:.0f} KB, data version {index.version}) "
+            f"to {output} in {time.perf_counter() - started:.1f}s"
+        ))
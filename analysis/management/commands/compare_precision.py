@@ -0,0 +1,154 @@
+"""
+Compare LLM inference precisions on a fixed prompt set
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Fixed regimens so every precision sees identical prompts
+BENCHMARK_REGIMENS = [
+    ['aspirin', 'warfarin'],
+    ['metformin', 'lisinopril'],
+    ['warfarin', 'amoxicillin', 'vitamin_k'],
+    ['lisinopril', 'potassium', 'aspirin'],
+    ['metformin', 'alcohol'],
+    ['aspirin', 'ibuprofen', 'metformin', 'lisinopril'],
+]
+
+
+def prefix_agreement(reference, candidate):
+    """Fraction of reference tokens reproduced before the first divergence"""
+    if not reference:
+        return 1.0 if not candidate else 0.0
+    matched = 0
+    for a, b in zip(reference, candidate):
+        if a != b:
+            break
+        matched += 1
+    return matched / max(len(reference), len(candidate))
+
+
+class Command(BaseCommand):
+    help = 'Compare latency, tokens/s, RSS and output divergence of LLM precision modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=['fp32', 'bf16', 'int8'],
+                            help='Precisions to compare; the first one is the divergence reference')
+        parser.add_argument('--max-new-tokens', type=int, default=64)
+        parser.add_argument('--repeats', type=int, default=3, help='Timed runs per prompt')
+        parser.add_argument('--single', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['single']:
+            # Child process: measure one mode in a clean interpreter and report JSON
+            result = self.run_mode(options['single'], options['max_new_tokens'], options['repeats'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        results = [self.run_isolated(mode, options) for mode in options['modes']]
+        self.report(results)
+
+    def run_isolated(self, mode, options):
+        """Run one mode in a subprocess so RSS is not polluted by other modes"""
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'compare_precision',
+            '--single', mode,
+            '--max-new-tokens', str(options['max_new_tokens']),
+            '--repeats', str(options['repeats']),
+        ]
+        self.stdout.write(f"Running {mode}...")
+        completed = subprocess.run(command, capture_output=True, text=True)
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            raise CommandError(f"{mode} run failed:\n{completed.stderr}")
+        return json.loads(lines[-1])
+
+    def run_mode(self, mode, max_new_tokens, repeats):
+        import torch
+        from analysis.registry import current_rss_mb
+        from analysis.services import HuggingFaceLLM
+
+        started = time.perf_counter()
+        llm = HuggingFaceLLM(precision=mode)
+        load_time = time.perf_counter() - started
+
+        if llm.model is None:
+            return {'requested': mode, 'error': 'model unavailable'}
+
+        device = next(llm.model.parameters()).device
+        prompts = [llm.build_prompt(regimen) for regimen in BENCHMARK_REGIMENS]
+        outputs = []
+        latencies = []
+        generated_tokens = 0
+
+        for prompt in prompts:
+            inputs = llm.tokenizer(prompt, return_tensors='pt')
+            inputs = {k: v.to(device) for k, v in inputs.items()}
+            prompt_length = inputs['input_ids'].shape[1]
+
+            for run in range(repeats + 1):
+                run_started = time.perf_counter()
+                with torch.no_grad():
+                    output = llm.model.generate(
+                        **inputs,
+                        do_sample=False,
+                        max_new_tokens=max_new_tokens,
+                        pad_token_id=llm.tokenizer.eos_token_id
+                    )
+                elapsed = time.perf_counter() - run_started
+                # The first run per prompt is a warm-up
+                if run:
+                    latencies.append(elapsed)
+                    generated_tokens += output.shape[1] - prompt_length
+
+            outputs.append(output[0, prompt_length:].tolist())
+
+        latencies.sort()
+        return {
+            'requested': mode,
+            'precision': llm.precision,
+            'load_time_s': round(load_time, 2),
+            'rss_mb': round(current_rss_mb(), 1),
+            'avg_latency_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+            'p95_latency_ms': round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+            'tokens_per_s': round(generated_tokens / sum(latencies), 1),
+            'outputs': outputs,
+        }
+
+    def report(self, results):
+        reference = next((r for r in results if 'error' not in r), None)
+
+        header = f"{'mode':<8}{'load s':>8}{'RSS MB':>10}{'avg ms':>10}{'p95 ms':>10}{'tok/s':>8}{'agree':>8}{'exact':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for result in results:
+            if 'error' in result:
+                self.stdout.write(f"{result['requested']:<8}{result['error']}")
+                continue
+
+            pairs = list(zip(reference['outputs'], result['outputs']))
+            agreement = sum(prefix_agreement(a, b) for a, b in pairs) / len(pairs)
+            exact = sum(a == b for a, b in pairs) / len(pairs)
+
+            label = result['precision']
+            if result['precision'] != result['requested']:
+                label = f"{result['requested']}>{result['precision']}"
+
+            self.stdout.write(
+                f"{label:<8}{result['load_time_s']:>8}{result['rss_mb']:>10}"
+                f"{result['avg_latency_ms']:>10}{result['p95_latency_ms']:>10}"
+                f"{result['tokens_per_s']:>8}{agreement:>8.2f}{exact:>8.2f}"
+            )
+
+        self.stdout.write(
+            f"\nDivergence is measured against {reference['requested'] if reference else 'n/a'} "
+            "with greedy decoding; 'agree' is the shared token prefix, 'exact' the identical outputs."
+        )
@@ -0,0 +1,174 @@
+"""
+Export the cached causal LM to ONNX and validate it against eager PyTorch
+"""
+
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analysis.backends import (
+    ONNX_METADATA_FILE, ONNX_MODEL_FILE, OnnxRuntimeBackend, TorchBackend, is_model_cached,
+)
+
+VALIDATION_PROMPT = "Analyze drug interactions for: aspirin, warfarin. Provide warnings and recommendations:"
+
+
+class Command(BaseCommand):
+    help = 'Export the local LLM cache to an ONNX graph with past key/values and validate it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Output directory (defaults to LLM_ONNX_DIR)')
+        parser.add_argument('--opset', type=int, default=14)
+        parser.add_argument('--tolerance', type=float, default=1e-3,
+                            help='Maximum absolute logit difference accepted by validation')
+        parser.add_argument('--validate-tokens', type=int, default=32,
+                            help='Greedy tokens to compare between PyTorch and ONNX Runtime')
+        parser.add_argument('--skip-export', action='store_true', help='Only validate an existing export')
+
+    def handle(self, *args, **options):
+        model_name = settings.LLM_MODEL_NAME
+        cache_dir = str(settings.LLM_CACHE_DIR)
+        output = options['output'] or str(settings.LLM_ONNX_DIR)
+
+        if not is_model_cached(model_name, cache_dir):
+            raise CommandError(f"{model_name} is not in {cache_dir}; download it first (setup_ai_models.py)")
+
+        torch_backend = TorchBackend.from_pretrained(model_name, cache_dir, 'fp32')
+
+        if not options['skip_export']:
+            self.export(torch_backend, output, options['opset'])
+
+        self.validate(torch_backend, output, options['tolerance'], options['validate_tokens'])
+
+    def export(self, backend, output, opset):
+        import torch
+
+        os.makedirs(output, exist_ok=True)
+        model = backend.model
+        config = model.config
+        num_layers = config.num_hidden_layers
+        num_heads = config.num_attention_heads
+        head_dim = config.hidden_size // num_heads
+
+        class ExportWrapper(torch.nn.Module):
+            """Flattens past key/values so they can be graph inputs and outputs"""
+
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, position_ids, *past_flat):
+                past = tuple(
+                    (past_flat[2 * layer], past_flat[2 * layer + 1]) for layer in range(num_layers)
+                )
+                outputs = self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past,
+                    use_cache=True,
+                    return_dict=True
+                )
+                present = []
+                for key, value in outputs.past_key_values:
+                    present.extend([key, value])
+                return (outputs.logits, *present)
+
+        batch_size, sequence, past_length = 2, 3, 2
+        dummy_past = []
+        past_names, present_names = [], []
+        dynamic_axes = {
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'total_sequence'},
+            'position_ids': {0: 'batch', 1: 'sequence'},
+            'logits': {0: 'batch', 1: 'sequence'},
+        }
+        for layer in range(num_layers):
+            for kind in ('key', 'value'):
+                dummy_past.append(torch.zeros(batch_size, num_heads, past_length, head_dim))
+                past_names.append(f'past_{kind}_{layer}')
+                present_names.append(f'present_{kind}_{layer}')
+                dynamic_axes[past_names[-1]] = {0: 'batch', 2: 'past_sequence'}
+                dynamic_axes[present_names[-1]] = {0: 'batch', 2: 'total_sequence'}
+
+        dummy_inputs = (
+            torch.ones(batch_size, sequence, dtype=torch.long),
+            torch.ones(batch_size, past_length + sequence, dtype=torch.long),
+            torch.arange(past_length, past_length + sequence).repeat(batch_size, 1),
+            *dummy_past,
+        )
+
+        path = os.path.join(output, ONNX_MODEL_FILE)
+        self.stdout.write(f"Exporting {settings.LLM_MODEL_NAME} to {path}...")
+        started = time.perf_counter()
+        with torch.no_grad():
+            torch.onnx.export(
+                ExportWrapper(model),
+                dummy_inputs,
+                path,
+                input_names=['input_ids', 'attention_mask', 'position_ids', *past_names],
+                output_names=['logits', *present_names],
+                dynamic_axes=dynamic_axes,
+                opset_version=opset,
+                do_constant_folding=True
+            )
+
+        backend.tokenizer.save_pretrained(output)
+        with open(os.path.join(output, ONNX_METADATA_FILE), 'w') as f:
+            json.dump({
+                'model_name': settings.LLM_MODEL_NAME,
+                'num_layers': num_layers,
+                'num_heads': num_heads,
+                'head_dim': head_dim,
+                'eos_token_id': backend.tokenizer.eos_token_id,
+                'opset': opset,
+            }, f, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported in {time.perf_counter() - started:.1f}s "
+            f"({os.path.getsize(path) / (1024 * 1024):.0f} MB)"
+        ))
+
+    def validate(self, torch_backend, output, tolerance, validate_tokens):
+        import numpy as np
+        import torch
+
+        onnx_backend = OnnxRuntimeBackend(output, num_threads=settings.LLM_NUM_THREADS)
+
+        # Full-prompt logits must match the eager model
+        encoded = torch_backend.tokenizer(VALIDATION_PROMPT, return_tensors='pt')
+        with torch.no_grad():
+            expected = torch_backend.model(**encoded).logits.numpy()
+
+        inputs = {
+            'input_ids': encoded['input_ids'].numpy(),
+            'attention_mask': encoded['attention_mask'].numpy(),
+            'position_ids': np.arange(encoded['input_ids'].shape[1])[None, :],
+            **onnx_backend._empty_past(1),
+        }
+        actual = onnx_backend.session.run(['logits'], inputs)[0]
+        max_diff = float(np.abs(expected - actual).max())
+        self.stdout.write(f"Max logit difference: {max_diff:.2e} (tolerance {tolerance:.0e})")
+
+        # Greedy decoding exercises the incremental past key/values loop
+        generation = {'max_new_tokens': validate_tokens, 'do_sample': False}
+        started = time.perf_counter()
+        torch_text = torch_backend.generate([VALIDATION_PROMPT], **generation)[0]
+        torch_time = time.perf_counter() - started
+        started = time.perf_counter()
+        onnx_text = onnx_backend.generate([VALIDATION_PROMPT], **generation)[0]
+        onnx_time = time.perf_counter() - started
+
+        self.stdout.write(f"PyTorch greedy: {torch_time * 1000:.0f} ms, ONNX Runtime greedy: {onnx_time * 1000:.0f} ms")
+
+        if max_diff > tolerance:
+            raise CommandError("Validation failed: logits diverge beyond tolerance")
+        if torch_text != onnx_text:
+            raise CommandError(
+                f"Validation failed: greedy outputs differ\n  torch: {torch_text!r}\n  onnx:  {onnx_text!r}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("ONNX export validated; set LLM_BACKEND=onnx to use it"))
@@ -0,0 +1,265 @@
+"""
+Brand/generic drug name normalization built from DrugDatabase
+"""
+
+import re
+import sys
+import threading
+import time
+
+from .interactions import normalize_name
+
+# Strength and dose-form tokens stripped from surface forms ("Glucophage 500 mg tablets").
+# Bare numbers only go when they are whole tokens, so "5-fluorouracil" keeps its 5
+DOSAGE_PATTERN = re.compile(
+    r'(?<![\w-])\d+(?:[.,]\d+)?\s*(?:mg|mcg|µg|ug|g|gm|ml|l|iu|units?|meq|%)(?:/\s*\d*\s*(?:ml|l|g|dose|tab))?\b'
+    r'|(?<![\w-])\d+(?:[.,]\d+)?(?![\w-])'
+)
+FORM_TOKENS = frozenset({
+    'tab', 'tabs', 'tablet', 'tablets', 'cap', 'caps', 'capsule', 'capsules', 'pill', 'pills',
+    'oral', 'solution', 'suspension', 'syrup', 'injection', 'inj', 'cream', 'ointment', 'gel',
+    'drops', 'patch', 'inhaler', 'spray', 'chewable', 'dispersible', 'film', 'coated',
+    'er', 'xr', 'sr', 'cr', 'dr', 'xl', 'la', 'ec', 'od', 'mr',
+    'mg', 'mcg', 'ml', 'iu',
+})
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s-]|_')
+
+# Surface forms known before any DrugDatabase rows exist
+BUILTIN_SYNONYMS = {
+    'aspirin': ('acetylsalicylic acid', 'asa', 'bayer', 'ecotrin'),
+    'warfarin': ('coumadin', 'jantoven', 'warfarin sodium'),
+    'metformin': ('glucophage', 'fortamet', 'glumetza', 'metformin hydrochloride'),
+    'lisinopril': ('zestril', 'prinivil', 'qbrelis'),
+    'ibuprofen': ('advil', 'motrin', 'nurofen'),
+    'amoxicillin': ('amoxil', 'moxatag'),
+    'potassium': ('potassium chloride', 'k-dur', 'klor-con'),
+    'vitamin_k': ('phytonadione', 'mephyton', 'vitamin k1'),
+    'alcohol': ('ethanol',),
+}
+
+
+def clean_surface_form(text):
+    """Lowercase a drug mention and drop punctuation, strengths and dose-form tokens"""
+    text = PUNCTUATION_PATTERN.sub(' ', text.lower())
+    text = DOSAGE_PATTERN.sub(' ', text)
+    return ' '.join(token for token in text.split() if token not in FORM_TOKENS)
+
+
+class DrugNameNormalizer:
+    """Maps any known surface form of a drug to its canonical name and id
+
+    Canonical names are the keys of the interaction data where a row matches
+    one, so normalized names can be looked up in InteractionIndex directly.
+    ``version`` increases on every change so dependent indexes know to rebuild.
+    """
+
+    def __init__(self, vocabulary=(), synonyms=None):
+        self._lock = threading.Lock()
+        self._forms = {}  # cleaned surface form -> canonical name
+        self._canonical_ids = {}  # canonical name -> int id
+        self._rows = {}  # DrugDatabase pk -> (canonical name, surface forms)
+        self.version = 0
+
+        for name in vocabulary:
+            self._register(normalize_name(name), [name])
+        for name, forms in (synonyms or {}).items():
+            self._register(normalize_name(name), [name, *forms])
+        self._seed_forms = frozenset(self._forms)
+
+    def _canonical_id(self, canonical):
+        canonical = sys.intern(canonical)
+        if canonical not in self._canonical_ids:
+            self._canonical_ids[canonical] = len(self._canonical_ids)
+        return canonical
+
+    def _register(self, canonical, forms):
+        canonical = self._canonical_id(canonical)
+        cleaned = []
+        for form in forms:
+            key = clean_surface_form(form)
+            if key:
+                self._forms[key] = canonical
+                cleaned.append(key)
+        return cleaned
+
+    def _row_forms(self, drug):
+        return [drug.name, drug.generic_name, *(drug.brand_names or [])]
+
+    def _row_canonical(self, drug, forms):
+        # Prefer a name the interaction data already uses so lookups line up
+        for form in forms:
+            canonical = self._forms.get(clean_surface_form(form))
+            if canonical is not None:
+                return canonical
+        return normalize_name(drug.generic_name or drug.name)
+
+    def add_vocabulary(self, names):
+        """Register names from reloaded interaction data, leaving existing forms alone"""
+        with self._lock:
+            added = []
+            for name in names:
+                if clean_surface_form(name) not in self._forms:
+                    added.extend(self._register(normalize_name(name), [name]))
+            self._seed_forms = self._seed_forms | frozenset(added)
+            self.version += 1
+
+    def load_rows(self, drugs):
+        """Add every DrugDatabase row in ``drugs``"""
+        with self._lock:
+            for drug in drugs:
+                self._add_row(drug)
+            self.version += 1
+
+    def replace_rows(self, drugs):
+        """Drop every DrugDatabase row and add those in ``drugs`` instead"""
+        with self._lock:
+            for pk in list(self._rows):
+                self._remove_row(pk)
+            for drug in drugs:
+                self._add_row(drug)
+            self.version += 1
+
+    def update_drug(self, drug):
+        """Add or replace a single DrugDatabase row"""
+        with self._lock:
+            self._remove_row(drug.pk)
+            self._add_row(drug)
+            self.version += 1
+
+    def remove_drug(self, pk):
+        with self._lock:
+            self._remove_row(pk)
+            self.version += 1
+
+    def _add_row(self, drug):
+        forms = [form for form in self._row_forms(drug) if form]
+        canonical = self._row_canonical(drug, forms)
+        self._rows[drug.pk] = (canonical, self._register(canonical, forms))
+
+    def _remove_row(self, pk):
+        canonical, forms = self._rows.pop(pk, (None, ()))
+        for form in forms:
+            # Leave seed forms and forms another row has since claimed
+            if form not in self._seed_forms and self._forms.get(form) == canonical:
+                del self._forms[form]
+
+    def canonical(self, surface):
+        """Canonical name for a surface form, or None if it is unknown"""
+        return self._forms.get(clean_surface_form(surface))
+
+    def canonical_id(self, surface):
+        canonical = self.canonical(surface)
+        return None if canonical is None else self._canonical_ids[canonical]
+
+    def normalize(self, surface):
+        """Canonical name if known, otherwise the cleaned surface form"""
+        cleaned = clean_surface_form(surface)
+        return self._forms.get(cleaned, cleaned)
+
+    def normalize_list(self, medications):
+        """Normalize a regimen, dropping empty entries and duplicates but keeping order"""
+        seen = set()
+        names = []
+        for med in medications:
+            name = self.normalize(med)
+            if name and name not in seen:
+                seen.add(name)
+                names.append(name)
+        return names
+
+    def surface_forms(self):
+        """Snapshot of (cleaned surface form, canonical name) pairs"""
+        with self._lock:
+            return list(self._forms.items())
+
+    def canonical_names(self):
+        with self._lock:
+            return list(self._canonical_ids)
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'surface_forms': len(self._forms),
+            'canonical_drugs': len(self._canonical_ids),
+            'database_rows': len(self._rows),
+        }
+
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+_drug_table_state = None  # DrugDatabase state the normalizer's rows were read at
+_drug_table_checked = 0.0
+_drug_table_stale = False
+
+
+def drug_rows():
+    from core.models import DrugDatabase
+    return DrugDatabase.objects.only('pk', 'name', 'generic_name', 'brand_names')
+
+
+def drug_table_state():
+    """(row count, latest updated_at) of DrugDatabase; changes when any process edits a row"""
+    from django.db.models import Count, Max
+    from core.models import DrugDatabase
+    state = DrugDatabase.objects.aggregate(rows=Count('pk'), updated=Max('updated_at'))
+    return state['rows'], state['updated']
+
+
+def get_normalizer():
+    """Return the process-wide normalizer, loading DrugDatabase on first use
+
+    Edits made by other processes are picked up by comparing
+    drug_table_state() at most every DRUG_DATABASE_RELOAD_INTERVAL seconds
+    and re-reading the rows when it changed.
+    """
+    global _normalizer, _drug_table_state, _drug_table_checked
+    if _normalizer is None:
+        with _normalizer_lock:
+            if _normalizer is None:
+                from .interaction_store import get_interaction_index
+                normalizer = DrugNameNormalizer(get_interaction_index().drug_names(), BUILTIN_SYNONYMS)
+                _drug_table_checked = time.monotonic()
+                try:
+                    # Read the state first so an edit made during the load triggers another one
+                    _drug_table_state = drug_table_state()
+                    normalizer.load_rows(drug_rows())
+                except Exception as e:
+                    print(f"Warning: DrugDatabase unavailable for name normalization: {e}")
+                _normalizer = normalizer
+    else:
+        _refresh_drug_rows(_normalizer)
+    return _normalizer
+
+
+def _refresh_drug_rows(normalizer):
+    global _drug_table_state, _drug_table_checked, _drug_table_stale
+    from django.conf import settings
+    interval = getattr(settings, 'DRUG_DATABASE_RELOAD_INTERVAL', 5.0)
+    if not _drug_table_stale and (interval <= 0 or time.monotonic() - _drug_table_checked < interval):
+        return
+
+    with _normalizer_lock:
+        if not _drug_table_stale and time.monotonic() - _drug_table_checked < interval:
+            return
+        _drug_table_checked = time.monotonic()
+        stale, _drug_table_stale = _drug_table_stale, False
+        try:
+            state = drug_table_state()
+            if stale or state != _drug_table_state:
+                normalizer.replace_rows(drug_rows())
+                _drug_table_state = state
+        except Exception as e:
+            print(f"Warning: DrugDatabase reload failed, keeping normalizer version {normalizer.version}: {e}")
+
+
+def invalidate_normalizer():
+    """Re-read DrugDatabase on the next get_normalizer(), e.g. after this process edited it"""
+    global _drug_table_stale
+    _drug_table_stale = True
+
+
+def extend_vocabulary(names):
+    """Register drug names from reloaded interaction data, if the normalizer has been built"""
+    normalizer = _normalizer
+    if normalizer is not None:
+        normalizer.add_vocabulary(names)
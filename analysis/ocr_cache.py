@@ -0,0 +1,172 @@
+"""
+Content-addressed cache of OCR results, with optional near-duplicate matching
+"""
+
+import hashlib
+import threading
+
+import cv2
+import numpy as np
+
+from .cache import TieredCache, stable_hash
+from .ocr_preprocess import decode_reduced, probe_image
+
+# Bump when preprocessing or result layout changes make cached OCR output stale
+OCR_CACHE_VERSION = 1
+
+# Difference hash of a (DHASH_SIZE + 1) x DHASH_SIZE thumbnail: 256 bits
+DHASH_SIZE = 16
+
+# Fingerprints further apart than this many bits are different images
+NEAR_DUPLICATE_DISTANCE = 6
+
+
+def content_digest(data):
+    """SHA-256 of the upload bytes, identifying an exact re-upload"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(data):
+    """256-bit difference hash of an encoded image, as 32 bytes
+
+    Decodes at 1/8 scale; re-encoding, resizing and mild exposure changes
+    move only a few bits.
+    """
+    width, height, image_format = probe_image(data)
+    factor = 8 if min(width, height) >= 8 * DHASH_SIZE else 1
+    gray = decode_reduced(data, width, height, image_format, factor)
+    thumbnail = cv2.resize(gray, (DHASH_SIZE + 1, DHASH_SIZE), interpolation=cv2.INTER_AREA)
+    return np.packbits(thumbnail[:, 1:] > thumbnail[:, :-1]).tobytes()
+
+
+class OCRResultCache:
+    """OCR results keyed by upload digest and OCR configuration
+
+    Exact re-uploads are found by digest in a TieredCache that survives
+    restarts. With ``near_duplicates`` an in-memory ring of dHash
+    fingerprints also maps visually identical uploads (re-encoded, resized)
+    to an earlier digest. That is off by default: a 16x16 hash cannot see a
+    changed line of text, so two prescriptions on the same template can
+    match each other more closely than a resized copy matches its original.
+    """
+
+    def __init__(self, cache, config_key, near_duplicates=False,
+                 near_distance=NEAR_DUPLICATE_DISTANCE, max_fingerprints=4096):
+        self.cache = cache
+        self.config_key = config_key
+        self.near_duplicates = near_duplicates
+        self.near_distance = near_distance
+        self._fingerprints = np.zeros((max(1, int(max_fingerprints)), DHASH_SIZE * DHASH_SIZE // 8), dtype=np.uint8)
+        self._digests = [None] * len(self._fingerprints)
+        self._next = 0
+        self._lock = threading.Lock()
+        self._counters = {'lookups': 0, 'exact_hits': 0, 'near_hits': 0, 'misses': 0}
+
+    def key(self, digest):
+        return f"{self.config_key}|{digest}"
+
+    def _nearest(self, fingerprint):
+        """Digest of the closest stored fingerprint within near_distance bits, or None"""
+        with self._lock:
+            filled = min(self._next, len(self._fingerprints))
+            if not filled:
+                return None
+            query = np.frombuffer(fingerprint, dtype=np.uint8)
+            distances = np.unpackbits(self._fingerprints[:filled] ^ query, axis=1).sum(axis=1)
+            best = int(distances.argmin())
+            return self._digests[best] if distances[best] <= self.near_distance else None
+
+    def lookup(self, data):
+        """(cached value or None, 'exact' / 'near' / None, digest, fingerprint)"""
+        digest = content_digest(data)
+        value = self.cache.get(self.key(digest))
+        status = 'exact' if value is not None else None
+
+        fingerprint = None
+        if value is None and self.near_duplicates:
+            try:
+                fingerprint = dhash(data)
+            except Exception:
+                fingerprint = None
+            if fingerprint is not None:
+                match = self._nearest(fingerprint)
+                if match is not None:
+                    value = self.cache.get(self.key(match))
+                    status = 'near' if value is not None else None
+
+        with self._lock:
+            self._counters['lookups'] += 1
+            self._counters[f'{status}_hits' if status else 'misses'] += 1
+        return value, status, digest, fingerprint
+
+    def store(self, digest, fingerprint, value):
+        self.cache.set(self.key(digest), value)
+        if fingerprint is not None:
+            with self._lock:
+                slot = self._next % len(self._fingerprints)
+                self._fingerprints[slot] = np.frombuffer(fingerprint, dtype=np.uint8)
+                self._digests[slot] = digest
+                self._next += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters['fingerprints'] = min(self._next, len(self._fingerprints))
+        hits = counters['exact_hits'] + counters['near_hits']
+        counters['hit_ratio'] = round(hits / counters['lookups'], 3) if counters['lookups'] else 0.0
+        counters['near_duplicates'] = self.near_duplicates
+        counters['store'] = self.cache.stats()
+        return counters
+
+
+def ocr_config_key(engine, min_side, target_text_height, psm, block_lines=0):
+    """Everything that changes the OCR output for the same bytes
+
+    ``block_lines`` is the layout block size, or 0 when pages are recognized whole.
+    """
+    return f"{engine.describe()}:v{OCR_CACHE_VERSION}:" + stable_hash({
+        'min_side': min_side,
+        'target_text_height': target_text_height,
+        'psm': psm,
+        'block_lines': block_lines,
+    })
+
+
+_ocr_cache = None
+_ocr_cache_loaded = False
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    """Return the process-wide OCR result cache, or None if disabled or OCR is unavailable"""
+    global _ocr_cache, _ocr_cache_loaded
+    if not _ocr_cache_loaded:
+        with _ocr_cache_lock:
+            if not _ocr_cache_loaded:
+                from django.conf import settings
+                from .ocr_engine import DEFAULT_PSM, get_ocr_engine
+                from .ocr_layout import MAX_BLOCK_LINES
+                from .ocr_preprocess import DECODE_MIN_SIDE, TARGET_TEXT_HEIGHT
+
+                engine = get_ocr_engine()
+                if engine is not None and getattr(settings, 'OCR_CACHE', True):
+                    _ocr_cache = OCRResultCache(
+                        TieredCache(
+                            'ocr',
+                            path=getattr(settings, 'OCR_CACHE_PATH', None),
+                            max_entries=getattr(settings, 'OCR_CACHE_SIZE', 256),
+                            ttl_seconds=getattr(settings, 'OCR_CACHE_TTL', 7 * 86400),
+                            max_disk_entries=getattr(settings, 'OCR_CACHE_MAX_DISK_ENTRIES', 20000)
+                        ),
+                        ocr_config_key(
+                            engine,
+                            getattr(settings, 'OCR_DECODE_MIN_SIDE', DECODE_MIN_SIDE),
+                            getattr(settings, 'OCR_TARGET_TEXT_HEIGHT', TARGET_TEXT_HEIGHT),
+                            DEFAULT_PSM,
+                            getattr(settings, 'OCR_BLOCK_MAX_LINES', MAX_BLOCK_LINES)
+                            if getattr(settings, 'OCR_PARALLEL_BLOCKS', True) else 0
+                        ),
+                        near_duplicates=getattr(settings, 'OCR_CACHE_NEAR_DUPLICATES', False)
+                    )
+                _ocr_cache_loaded = True
+    return _ocr_cache
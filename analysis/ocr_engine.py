@@ -0,0 +1,180 @@
+"""
+Tesseract engines: warm in-process API handles or the pytesseract subprocess
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Tesseract page segmentation mode used for prescriptions: one uniform block of text
+DEFAULT_PSM = 6
+
+
+class SubprocessEngine:
+    """Runs the tesseract binary once per image through pytesseract
+
+    Every call forks a process that reloads the language data, so this is
+    only the fallback when no in-process binding is installed.
+    """
+
+    name = 'subprocess'
+
+    def __init__(self, version, language='eng'):
+        self.version = version
+        self.language = language
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._busy_seconds = 0.0
+
+    def recognize(self, image, psm=DEFAULT_PSM):
+        """Text of a uint8 grayscale or binary image array"""
+        import pytesseract
+
+        started = time.perf_counter()
+        text = pytesseract.image_to_string(image, lang=self.language, config=f'--oem 3 --psm {psm}')
+        self._record(time.perf_counter() - started)
+        return text
+
+    def _record(self, seconds):
+        with self._lock:
+            self._calls += 1
+            self._busy_seconds += seconds
+
+    def describe(self):
+        return f"{self.name}:{self.version}:{self.language}"
+
+    def stats(self):
+        with self._lock:
+            return {
+                'engine': self.name,
+                'version': self.version,
+                'calls': self._calls,
+                'avg_ms': round(self._busy_seconds / self._calls * 1000, 1) if self._calls else None,
+            }
+
+
+class TesserocrPool(SubprocessEngine):
+    """Fixed set of initialized Tesseract API handles shared by the calling threads
+
+    Each handle loads the language data once. A call borrows a handle for the
+    duration of one recognition, so at most ``size`` images are recognized at
+    once; tesserocr releases the GIL while Tesseract runs, so they really do
+    run in parallel.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, version, language='eng', size=2):
+        super().__init__(version, language)
+        import tesserocr
+
+        self.size = max(1, int(size))
+        self._handles = queue.LifoQueue()
+        for _ in range(self.size):
+            self._handles.put(tesserocr.PyTessBaseAPI(lang=language, oem=tesserocr.OEM.DEFAULT))
+        self._waits = 0
+
+    def recognize(self, image, psm=DEFAULT_PSM):
+        """Text of a uint8 grayscale or binary image array"""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        try:
+            api = self._handles.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._waits += 1
+            api = self._handles.get()
+
+        started = time.perf_counter()
+        try:
+            api.SetPageSegMode(psm)
+            height, width = image.shape[:2]
+            api.SetImageBytes(image.tobytes(), width, height, 1, width)
+            text = api.GetUTF8Text()
+        finally:
+            api.Clear()
+            self._handles.put(api)
+        self._record(time.perf_counter() - started)
+        return text
+
+    def close(self):
+        for _ in range(self.size):
+            self._handles.get().End()
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                'pool_size': self.size,
+                'idle_handles': self._handles.qsize(),
+                'waits': self._waits,
+            })
+        return stats
+
+
+def probe_ocr_engine(preferred='auto'):
+    """(engine name, version) of the best available Tesseract, or (None, None)
+
+    ``preferred`` is 'auto', 'tesserocr' or 'subprocess'.
+    """
+    if preferred in ('auto', 'tesserocr'):
+        try:
+            import tesserocr
+            return 'tesserocr', tesserocr.tesseract_version().split()[1]
+        except Exception as e:
+            if preferred == 'tesserocr':
+                print(f"Warning: tesserocr unavailable, falling back to the tesseract binary: {e}")
+
+    try:
+        import pytesseract
+        return 'subprocess', str(pytesseract.get_tesseract_version())
+    except Exception:
+        return None, None
+
+
+def create_ocr_engine(preferred='auto', language='eng', pool_size=2):
+    """Instantiate the best available engine, or None if Tesseract is not installed"""
+    name, version = probe_ocr_engine(preferred)
+    if name == 'tesserocr':
+        try:
+            return TesserocrPool(version, language, pool_size)
+        except Exception as e:
+            print(f"Warning: could not initialize Tesseract API handles, using the tesseract binary: {e}")
+            name, version = probe_ocr_engine('subprocess')
+    if name == 'subprocess':
+        return SubprocessEngine(version, language)
+    return None
+
+
+def default_pool_size(settings):
+    """One handle per concurrent page block; a worker process recognizes one upload at a time"""
+    if not getattr(settings, 'OCR_PARALLEL_BLOCKS', True):
+        return 1
+    return max(1, getattr(settings, 'OCR_BLOCK_WORKERS', 2))
+
+
+_engine = None
+_engine_loaded = False
+_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    """Return the process-wide OCR engine, probing for Tesseract only on first use"""
+    global _engine, _engine_loaded
+    if not _engine_loaded:
+        with _engine_lock:
+            if not _engine_loaded:
+                from django.conf import settings
+                _engine = create_ocr_engine(
+                    getattr(settings, 'OCR_ENGINE', 'auto'),
+                    getattr(settings, 'OCR_LANGUAGE', 'eng'),
+                    getattr(settings, 'OCR_ENGINE_POOL_SIZE', 0) or default_pool_size(settings)
+                )
+                _engine_loaded = True
+    return _engine
+
+
+def ocr_engine_stats():
+    """Stats of this process's OCR engine, without probing for one if none was created"""
+    return _engine.stats() if _engine is not None else None
@@ -0,0 +1,174 @@
+"""
+Projection-profile segmentation of prescription pages into independently OCRable text blocks
+"""
+
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .ocr_preprocess import TARGET_TEXT_HEIGHT, estimate_text_height
+
+# Blocks longer than this are split between lines so long pages spread over the workers
+MAX_BLOCK_LINES = 12
+
+# Whitespace, in text heights, that separates paragraphs / columns
+PARAGRAPH_GAP = 2.0
+COLUMN_GAP = 2.5
+
+# Both sides of a vertical cut must be at least this many text heights wide, so
+# the drug and dosage columns of a table are never read apart
+MIN_COLUMN_WIDTH = 12
+
+# White margin around each block crop; Tesseract misreads glyphs touching the edge
+BLOCK_PADDING = 10
+
+Block = namedtuple('Block', 'x y width height')
+
+
+def glyph_mask(binary, text_height):
+    """Boolean mask of character-sized components of a black-on-white binary image
+
+    Page edges, ruled lines, stamps and speckle from the desk around a
+    photographed page would otherwise bridge every gap in the profiles.
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(255 - binary, connectivity=8)
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    widths = stats[:, cv2.CC_STAT_WIDTH]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    glyphs = (
+        (heights >= text_height * 0.3) & (heights <= text_height * 3)
+        & (widths <= text_height * 8) & (areas >= text_height * text_height * 0.05)
+    )
+    glyphs[0] = False  # background
+    return glyphs[labels]
+
+
+def _runs(profile, min_gap):
+    """(start, end) spans of non-empty profile entries, merging gaps shorter than ``min_gap``"""
+    filled = np.flatnonzero(profile)
+    if not len(filled):
+        return []
+    breaks = np.flatnonzero(np.diff(filled) > min_gap)
+    starts = np.concatenate(([filled[0]], filled[breaks + 1]))
+    ends = np.concatenate((filled[breaks], [filled[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _row_profile(ink, min_pixels):
+    return ink.sum(axis=1) >= min_pixels
+
+
+def _split_lines(ink, block, text_height, max_lines):
+    """Split a tall block between text lines into chunks of at most ``max_lines`` lines"""
+    x, y, width, height = block
+    region = ink[y:y + height, x:x + width]
+    lines = _runs(_row_profile(region, 2), max(1, int(text_height * 0.2)))
+    if len(lines) <= max_lines:
+        return [block]
+
+    chunks = []
+    for first in range(0, len(lines), max_lines):
+        group = lines[first:first + max_lines]
+        top = group[0][0]
+        # Extend each chunk down to the next one so descenders are not cut off
+        bottom = lines[first + max_lines][0] if first + max_lines < len(lines) else height
+        chunks.append(Block(x, y + top, width, bottom - top))
+    return chunks
+
+
+def _xy_cut(ink, block, text_height, min_pixels, blocks):
+    """Recursive X-Y cut appending leaf blocks to ``blocks`` in reading order
+
+    Column gutters are cut first, so a column is read to its end before the
+    next one; a region without a gutter is cut at paragraph gaps instead.
+    """
+    x, y, width, height = block
+    region = ink[y:y + height, x:x + width]
+
+    rows = _runs(_row_profile(region, min_pixels), int(text_height * PARAGRAPH_GAP))
+    if not rows:
+        return
+    top, bottom = rows[0][0], rows[-1][1]
+    columns = _runs(region[top:bottom].sum(axis=0) > 0, int(text_height * COLUMN_GAP))
+    left, right = columns[0][0], columns[-1][1]
+
+    # Vertical cut only between wide-enough neighbours; merge narrow pieces into their left neighbour
+    min_width = text_height * MIN_COLUMN_WIDTH
+    merged = [list(columns[0])]
+    for start, end in columns[1:]:
+        if end - start < min_width or merged[-1][1] - merged[-1][0] < min_width:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    if len(merged) > 1:
+        for start, end in merged:
+            _xy_cut(ink, Block(x + start, y + top, end - start, bottom - top), text_height, min_pixels, blocks)
+    elif len(rows) > 1:
+        for start, end in rows:
+            _xy_cut(ink, Block(x + left, y + start, right - left, end - start), text_height, min_pixels, blocks)
+    elif bottom - top >= text_height * 0.5:
+        blocks.append(Block(x + left, y + top, right - left, bottom - top))
+
+
+def segment_blocks(binary, text_height=None, max_lines=MAX_BLOCK_LINES):
+    """Text blocks of a binarized page in reading order
+
+    Columns are read top to bottom, left to right; blocks taller than
+    ``max_lines`` lines are split between lines.
+    """
+    if text_height is None:
+        text_height = estimate_text_height(binary) or TARGET_TEXT_HEIGHT
+    text_height = max(4.0, float(text_height))
+    ink = glyph_mask(binary, text_height)
+
+    leaves = []
+    _xy_cut(ink, Block(0, 0, binary.shape[1], binary.shape[0]), text_height, 2, leaves)
+
+    # Widen blocks again for the dots and punctuation the glyph mask left out
+    page_height, page_width = binary.shape
+    margin_x, margin_y = int(text_height * 0.5), int(text_height * 0.25)
+    blocks = []
+    for leaf in leaves:
+        for x, y, width, height in _split_lines(ink, leaf, text_height, max_lines):
+            x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+            x1, y1 = min(page_width, x + width + margin_x), min(page_height, y + height + margin_y)
+            blocks.append(Block(x0, y0, x1 - x0, y1 - y0))
+    return blocks
+
+
+def crop_block(binary, block, padding=BLOCK_PADDING):
+    """Copy of the block with a white margin, ready for recognition"""
+    x, y, width, height = block
+    return cv2.copyMakeBorder(
+        binary[y:y + height, x:x + width], padding, padding, padding, padding,
+        cv2.BORDER_CONSTANT, value=255
+    )
+
+
+def recognize_blocks(engine, binary, blocks, executor, psm):
+    """OCR ``blocks`` concurrently on ``executor`` and join their text in reading order"""
+    crops = [crop_block(binary, block) for block in blocks]
+    texts = executor.map(lambda crop: engine.recognize(crop, psm=psm), crops)
+    return '\n'.join(text.strip() for text in texts if text.strip())
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_block_executor():
+    """Return the process-wide thread pool that recognizes page blocks"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from django.conf import settings
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, getattr(settings, 'OCR_BLOCK_WORKERS', 2)),
+                    thread_name_prefix='ocr-block'
+                )
+    return _executor
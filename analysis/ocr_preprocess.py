@@ -0,0 +1,176 @@
+"""
+Resolution-aware preparation of prescription photos for Tesseract
+"""
+
+import io
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# Uploads larger than this are rejected before any pixel is decoded
+MAX_IMAGE_PIXELS = 50_000_000
+
+# Decode at the largest 1/2, 1/4 or 1/8 reduction that keeps the long side at least this long
+DECODE_MIN_SIDE = 2000
+
+# Tesseract reads best with capital letters roughly 20-40 px tall
+TARGET_TEXT_HEIGHT = 32
+MIN_SCALE = 0.25
+MAX_SCALE = 2.0
+
+# Side of the thumbnail used to look for the paper in a photo
+DOCUMENT_PROBE_SIDE = 512
+MIN_DOCUMENT_FRACTION = 0.2
+
+REDUCED_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+class ImageTooLarge(ValueError):
+    """The upload declares more pixels than OCR_MAX_IMAGE_PIXELS allows"""
+
+
+def probe_image(data):
+    """(width, height, format) read from the image header without decoding pixels"""
+    with Image.open(io.BytesIO(data)) as image:
+        return image.width, image.height, image.format
+
+
+def reduction_factor(width, height, min_side=DECODE_MIN_SIDE):
+    """Largest power-of-two reduction that keeps the long side at least ``min_side``"""
+    factor = 1
+    while factor < 8 and max(width, height) // (factor * 2) >= min_side:
+        factor *= 2
+    return factor
+
+
+def decode_reduced(data, width, height, image_format, factor):
+    """Decode straight to grayscale at 1/``factor`` scale
+
+    JPEGs go through PIL draft mode, which lets libjpeg skip the discarded
+    DCT coefficients instead of decoding full size and shrinking; other
+    formats use OpenCV's reduced grayscale decode.
+    """
+    if image_format == 'JPEG':
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft('L', (width // factor, height // factor))
+            image = ImageOps.exif_transpose(image.convert('L'))
+            return np.asarray(image)
+
+    gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_GRAYSCALE_FLAGS[factor])
+    if gray is None:
+        raise ValueError("Unsupported or corrupt image data")
+    return gray
+
+
+def document_region(gray):
+    """(x, y, width, height) of the paper in a photo, or None to keep the whole frame
+
+    The paper is taken to be the largest bright blob of an Otsu-thresholded
+    thumbnail, and only counts if it covers a meaningful part of the frame.
+    """
+    height, width = gray.shape
+    scale = DOCUMENT_PROBE_SIDE / max(height, width)
+    if scale < 1:
+        small = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    else:
+        small, scale = gray, 1.0
+
+    blurred = cv2.GaussianBlur(small, (7, 7), 0)
+    _, bright = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Close the text strokes so the page is one blob
+    bright = cv2.morphologyEx(bright, cv2.MORPH_CLOSE, np.ones((9, 9), np.uint8))
+    contours, _ = cv2.findContours(bright, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    covered = (w * h) / (small.shape[0] * small.shape[1])
+    if covered < MIN_DOCUMENT_FRACTION or covered > 0.95:
+        return None
+
+    # Back to full-resolution coordinates with a small margin
+    margin = 4
+    x0 = max(0, int((x - margin) / scale))
+    y0 = max(0, int((y - margin) / scale))
+    x1 = min(width, int((x + w + margin) / scale))
+    y1 = min(height, int((y + h + margin) / scale))
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def estimate_text_height(gray):
+    """Median height in pixels of character-like connected components, or None"""
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    if count <= 1:
+        return None
+
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    # Drop specks, rules and picture regions
+    glyphs = (
+        (heights >= 4) & (heights <= gray.shape[0] // 5)
+        & (widths <= heights * 4) & (areas >= 8)
+    )
+    if glyphs.sum() < 10:
+        return None
+    return float(np.median(heights[glyphs]))
+
+
+def binarize(gray):
+    """Denoise and adaptive-threshold a grayscale image for Tesseract"""
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    return cv2.adaptiveThreshold(
+        blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+    )
+
+
+def prepare_for_ocr(data, max_pixels=MAX_IMAGE_PIXELS, min_side=DECODE_MIN_SIDE,
+                    target_text_height=TARGET_TEXT_HEIGHT):
+    """Binary image ready for Tesseract from encoded upload bytes, plus what was done
+
+    Decodes at reduced scale when the photo is much larger than needed,
+    crops to the paper, then rescales so the text lands in Tesseract's
+    preferred size range before thresholding.
+    """
+    width, height, image_format = probe_image(data)
+    if width * height > max_pixels:
+        raise ImageTooLarge(
+            f"Image is {width}x{height} ({width * height / 1e6:.0f} MP); the limit is {max_pixels / 1e6:.0f} MP"
+        )
+
+    factor = reduction_factor(width, height, min_side)
+    gray = decode_reduced(data, width, height, image_format, factor)
+    info = {
+        'source_size': (width, height),
+        'decoded_size': (gray.shape[1], gray.shape[0]),
+        'reduction': factor,
+        'crop': None,
+        'text_height': None,
+        'scale': 1.0,
+    }
+
+    region = document_region(gray)
+    if region is not None:
+        x, y, w, h = region
+        gray = gray[y:y + h, x:x + w]
+        info['crop'] = region
+
+    text_height = estimate_text_height(gray)
+    if text_height:
+        info['text_height'] = text_height
+        scale = min(MAX_SCALE, max(MIN_SCALE, target_text_height / text_height))
+        if abs(scale - 1) > 0.15:
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+            info['scale'] = round(scale, 3)
+
+    info['ocr_size'] = (gray.shape[1], gray.shape[0])
+    return binarize(gray), info
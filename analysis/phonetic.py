@@ -0,0 +1,233 @@
+"""
+Phonetic drug-name index for speech transcripts
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+from .normalization import clean_surface_form
+
+PhoneticMatch = namedtuple('PhoneticMatch', 'canonical canonical_id start end text exact')
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Punctuation between two words that ends a span ("motrin, a spirin")
+SPAN_BREAK_PATTERN = re.compile(r'[,.;:!?()\[\]]')
+
+VOWELS = frozenset('aeiou')
+FRONT_VOWELS = frozenset('eiy')
+
+# Transcript words that never start a drug mention
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'also', 'am', 'are', 'as', 'at', 'be', 'but', 'by', 'day', 'daily', 'for', 'i',
+    'i\'m', 'in', 'is', 'it', 'my', 'of', 'on', 'or', 'per', 'take', 'taking', 'the', 'then', 'to',
+    'twice', 'with', 'mg', 'milligrams',
+})
+
+
+def phonetic_key(text):
+    """Metaphone-style consonant skeleton of a word or run-together words
+
+    Spelling variants and homophones share a key, e.g. "warfarin" and
+    "war fair in" both give "WRFRN".
+    """
+    word = ''.join(ch for ch in text.lower() if 'a' <= ch <= 'z')
+    if not word:
+        return ''
+    if word[:2] in ('kn', 'gn', 'pn', 'wr', 'ps'):
+        word = word[1:]
+    if word[0] == 'x':
+        word = 's' + word[1:]
+
+    codes = []
+    length = len(word)
+    for i, ch in enumerate(word):
+        prev = word[i - 1] if i else ''
+        nxt = word[i + 1] if i + 1 < length else ''
+        after = word[i + 2] if i + 2 < length else ''
+
+        if ch == prev and ch != 'c':
+            continue
+        if ch in VOWELS:
+            if i == 0:
+                codes.append('A')
+        elif ch == 'b':
+            if not (prev == 'm' and i == length - 1):
+                codes.append('B')
+        elif ch == 'c':
+            if nxt == 'h' or (nxt == 'i' and after == 'a'):
+                codes.append('X')
+            elif nxt in FRONT_VOWELS:
+                codes.append('S')
+            elif not (prev == 's' and nxt in FRONT_VOWELS):
+                codes.append('K')
+        elif ch == 'd':
+            codes.append('J' if nxt == 'g' and after in FRONT_VOWELS else 'T')
+        elif ch == 'g':
+            if nxt == 'h' and after not in VOWELS:
+                continue
+            if nxt == 'n' and i + 2 >= length:
+                continue
+            if prev == 'd' and nxt in FRONT_VOWELS:
+                continue
+            codes.append('J' if nxt in FRONT_VOWELS else 'K')
+        elif ch == 'h':
+            if nxt in VOWELS and prev not in 'cgpst':
+                codes.append('H')
+        elif ch == 'k':
+            if prev != 'c':
+                codes.append('K')
+        elif ch == 'p':
+            codes.append('F' if nxt == 'h' else 'P')
+        elif ch == 'q':
+            codes.append('K')
+        elif ch == 's':
+            if nxt == 'h' or (nxt == 'i' and after in ('o', 'a')):
+                codes.append('X')
+            else:
+                codes.append('S')
+        elif ch == 't':
+            if nxt == 'i' and after in ('o', 'a'):
+                codes.append('X')
+            elif nxt == 'h':
+                codes.append('0')
+            elif not (nxt == 'c' and after == 'h'):
+                codes.append('T')
+        elif ch == 'v':
+            codes.append('F')
+        elif ch in 'wy':
+            if nxt in VOWELS:
+                codes.append(ch.upper())
+        elif ch == 'x':
+            codes.append('KS')
+        elif ch == 'z':
+            codes.append('S')
+        else:
+            codes.append(ch.upper())
+
+    key = ''.join(codes)
+    # Sounds repeated across a word boundary ("met tor") collapse to one
+    return re.sub(r'(.)\1+', r'\1', key)
+
+
+class PhoneticDrugIndex:
+    """Finds drug mentions in a transcript by spelling or by sound
+
+    Each position of the transcript tries spans of up to ``max_span`` words,
+    so a drug split into homophones ("met for men") is found in the same
+    left-to-right pass as single-word mentions. An exact spelling of any
+    length wins over a sound-alike, and a sound-alike that swallows a
+    stopword is only taken when no shorter one matches.
+    """
+
+    def __init__(self, terms, canonical_ids=None, max_span=4, min_key_length=3, source_version=None):
+        self.min_key_length = min_key_length
+        self.source_version = source_version
+        self._canonical_ids = canonical_ids or {}
+        self._exact = {}
+        self._phonetic = {}
+        max_form_words = 1
+
+        # Canonical spellings claim a key before brand or generic variants that share it
+        terms = sorted(terms, key=lambda term: term[0] != clean_surface_form(term[1]))
+        for form, canonical in terms:
+            if not form:
+                continue
+            self._exact.setdefault(form, canonical)
+            max_form_words = max(max_form_words, len(form.split()))
+            key = phonetic_key(form)
+            if len(key) >= min_key_length:
+                self._phonetic.setdefault(key, canonical)
+
+        self.max_span = max(max_span, max_form_words)
+
+    @classmethod
+    def from_normalizer(cls, normalizer, **kwargs):
+        version = normalizer.version  # read first so a concurrent edit triggers another rebuild
+        canonical_ids = {name: i for i, name in enumerate(normalizer.canonical_names())}
+        return cls(normalizer.surface_forms(), canonical_ids, source_version=version, **kwargs)
+
+    def __len__(self):
+        return len(self._exact)
+
+    def canonical_id(self, canonical):
+        return self._canonical_ids.get(canonical)
+
+    def match_exact(self, words):
+        return self._exact.get(' '.join(words))
+
+    def match_phonetic(self, words):
+        key = phonetic_key(''.join(words))
+        return self._phonetic.get(key) if len(key) >= self.min_key_length else None
+
+    def span_limit(self, text, tokens, i):
+        """Most words a span starting at token ``i`` may cover
+
+        Spans stop at numbers, so a dose is never read as part of a name,
+        and at punctuation between words.
+        """
+        limit = 1
+        while limit < self.max_span and i + limit < len(tokens):
+            word, start, _ = tokens[i + limit]
+            if word.isdigit() or SPAN_BREAK_PATTERN.search(text, tokens[i + limit - 1][2], start):
+                break
+            limit += 1
+        return limit
+
+    def find(self, text):
+        """Return a PhoneticMatch for every drug mentioned in ``text``, with character spans"""
+        tokens = [(m.group(), m.start(), m.end()) for m in WORD_PATTERN.finditer(text.lower())]
+        matches = []
+        i = 0
+        while i < len(tokens):
+            if tokens[i][0] in STOPWORDS or tokens[i][0].isdigit():
+                i += 1
+                continue
+
+            limit = self.span_limit(text, tokens, i)
+            # Longest span that does not run into a stopword
+            plain = next((span for span in range(1, limit) if tokens[i + span][0] in STOPWORDS), limit)
+            attempts = (
+                [(span, True) for span in range(limit, 0, -1)]
+                + [(span, False) for span in range(plain, 0, -1)]
+                + [(span, False) for span in range(limit, plain, -1)]
+            )
+
+            for span, exact in attempts:
+                words = [token[0] for token in tokens[i:i + span]]
+                canonical = self.match_exact(words) if exact else self.match_phonetic(words)
+                if canonical is not None:
+                    start, end = tokens[i][1], tokens[i + span - 1][2]
+                    matches.append(PhoneticMatch(
+                        canonical, self._canonical_ids.get(canonical), start, end, text[start:end], exact
+                    ))
+                    i += span
+                    break
+            else:
+                i += 1
+        return matches
+
+    def stats(self):
+        return {
+            'surface_forms': len(self._exact),
+            'phonetic_keys': len(self._phonetic),
+            'max_span': self.max_span,
+            'source_version': self.source_version,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_phonetic_index():
+    """Return the process-wide phonetic index, rebuilt whenever the name normalizer changes"""
+    global _index
+    from .normalization import get_normalizer
+    normalizer = get_normalizer()
+    if _index is None or _index.source_version != normalizer.version:
+        with _index_lock:
+            if _index is None or _index.source_version != normalizer.version:
+                _index = PhoneticDrugIndex.from_normalizer(normalizer)
+    return _index
@@ -0,0 +1,77 @@
+"""
+Inference precision modes for the causal LM
+"""
+
+import torch
+from torch import nn
+
+PRECISION_MODES = ('auto', 'fp32', 'bf16', 'int8')
+
+
+def bf16_supported():
+    """Check whether bfloat16 matmuls are natively supported on this host"""
+    if torch.cuda.is_available():
+        return torch.cuda.is_bf16_supported()
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_precision(precision):
+    """Map a requested precision to one this host can actually run"""
+    precision = (precision or 'auto').lower()
+    if precision not in PRECISION_MODES:
+        print(f"Warning: unknown LLM precision '{precision}', using auto")
+        precision = 'auto'
+
+    if precision == 'auto':
+        return 'fp16' if torch.cuda.is_available() else 'fp32'
+
+    if precision == 'bf16' and not bf16_supported():
+        print("Warning: bf16 not supported on this host, using fp32")
+        return 'fp32'
+
+    if precision == 'int8' and torch.cuda.is_available():
+        # Dynamic quantization kernels are CPU-only
+        print("Warning: int8 dynamic quantization is CPU-only, using fp16 on CUDA")
+        return 'fp16'
+
+    return precision
+
+
+def load_dtype(precision):
+    """Return the torch dtype to load weights in for a resolved precision"""
+    return {
+        'fp16': torch.float16,
+        'bf16': torch.bfloat16,
+    }.get(precision, torch.float32)
+
+
+def conv1d_to_linear(module):
+    """Replace GPT-2 style Conv1D layers with equivalent nn.Linear layers
+
+    quantize_dynamic only handles nn.Linear, and GPT-2 models implement
+    their attention and MLP projections as transposed Conv1D.
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features, dtype=child.weight.dtype)
+            linear.weight = nn.Parameter(child.weight.detach().t().contiguous(), requires_grad=False)
+            linear.bias = nn.Parameter(child.bias.detach(), requires_grad=False)
+            setattr(module, name, linear)
+        else:
+            conv1d_to_linear(child)
+    return module
+
+
+def apply_precision(model, precision):
+    """Apply post-load transformations for a resolved precision"""
+    if precision != 'int8':
+        return model
+
+    model = conv1d_to_linear(model)
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
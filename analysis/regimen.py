@@ -0,0 +1,117 @@
+"""
+Per-user snapshots of standing medications for incremental interaction checks
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+from .cache import stable_hash
+from .extraction import get_extractor
+from .normalization import get_normalizer
+from .scoring import listed_items
+
+# A user's parsed current medications, the ones the interaction data knows with
+# their drug ids, and the findings among them
+RegimenSnapshot = namedtuple('RegimenSnapshot', 'medications known ids assessment source_digest')
+
+
+def parse_current_medications(text):
+    """Canonical drug names from a free-text current medications field
+
+    Each comma, semicolon or newline separated entry contributes the drugs
+    mentioned in it; an entry without a recognized mention is normalized as a
+    whole, so unknown drugs still show up in the snapshot.
+    """
+    extractor = get_extractor()
+    normalizer = get_normalizer()
+    names = []
+    for entry in listed_items(text):
+        mentions = extractor.find(entry)
+        if mentions:
+            names.extend(mention.canonical for mention in mentions)
+        else:
+            names.append(entry)
+    return normalizer.normalize_list(names)
+
+
+def build_snapshot(text, matrix):
+    """Parse ``text`` and check every pair of it once against ``matrix``"""
+    medications = parse_current_medications(text)
+    known, ids = matrix.regimen_ids(medications)
+    return RegimenSnapshot(medications, known, ids, matrix.assess(known), stable_hash(text))
+
+
+class RegimenSnapshotCache:
+    """LRU of regimen snapshots keyed by user, interaction data and name-table versions
+
+    An entry is rebuilt when the profile text it was parsed from changes, so
+    worker processes that never see the profile save stay correct.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, user_id, text, matrix):
+        """Snapshot of ``text`` for ``user_id``, built against ``matrix`` if not cached"""
+        if user_id is None:
+            return build_snapshot(text, matrix)
+
+        key = (user_id, matrix.index.version, get_normalizer().version)
+        digest = stable_hash(text)
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None and snapshot.source_digest == digest:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return snapshot
+            self._misses += 1
+
+        snapshot = build_snapshot(text, matrix)
+        with self._lock:
+            self._entries[key] = snapshot
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        """Drop every snapshot of a user, e.g. after their profile was saved"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_ratio': round(self._hits / lookups, 3) if lookups else None,
+        }
+
+
+_snapshots = None
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot_cache():
+    """Return the process-wide regimen snapshot cache"""
+    global _snapshots
+    if _snapshots is None:
+        with _snapshots_lock:
+            if _snapshots is None:
+                from django.conf import settings
+                _snapshots = RegimenSnapshotCache(getattr(settings, 'REGIMEN_SNAPSHOT_CACHE_SIZE', 4096))
+    return _snapshots
+
+
+def invalidate_snapshots(user_id):
+    """Drop a user's snapshots in this process, if any have been built"""
+    snapshots = _snapshots
+    if snapshots is not None:
+        snapshots.invalidate(user_id)
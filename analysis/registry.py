@@ -0,0 +1,138 @@
+"""
+Process-wide registry for the warm HuggingFace LLM service
+"""
+
+import resource
+import threading
+import time
+
+
+def current_rss_mb():
+    """Return the resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Not on Linux: fall back to the peak RSS (KB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def memory_breakdown():
+    """Return shared vs private resident memory of this process in MB (Linux only)"""
+    fields = {
+        'Rss': 'rss_mb',
+        'Pss': 'pss_mb',
+        'Shared_Clean': 'shared_clean_mb',
+        'Shared_Dirty': 'shared_dirty_mb',
+        'Private_Clean': 'private_clean_mb',
+        'Private_Dirty': 'private_dirty_mb',
+    }
+    breakdown = {}
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in fields:
+                    breakdown[fields[key]] = round(int(value.split()[0]) / 1024, 1)
+    except (OSError, ValueError):
+        return None
+
+    breakdown['shared_mb'] = round(breakdown.get('shared_clean_mb', 0) + breakdown.get('shared_dirty_mb', 0), 1)
+    breakdown['private_mb'] = round(breakdown.get('private_clean_mb', 0) + breakdown.get('private_dirty_mb', 0), 1)
+    return breakdown
+
+
+class ModelRegistry:
+    """Loads the LLM service once per process and shares it between callers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._llm = None
+        self._stats = {
+            'loaded': False,
+            'load_time_seconds': None,
+            'rss_before_mb': None,
+            'rss_after_mb': None,
+            'model_memory_mb': None,
+            'model_available': False,
+            'loaded_from_local_cache': False,
+            'backend': None,
+            'precision': None,
+            'weights_mmapped': False,
+        }
+
+    def get_llm(self):
+        """Return the shared HuggingFaceLLM, loading it on first use"""
+        llm = self._llm
+        if llm is not None:
+            return llm
+
+        with self._lock:
+            if self._llm is None:
+                self._llm = self._load()
+            return self._llm
+
+    def warm(self):
+        """Load the model eagerly, e.g. at worker start"""
+        self.get_llm()
+        return self.stats()
+
+    def after_fork(self):
+        """Give a forked child its own copies of what a preloaded model holds open
+
+        The weights stay shared; the interaction data watcher thread and the
+        result cache's SQLite connection are recreated in the child.
+        """
+        from .interaction_store import restart_watcher
+
+        self._lock = threading.Lock()
+        restart_watcher()
+        llm = self._llm
+        if llm is not None and llm.result_cache is not None:
+            llm.result_cache.reopen()
+
+    def is_loaded(self):
+        return self._llm is not None
+
+    def stats(self):
+        """Return load time and memory footprint of the shared model"""
+        return {**self._stats, 'memory': memory_breakdown()}
+
+    def _load(self):
+        from .services import HuggingFaceLLM
+
+        rss_before = current_rss_mb()
+        started = time.perf_counter()
+        llm = HuggingFaceLLM()
+        elapsed = time.perf_counter() - started
+        rss_after = current_rss_mb()
+
+        model_memory = llm.backend.memory_mb() if llm.backend is not None else None
+
+        self._stats.update({
+            'loaded': True,
+            'load_time_seconds': round(elapsed, 3),
+            'rss_before_mb': round(rss_before, 1),
+            'rss_after_mb': round(rss_after, 1),
+            'model_memory_mb': round(model_memory, 1) if model_memory is not None else None,
+            'model_available': llm.backend is not None,
+            'backend': llm.backend.describe() if llm.backend is not None else 'rule-based',
+            'loaded_from_local_cache': llm.loaded_from_local_cache,
+            'precision': llm.precision,
+            'weights_mmapped': getattr(llm.backend, 'weights_mmapped', False),
+        })
+
+        print(
+            f"LLM registry: loaded {llm.model_name} in {elapsed:.2f}s "
+            f"(model {self._stats['model_memory_mb']} MB, RSS {rss_before:.0f} -> {rss_after:.0f} MB)"
+        )
+        return llm
+
+
+registry = ModelRegistry()
+
+
+def get_llm():
+    """Return the process-wide HuggingFaceLLM instance"""
+    return registry.get_llm()
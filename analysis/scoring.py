@@ -0,0 +1,97 @@
+"""
+Deterministic 0-100 safety score for an analyzed regimen
+"""
+
+import re
+
+from .interactions import Severity
+from .normalization import get_normalizer
+
+# Points taken off for the first interaction of each severity; one high
+# severity finding alone lands below the dashboard's 60 "danger" threshold
+SEVERITY_PENALTIES = {
+    Severity.HIGH: 45.0,
+    Severity.MODERATE: 25.0,
+    Severity.LOW: 10.0,
+    Severity.UNKNOWN: 15.0,
+}
+
+# Each further finding of the same severity costs this fraction of the previous one
+REPEAT_DECAY = 0.5
+
+# Patient factors that make every interaction riskier, as added multiplier weight
+ELDERLY_AGE = 65
+PEDIATRIC_AGE = 18
+AGE_WEIGHT = 0.2
+CONDITION_WEIGHT = 0.1
+MAX_CONDITIONS = 3
+ALLERGY_WEIGHT = 0.1
+
+# Flat penalty for regimens large enough to count as polypharmacy
+POLYPHARMACY_THRESHOLD = 5
+POLYPHARMACY_PENALTY = 5.0
+
+LIST_SEPARATOR = re.compile(r'[,;\n]+')
+
+
+def listed_items(text):
+    """Non-empty entries of a comma, semicolon or newline separated profile field"""
+    if not text:
+        return []
+    if isinstance(text, (list, tuple)):
+        return [str(item).strip() for item in text if str(item).strip()]
+    return [item.strip() for item in LIST_SEPARATOR.split(str(text)) if item.strip()]
+
+
+def interaction_penalty(severity_counts):
+    """Points lost to interactions, given finding counts indexed by Severity"""
+    penalty = 0.0
+    for severity, count in enumerate(severity_counts):
+        if count:
+            # Geometric series: full weight for the first finding, decaying after
+            penalty += SEVERITY_PENALTIES[Severity(severity)] * (1 - REPEAT_DECAY ** count) / (1 - REPEAT_DECAY)
+    return penalty
+
+
+def risk_factors(user_profile):
+    """(factor, weight) pairs from a patient profile, in a fixed order"""
+    if not user_profile:
+        return []
+
+    factors = []
+    age = user_profile.get('age')
+    if age is not None:
+        if age >= ELDERLY_AGE:
+            factors.append(('elderly', AGE_WEIGHT))
+        elif age < PEDIATRIC_AGE:
+            factors.append(('pediatric', AGE_WEIGHT))
+
+    conditions = listed_items(user_profile.get('chronic_conditions'))
+    if conditions:
+        factors.append(('chronic_conditions', CONDITION_WEIGHT * min(len(conditions), MAX_CONDITIONS)))
+
+    if listed_items(user_profile.get('allergies')):
+        factors.append(('allergies', ALLERGY_WEIGHT))
+    return factors
+
+
+def regimen_size(medications, user_profile=None):
+    """Distinct drugs across the analyzed medications and the patient's current ones"""
+    normalizer = get_normalizer()
+    current = listed_items((user_profile or {}).get('current_medications'))
+    return len(set(normalizer.normalize_list(medications)) | set(normalizer.normalize_list(current)))
+
+
+def safety_score(severity_counts, user_profile=None, medications=()):
+    """Score a regimen from its per-severity finding counts and the patient profile
+
+    100 means no known interactions; the result depends only on its
+    arguments, so it can be cached next to the analysis it belongs to.
+    """
+    multiplier = 1.0 + sum(weight for _, weight in risk_factors(user_profile))
+    penalty = interaction_penalty(severity_counts) * multiplier
+
+    if regimen_size(medications, user_profile) >= POLYPHARMACY_THRESHOLD:
+        penalty += POLYPHARMACY_PENALTY
+
+    return round(max(0.0, 100.0 - penalty), 1)
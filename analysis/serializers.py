@@ -29,6 +29,7 @@ class AnalysisResultSerializer(serializers.Serializer):
     safety_score = serializers.FloatField()
     recommendations = serializers.CharField()
     analysis_type = serializers.CharField()
+    kb_version = serializers.CharField(allow_blank=True)
     conversation_id = serializers.IntegerField(read_only=True)
 
 
@@ -41,6 +42,7 @@ class ConversationHistorySerializer(serializers.Serializer):
     drug_interactions = serializers.JSONField()
     recommendations = serializers.CharField()
     safety_score = serializers.FloatField()
+    kb_version = serializers.CharField(allow_blank=True)
     created_at = serializers.DateTimeField(read_only=True)
     is_favorite = serializers.BooleanField()
     notes = serializers.CharField(allow_blank=True)
@@ -2,26 +2,56 @@
 AI Services for MedAi - Drug Interaction Analysis
 """
 
-import json
 import os
-import torch
-from transformers import pipeline
-import pytesseract
+import re
+import time
 import speech_recognition as sr
-from PIL import Image
-import cv2
-import numpy as np
 from django.conf import settings
 
+from .batching import InferenceBatcher
+from .backends import create_backend
+from .cache import TieredCache, stable_hash
+from .decoding import DEADLINE_MARGIN_SECONDS, deadline_from_budget, get_profile, sentence_end_token_ids
+from .extraction import dosage_after, get_extractor, span_covered
+from .fuzzy import get_fuzzy_matcher
+from .interaction_store import get_interaction_index
+from .interactions import Severity, load_interaction_data
+from .normalization import get_normalizer
+from .ocr_cache import get_ocr_cache
+from .ocr_engine import DEFAULT_PSM, get_ocr_engine
+from .ocr_layout import MAX_BLOCK_LINES, get_block_executor, recognize_blocks, segment_blocks
+from .ocr_preprocess import DECODE_MIN_SIDE, MAX_IMAGE_PIXELS, TARGET_TEXT_HEIGHT, prepare_for_ocr
+from .phonetic import get_phonetic_index
+from .precision import resolve_precision
+from .regimen import get_snapshot_cache
+from .scoring import risk_factors, safety_score
+from .severity_matrix import get_severity_matrix
+
+# Bump when prompt or post-processing changes make cached analyses stale
+ANALYSIS_CACHE_VERSION = 3
+
+# Static start of every analysis prompt; ends before a space so it is a token boundary
+PROMPT_PREFIX = "Analyze drug interactions for:"
+
+# Patient profile fields that influence the analysis
+PROFILE_CACHE_FIELDS = ('age', 'allergies', 'chronic_conditions', 'current_medications')
+
+OCR_WORD_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9-]*[A-Za-z0-9]')
+
 class HuggingFaceLLM:
     """HuggingFace LLM service with fallback to rule-based system"""
     
-    def __init__(self):
-        self.model_name = "microsoft/DialoGPT-medium"
-        self.cache_dir = "./models"
+    def __init__(self, precision=None):
+        self.model_name = getattr(settings, 'LLM_MODEL_NAME', "microsoft/DialoGPT-medium")
+        self.cache_dir = str(getattr(settings, 'LLM_CACHE_DIR', "./models"))
+        self.precision = resolve_precision(precision or getattr(settings, 'LLM_PRECISION', 'auto'))
+        self.backend = None
         self.model = None
         self.tokenizer = None
-        self.drug_interactions = self.load_drug_interactions()
+        self.loaded_from_local_cache = False
+        self.batcher = None
+        self.result_cache = self.create_result_cache()
+        get_interaction_index()  # Load the interaction data and start its reload watcher up front
         
         # Try to initialize the model, fallback to rule-based if it fails
         try:
@@ -29,104 +59,255 @@ class HuggingFaceLLM:
         except Exception as e:
             print(f"Warning: LLM model unavailable, using rule-based system: {e}")
     
+    @property
+    def interaction_index(self):
+        """The interaction index currently being served; replaced when its data is reloaded"""
+        return get_interaction_index()
+    
     def load_drug_interactions(self):
         """Load drug interactions database"""
-        try:
-            with open('drug_interactions.json', 'r') as f:
-                return json.load(f)
-        except:
-            return {
-                "aspirin": {
-                    "warfarin": "HIGH RISK: Increased bleeding risk. Monitor INR closely.",
-                    "ibuprofen": "MODERATE: Increased GI bleeding risk.",
-                    "metformin": "LOW RISK: Generally safe combination."
-                },
-                "warfarin": {
-                    "aspirin": "HIGH RISK: Increased bleeding risk. Monitor INR closely.",
-                    "amoxicillin": "MODERATE: May increase warfarin effect.",
-                    "vitamin_k": "MODERATE: May decrease warfarin effect."
-                },
-                "lisinopril": {
-                    "potassium": "MODERATE: Risk of hyperkalemia.",
-                    "aspirin": "LOW: May reduce antihypertensive effect.",
-                    "metformin": "LOW RISK: Generally safe combination."
-                },
-                "metformin": {
-                    "aspirin": "LOW RISK: Generally safe combination.",
-                    "lisinopril": "LOW RISK: Generally safe combination.",
-                    "alcohol": "MODERATE: Risk of lactic acidosis."
-                }
-            }
+        return load_interaction_data()
     
     def initialize_model(self):
-        """Initialize the HuggingFace model"""
-        from transformers import AutoTokenizer, AutoModelForCausalLM
-        from huggingface_hub import login
+        """Initialize the configured inference backend"""
+        self.backend = create_backend(
+            getattr(settings, 'LLM_BACKEND', 'torch'),
+            self.model_name,
+            self.cache_dir,
+            self.precision,
+            onnx_dir=str(getattr(settings, 'LLM_ONNX_DIR', os.path.join(self.cache_dir, 'onnx'))),
+            num_threads=getattr(settings, 'LLM_NUM_THREADS', 0),
+            mmap_dir=self.mmap_dir() if getattr(settings, 'LLM_WEIGHTS_MMAP', False) else None
+        )
+        self.loaded_from_local_cache = getattr(self.backend, 'loaded_from_local_cache', True)
         
-        # Login to HuggingFace
-        api_key = os.getenv("HUGGINGFACE_API_KEY", "")
-        login(token=api_key)
+        if getattr(settings, 'LLM_PREFIX_CACHE', True):
+            self.backend.prepare_prefix(PROMPT_PREFIX)
         
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # Eager PyTorch objects stay reachable for tooling that needs them directly
+        self.model = getattr(self.backend, 'model', None)
+        self.tokenizer = getattr(self.backend, 'tokenizer', None)
         
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            self.model_name,
-            cache_dir=self.cache_dir
-        )
+        if self.tokenizer is not None:
+            # Decode the vocabulary for the sentence-end stop now rather than inside a request's budget
+            sentence_end_token_ids(self.tokenizer)
         
-        if self.tokenizer.pad_token is None:
-            self.tokenizer.pad_token = self.tokenizer.eos_token
+        if getattr(settings, 'LLM_BATCHING', True):
+            self.batcher = InferenceBatcher(
+                self.backend,
+                max_batch_size=getattr(settings, 'LLM_BATCH_MAX_SIZE', 8),
+                max_wait_ms=getattr(settings, 'LLM_BATCH_MAX_WAIT_MS', 10)
+            )
+    
+    def mmap_dir(self):
+        """Directory holding the safetensors export that is memory-mapped at load"""
+        return os.path.join(str(settings.LLM_MMAP_DIR), self.model_name.replace('/', '--'))
+    
+    def decoding_profile(self, name=None):
+        """Resolve a decoding profile name, defaulting to LLM_DECODING_PROFILE"""
+        name = name or getattr(settings, 'LLM_DECODING_PROFILE', 'fast')
+        return name, get_profile(name)
+    
+    def generation_kwargs(self, profile):
+        """Backend generation arguments for a decoding profile"""
+        return {
+            **profile['generation'],
+            'stop_at_sentence_end': profile['stop_at_sentence_end'],
+            'min_new_tokens': profile['min_new_tokens'],
+        }
+    
+    def request_deadline(self, profile):
+        """Wall-clock deadline for a request, from LLM_LATENCY_BUDGET_MS or the profile budget"""
+        budget_ms = getattr(settings, 'LLM_LATENCY_BUDGET_MS', 0) or profile['budget_ms']
+        return deadline_from_budget(budget_ms)
+    
+    def create_result_cache(self):
+        """Create the analysis result cache, if enabled"""
+        if not getattr(settings, 'LLM_RESULT_CACHE', True):
+            return None
         
-        self.model = AutoModelForCausalLM.from_pretrained(
-            self.model_name,
-            cache_dir=self.cache_dir,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
-        ).to(device)
+        return TieredCache(
+            'analysis',
+            path=getattr(settings, 'LLM_RESULT_CACHE_PATH', None),
+            max_entries=getattr(settings, 'LLM_RESULT_CACHE_SIZE', 1024),
+            ttl_seconds=getattr(settings, 'LLM_RESULT_CACHE_TTL', 86400)
+        )
+    
+    def model_version(self):
+        """Identify the engine that produced an analysis"""
+        engine = f"{self.model_name}:{self.backend.describe()}" if self.backend is not None else 'rule-based'
+        return f"{engine}:v{ANALYSIS_CACHE_VERSION}"
     
-    def analyze_drug_interactions(self, medications, user_profile=None):
-        """Analyze drug interactions"""
+    def result_cache_key(self, medications, user_profile=None, profile_name='', kb_version=''):
+        """Build an order-independent cache key for a regimen, patient profile and data version"""
+        regimen = sorted({' '.join(med.lower().split()) for med in medications if med.strip()})
+        profile = {
+            field: (user_profile or {}).get(field) for field in PROFILE_CACHE_FIELDS
+        } if user_profile else None
+        
+        return f"{self.model_version()}:{profile_name}:{kb_version}|{'+'.join(regimen)}|{stable_hash(profile)}"
+    
+    def analyze_drug_interactions(self, medications, user_profile=None, profile=None, deadline=None):
+        """Analyze drug interactions
+        
+        Returns a dict with the analyzed medications, the structured
+        interaction findings, recommendations text, a 0-100 safety score and
+        the version of the interaction data used.
+        ``profile`` names a decoding profile; ``deadline`` is a time.monotonic()
+        value after which the LLM output is cut short and merged with the
+        rule-based findings.
+        """
+        medications = get_normalizer().normalize_list(medications)
+        profile_name, decoding = self.decoding_profile(profile)
+        if deadline is None:
+            deadline = self.request_deadline(decoding)
+        
+        # Held for the whole request so a reload mid-analysis can't mix data versions
+        matrix = get_severity_matrix()
+        
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache_key(medications, user_profile, profile_name, matrix.index.version)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        # One pass over the regimen yields both the findings and the score inputs
+        assessment = self.assess_regimen(matrix, medications, user_profile)
+        
+        cut_short = False
         try:
-            if self.model and self.tokenizer:
-                return self._llm_analysis(medications, user_profile)
+            if self.backend is not None:
+                recommendations, cut_short = self._llm_analysis(
+                    medications, user_profile, profile_name, decoding, deadline
+                )
             else:
-                return self._rule_based_analysis(medications)
-        except Exception as e:
-            return self._rule_based_analysis(medications)
-    
-    def _llm_analysis(self, medications, user_profile):
-        """Use LLM for analysis"""
-        prompt = f"Analyze drug interactions for: {', '.join(medications)}. Provide warnings and recommendations:"
-        
-        inputs = self.tokenizer.encode(prompt, return_tensors="pt")
-        device = next(self.model.parameters()).device
-        inputs = inputs.to(device)
-        
-        with torch.no_grad():
-            outputs = self.model.generate(
-                inputs,
-                max_length=inputs.shape[1] + 150,
-                temperature=0.7,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id
+                recommendations = self._rule_based_analysis(medications, assessment.findings)
+        except Exception:
+            recommendations = self._rule_based_analysis(medications, assessment.findings)
+            return self.cache_result(
+                cache_key, self.build_result(medications, assessment, recommendations, user_profile), degraded=True
             )
         
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        return response[len(prompt):].strip()
+        if cut_short:
+            # Generation was cut by a latency budget; fill in the rule-based findings it did not reach
+            recommendations = self._merge_with_rule_based(medications, recommendations, assessment.findings)
+        
+        return self.cache_result(
+            cache_key, self.build_result(medications, assessment, recommendations, user_profile), degraded=cut_short
+        )
+    
+    def cache_result(self, cache_key, result, degraded=False):
+        """Store an analysis result and return it
+        
+        Degraded results (rule-based fallbacks, answers cut short by a
+        deadline) are kept only for LLM_DEGRADED_RESULT_TTL seconds: long
+        enough that a burst of identical requests does not retry a failing or
+        overloaded model, short enough that the full answer replaces them soon.
+        """
+        if cache_key is None:
+            return result
+        if degraded:
+            ttl = getattr(settings, 'LLM_DEGRADED_RESULT_TTL', 60)
+            if ttl > 0:
+                self.result_cache.set(cache_key, result, ttl_seconds=ttl)
+        else:
+            self.result_cache.set(cache_key, result)
+        return result
+    
+    def assess_regimen(self, matrix, medications, user_profile=None):
+        """Check a regimen, together with the patient's standing medications when known
+        
+        The standing medications come from a cached per-user snapshot, so only
+        pairs involving the requested drugs are looked up.
+        """
+        current = (user_profile or {}).get('current_medications')
+        if not current:
+            return matrix.assess(medications)
+        
+        snapshot = get_snapshot_cache().get(user_profile.get('user_id'), current, matrix)
+        return matrix.assess_added(medications, snapshot.known, snapshot.ids, snapshot.assessment)
+    
+    def build_result(self, medications, assessment, recommendations, user_profile=None):
+        """Assemble the JSON-serializable analysis result for a regimen"""
+        return {
+            'medications_analyzed': medications,
+            'drug_interactions': {
+                'findings': [
+                    {
+                        'drugs': [finding.drug_a, finding.drug_b],
+                        'severity': Severity(finding.severity).name.lower(),
+                        'message': finding.message,
+                    }
+                    for finding in assessment.findings
+                ],
+                'severity_counts': {
+                    severity.name.lower(): assessment.severity_counts[severity] for severity in Severity
+                },
+                'risk_factors': [factor for factor, _ in risk_factors(user_profile)],
+            },
+            'recommendations': recommendations,
+            'safety_score': safety_score(assessment.severity_counts, user_profile, medications),
+            'kb_version': assessment.kb_version,
+        }
+    
+    def rule_based_result(self, medications, user_profile=None):
+        """Analysis result from the interaction rules alone, without generation"""
+        medications = get_normalizer().normalize_list(medications)
+        assessment = self.assess_regimen(get_severity_matrix(), medications, user_profile)
+        recommendations = self._rule_based_analysis(medications, assessment.findings)
+        return self.build_result(medications, assessment, recommendations, user_profile)
+    
+    def _merge_with_rule_based(self, medications, partial, findings=None):
+        """Combine rule-based findings with LLM output that hit the deadline"""
+        result = self._rule_based_analysis(medications, findings)
+        if partial:
+            result += f"\n\nAI notes (shortened to meet the response time budget):\n{partial}"
+        return result
+    
+    def build_prompt(self, medications):
+        """Build the analysis prompt for a medication list"""
+        return f"{PROMPT_PREFIX} {', '.join(medications)}. Provide warnings and recommendations:"
+    
+    def stream_analysis(self, medications, user_profile=None, profile=None, deadline=None):
+        """Yield generated text chunks as the model produces them"""
+        if self.backend is None:
+            return
+        
+        _, decoding = self.decoding_profile(profile)
+        yield from self.backend.stream(
+            self.build_prompt(get_normalizer().normalize_list(medications)),
+            deadline=deadline or self.request_deadline(decoding),
+            **self.generation_kwargs(decoding)
+        )
+    
+    def _llm_analysis(self, medications, user_profile, profile_name, decoding, deadline):
+        """Use LLM for analysis, returning (text, whether a deadline cut it short)"""
+        prompt = self.build_prompt(medications)
+        generation = self.generation_kwargs(decoding)
+        
+        # Concurrent requests share one batched generate call, which may stop at another request's deadline
+        if self.batcher is not None:
+            return self.batcher.submit(prompt, profile_name, generation, deadline)
+        
+        text = self.backend.generate([prompt], deadline=deadline, **generation)[0]
+        return text, time.monotonic() >= deadline - DEADLINE_MARGIN_SECONDS
     
-    def _rule_based_analysis(self, medications):
-        """Fallback rule-based analysis"""
+    def _rule_based_analysis(self, medications, findings=None):
+        """Fallback rule-based analysis
+        
+        ``findings`` are reused when the caller has already checked the regimen.
+        """
         if not medications:
             return "No medications provided for analysis."
         
-        medications = [med.lower().strip() for med in medications]
-        warnings = []
-        
-        for i, med1 in enumerate(medications):
-            for med2 in medications[i+1:]:
-                if med1 in self.drug_interactions:
-                    if med2 in self.drug_interactions[med1]:
-                        warning = f"{med1.title()} + {med2.title()}: {self.drug_interactions[med1][med2]}"
-                        warnings.append(warning)
+        medications = get_normalizer().normalize_list(medications)
+        if findings is None:
+            findings = get_severity_matrix().check(medications)
+        warnings = [
+            f"{finding.drug_a.title()} + {finding.drug_b.title()}: {finding.message}"
+            for finding in findings
+        ]
         
         if warnings:
             result = "Drug Interaction Analysis:\n\n" + "\n".join(warnings)
@@ -141,64 +322,148 @@ class OCRService:
     """OCR service for extracting text from prescription images"""
     
     def __init__(self):
-        self.tesseract_available = self.check_tesseract()
+        self.engine = get_ocr_engine()
+        self.tesseract_available = self.engine is not None
+        self.cache = get_ocr_cache()
     
     def check_tesseract(self):
-        """Check if Tesseract is available"""
-        try:
-            pytesseract.get_tesseract_version()
-            return True
-        except:
-            return False
+        """Check if Tesseract is available (probed once per process)"""
+        return get_ocr_engine() is not None
+    
+    def prepare(self, data):
+        """Decode, crop and rescale an upload, returning (binary image, preprocessing info)"""
+        return prepare_for_ocr(
+            data,
+            max_pixels=getattr(settings, 'OCR_MAX_IMAGE_PIXELS', MAX_IMAGE_PIXELS),
+            min_side=getattr(settings, 'OCR_DECODE_MIN_SIDE', DECODE_MIN_SIDE),
+            target_text_height=getattr(settings, 'OCR_TARGET_TEXT_HEIGHT', TARGET_TEXT_HEIGHT)
+        )
     
     def extract_text_from_image(self, image_file):
-        """Extract text from prescription image"""
+        """Extract text from a prescription image path or open file"""
+        if hasattr(image_file, 'read'):
+            data = image_file.read()
+        else:
+            with open(image_file, 'rb') as f:
+                data = f.read()
+        return self.extract_text_from_bytes(data)
+    
+    def extract_text_from_bytes(self, data):
+        """Extract text from an encoded prescription image held in memory"""
         if not self.tesseract_available:
             return "OCR service unavailable - Tesseract not installed"
         
         try:
-            # Open and preprocess image
-            image = Image.open(image_file)
-            
-            # Convert to OpenCV format for preprocessing
-            cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-            
-            # Apply preprocessing
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            thresh = cv2.adaptiveThreshold(
-                blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-            )
-            
-            # Extract text
-            custom_config = r'--oem 3 --psm 6'
-            text = pytesseract.image_to_string(thresh, config=custom_config)
-            
-            return text.strip()
-            
+            return self._recognize_bytes(data)
         except Exception as e:
             return f"OCR error: {str(e)}"
     
-    def extract_medications(self, ocr_text):
-        """Extract medication names from OCR text"""
-        import re
+    def _recognize_bytes(self, data):
+        """OCR text of an encoded image; raises on failure so errors are never cached"""
+        thresh, info = self.prepare(data)
         
-        # Common medication patterns
-        patterns = [
-            r'(\w+)\s+(\d+(?:\.\d+)?\s*mg)',  # Name + dosage
-            r'\d+\.\s*([A-Za-z]+(?:\s+[A-Za-z]+)?)\s+(\d+(?:\.\d+)?\s*mg)',  # Number. Name dosage
-        ]
+        if getattr(settings, 'OCR_PARALLEL_BLOCKS', True):
+            # Recognize columns and paragraphs side by side instead of the page as one block
+            text_height = info['text_height'] * info['scale'] if info['text_height'] else None
+            blocks = segment_blocks(
+                thresh, text_height, max_lines=getattr(settings, 'OCR_BLOCK_MAX_LINES', MAX_BLOCK_LINES)
+            )
+            if len(blocks) > 1:
+                return recognize_blocks(self.engine, thresh, blocks, get_block_executor(), DEFAULT_PSM)
         
-        medications = []
-        for pattern in patterns:
-            matches = re.findall(pattern, ocr_text, re.IGNORECASE)
-            for match in matches:
-                if isinstance(match, tuple):
-                    med_name = match[0].strip()
-                    dosage = match[1].strip() if len(match) > 1 else ""
-                    medications.append(f"{med_name} {dosage}")
-        
-        return list(set(medications))
+        # Extract text with the warm engine
+        return self.engine.recognize(thresh, psm=DEFAULT_PSM).strip()
+    
+    def recognize(self, data):
+        """OCR text and medications of an encoded image, served from the OCR cache when possible
+        
+        Returns a dict with ``ocr_text``, ``medications``, ``medication_matches``
+        and ``cache`` ('exact', 'near' or None).
+        """
+        if not self.tesseract_available:
+            ocr_text = "OCR service unavailable - Tesseract not installed"
+            return self._ocr_result(ocr_text, self.match_medications(ocr_text), None)
+        
+        if self.cache is None:
+            ocr_text = self.extract_text_from_bytes(data)
+            return self._ocr_result(ocr_text, self.match_medications(ocr_text), None)
+        
+        kb_version = get_interaction_index().version
+        cached, status, digest, fingerprint = self.cache.lookup(data)
+        if cached is not None:
+            matches = cached['medication_matches']
+            if cached['kb_version'] != kb_version:
+                # The drug vocabulary changed since this was cached; only the OCR text is reusable
+                matches = self.match_medications(cached['ocr_text'])
+            return self._ocr_result(cached['ocr_text'], matches, status)
+        
+        try:
+            ocr_text = self._recognize_bytes(data)
+        except Exception as e:
+            ocr_text = f"OCR error: {str(e)}"
+            return self._ocr_result(ocr_text, self.match_medications(ocr_text), None)
+        
+        matches = self.match_medications(ocr_text)
+        self.cache.store(digest, fingerprint, {
+            'ocr_text': ocr_text,
+            'medication_matches': matches,
+            'kb_version': kb_version,
+        })
+        return self._ocr_result(ocr_text, matches, None)
+    
+    def _ocr_result(self, ocr_text, matches, cache_status):
+        return {
+            'ocr_text': ocr_text,
+            'medications': [f"{med['name']} {med['dosage']}".strip() for med in matches],
+            'medication_matches': matches,
+            'cache': cache_status,
+        }
+    
+    def match_medications(self, ocr_text):
+        """Match medication mentions in OCR text against known drug names
+        
+        Returns dicts with the OCR text, canonical name, dosage, match
+        confidence and a ``flagged`` marker for low-confidence matches.
+        """
+        mentions = get_extractor().find(ocr_text)
+        found = {}
+        for mention in mentions:
+            found.setdefault(mention.canonical, {
+                'text': mention.text,
+                'name': mention.canonical,
+                'dosage': mention.dosage,
+                'confidence': 1.0,
+                'flagged': False,
+            })
+        
+        # Words the automaton did not recognise may be OCR-garbled names
+        matcher = get_fuzzy_matcher()
+        starts = [mention.start for mention in mentions]
+        for token in OCR_WORD_PATTERN.finditer(ocr_text):
+            word = token.group()
+            if len(word) < 4 or word.isdigit() or span_covered(mentions, starts, token.start(), token.end()):
+                continue
+            
+            dosage = dosage_after(ocr_text, token.end())
+            match = matcher.lookup(word)
+            # Low-confidence matches keep the OCR text so nothing is silently renamed
+            confident = match is not None and not match.flagged
+            if not confident and not dosage:
+                continue
+            name = match.canonical if confident else word.lower()
+            found.setdefault(name, {
+                'text': word,
+                'name': name,
+                'dosage': dosage,
+                'confidence': match.confidence if match is not None else 0.0,
+                'flagged': not confident,
+            })
+        
+        return list(found.values())
+    
+    def extract_medications(self, ocr_text):
+        """Extract medication names from OCR text"""
+        return [f"{med['name']} {med['dosage']}".strip() for med in self.match_medications(ocr_text)]
 
 class SpeechService:
     """Speech-to-text service for voice input"""
@@ -235,6 +500,48 @@ class SpeechService:
         except Exception as e:
             return f"Audio processing error: {e}"
     
+    def match_medications(self, transcribed_text):
+        """Find drug mentions by spelling or sound, with their character spans and dosage"""
+        phonetic_index = get_phonetic_index()
+        mentions = get_extractor().find(transcribed_text)
+        matches = [
+            {
+                'name': mention.canonical,
+                'id': phonetic_index.canonical_id(mention.canonical),
+                'text': mention.text,
+                'start': mention.start,
+                'end': mention.end,
+                'dosage': mention.dosage,
+                'exact': True,
+            }
+            for mention in mentions
+        ]
+        
+        # Homophones and split words the spelled-out names missed
+        starts = [mention.start for mention in mentions]
+        for match in phonetic_index.find(transcribed_text):
+            if span_covered(mentions, starts, match.start, match.end):
+                continue
+            matches.append({
+                'name': match.canonical,
+                'id': match.canonical_id,
+                'text': match.text,
+                'start': match.start,
+                'end': match.end,
+                'dosage': dosage_after(transcribed_text, match.end),
+                'exact': match.exact,
+            })
+        
+        return sorted(matches, key=lambda match: match['start'])
+    
+    def extract_medications(self, transcribed_text):
+        """Find known medication names in transcribed text"""
+        medications = []
+        for match in self.match_medications(transcribed_text):
+            if match['name'] not in medications:
+                medications.append(match['name'])
+        return medications
+    
     def record_and_transcribe(self, duration=5):
         """Record audio from microphone and transcribe"""
         if not self.microphone_available:
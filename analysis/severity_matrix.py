@@ -0,0 +1,222 @@
+"""
+Vectorized pairwise severity lookups for large regimens
+"""
+
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from .interaction_store import MappedInteractionStore
+from .interactions import Finding, Severity
+
+# Vocabularies up to this many drugs get a dense n x n matrix (1 byte per cell)
+DENSE_DRUG_LIMIT = 4096
+
+# Findings of one regimen, how many fall in each Severity, and the data version they came from
+Assessment = namedtuple('Assessment', 'findings severity_counts kb_version')
+
+
+class SeverityMatrix:
+    """Severity of every drug pair, gathered for a whole regimen in one NumPy operation
+
+    Small vocabularies keep a dense uint8 matrix holding severity + 1 (0 means
+    no interaction), so a regimen is one submatrix gather. Larger ones keep
+    the sorted pair keys and resolve every pair of a regimen, or of a whole
+    batch of regimens, with a single searchsorted call.
+    """
+
+    def __init__(self, index, dense_limit=DENSE_DRUG_LIMIT):
+        self.index = index
+        if isinstance(index, MappedInteractionStore):
+            # Views onto the mapped file; nothing is copied
+            self._keys = np.frombuffer(index.key_buffer(), dtype='<u8')
+            self._severities = np.frombuffer(index.severity_buffer(), dtype=np.uint8)
+            self._interaction_at = index.interaction_at
+        else:
+            pairs = index.sorted_pairs()
+            interactions = [interaction for _, interaction in pairs]
+            self._keys = np.fromiter((key for key, _ in pairs), dtype=np.uint64, count=len(pairs))
+            self._severities = np.fromiter(
+                (int(interaction.severity) for interaction in interactions), dtype=np.uint8, count=len(pairs)
+            )
+            self._interaction_at = interactions.__getitem__
+
+        self._dense = None
+        if index.drug_count <= dense_limit:
+            low = (self._keys >> np.uint64(32)).astype(np.intp)
+            high = (self._keys & np.uint64(0xFFFFFFFF)).astype(np.intp)
+            dense = np.zeros((index.drug_count, index.drug_count), dtype=np.uint8)
+            dense[low, high] = self._severities + 1
+            dense[high, low] = self._severities + 1
+            self._dense = dense
+
+    @property
+    def is_dense(self):
+        return self._dense is not None
+
+    def regimen_ids(self, medications):
+        """Known medications of a regimen and their drug ids"""
+        known = []
+        ids = []
+        for med in medications:
+            drug_id = self.index.drug_id(med)
+            if drug_id is not None:
+                known.append(med)
+                ids.append(drug_id)
+        return known, np.asarray(ids, dtype=np.int64)
+
+    def _pair_positions(self, keys):
+        """Position of each key in the sorted key array, or -1 if absent"""
+        positions = np.searchsorted(self._keys, keys)
+        positions[positions == len(self._keys)] = 0
+        found = self._keys[positions] == keys if len(self._keys) else np.zeros(len(keys), dtype=bool)
+        return np.where(found, positions, -1)
+
+    def _keys_for(self, ids, rows, columns):
+        a = ids[rows].astype(np.uint64)
+        b = ids[columns].astype(np.uint64)
+        return (np.minimum(a, b) << np.uint64(32)) | np.maximum(a, b)
+
+    def regimen_pairs(self, ids):
+        """(row, column, severity) of every interacting pair among ``ids``, most severe first"""
+        if self._dense is not None:
+            block = self._dense[ids[:, None], ids]
+            rows, columns = np.nonzero(block)
+            upper = rows < columns
+            rows, columns = rows[upper], columns[upper]
+            severities = block[rows, columns].astype(np.int16) - 1
+        else:
+            rows, columns = np.triu_indices(len(ids), 1)
+            positions = self._pair_positions(self._keys_for(ids, rows, columns))
+            hit = positions >= 0
+            rows, columns = rows[hit], columns[hit]
+            severities = self._severities[positions[hit]].astype(np.int16)
+
+        if len(rows) < 2:
+            return rows, columns, severities
+        # Most severe first, input order within a severity
+        order = np.lexsort((columns, rows, -severities))
+        return rows[order], columns[order], severities[order]
+
+    def _findings(self, known, ids, rows, columns):
+        if not len(rows):
+            return []
+        positions = self._pair_positions(self._keys_for(ids, rows, columns))
+        findings = []
+        for row, column, position in zip(rows.tolist(), columns.tolist(), positions.tolist()):
+            interaction = self._interaction_at(position)
+            findings.append(Finding(known[row], known[column], interaction.severity, interaction.message))
+        return findings
+
+    def check(self, medications):
+        """Return a Finding for every interacting pair in a regimen, most severe first"""
+        return self.assess(medications).findings
+
+    def assess(self, medications):
+        """Findings of a regimen and their per-severity counts, from the same gather"""
+        known, ids = self.regimen_ids(medications)
+        rows, columns, severities = self.regimen_pairs(ids)
+        counts = np.bincount(severities, minlength=len(Severity)).tolist()
+        return Assessment(self._findings(known, ids, rows, columns), counts, self.index.version)
+
+    def _candidate_hits(self, ids, rows, columns):
+        """Keep the candidate pairs (ids[rows], ids[columns]) that interact, with their severities"""
+        if self._dense is not None:
+            cells = self._dense[ids[rows], ids[columns]]
+            hit = cells > 0
+            return rows[hit], columns[hit], cells[hit].astype(np.int16) - 1
+        positions = self._pair_positions(self._keys_for(ids, rows, columns))
+        hit = positions >= 0
+        return rows[hit], columns[hit], self._severities[positions[hit]].astype(np.int16)
+
+    def assess_added(self, medications, base_known, base_ids, base_assessment):
+        """Assess ``medications`` added to a regimen that has already been assessed
+
+        Only pairs involving an added drug are looked up, k * n + k * (k - 1) / 2
+        of them for k added and n base drugs; the base findings are reused.
+        """
+        base = set(base_known)
+        known, ids = self.regimen_ids([med for med in medications if med not in base])
+        added, existing = len(ids), len(base_ids)
+        all_known = known + list(base_known)
+        all_ids = np.concatenate((ids, base_ids)).astype(np.int64)
+
+        triangle_rows, triangle_columns = np.triu_indices(added, 1)
+        rows = np.concatenate((triangle_rows, np.repeat(np.arange(added), existing)))
+        columns = np.concatenate((triangle_columns, np.tile(np.arange(existing), added) + added))
+        rows, columns, severities = self._candidate_hits(all_ids, rows, columns)
+
+        order = np.lexsort((columns, rows, -severities))
+        findings = self._findings(all_known, all_ids, rows[order], columns[order])
+        # Stable sort: within a severity, findings about the added drugs come first
+        findings = sorted(findings + list(base_assessment.findings), key=lambda finding: -finding.severity)
+        counts = np.bincount(severities, minlength=len(Severity)) + np.asarray(base_assessment.severity_counts)
+        return Assessment(findings, counts.tolist(), self.index.version)
+
+    def check_batch(self, regimens):
+        """Findings for many regimens, resolved with one key search over all their pairs"""
+        resolved = [self.regimen_ids(medications) for medications in regimens]
+        triangles = [np.triu_indices(len(ids), 1) for _, ids in resolved]
+        counts = np.array([len(rows) for rows, _ in triangles], dtype=np.int64)
+        if not counts.sum():
+            return [[] for _ in regimens]
+
+        regimen_of_pair = np.repeat(np.arange(len(regimens)), counts)
+        rows = np.concatenate([rows for rows, _ in triangles])
+        columns = np.concatenate([columns for _, columns in triangles])
+        offsets = np.repeat(np.cumsum(np.concatenate(([0], [len(ids) for _, ids in resolved[:-1]]))), counts)
+        all_ids = np.concatenate([ids for _, ids in resolved])
+
+        if self._dense is not None:
+            # One gather over every pair of every regimen
+            cells = self._dense[all_ids[rows + offsets], all_ids[columns + offsets]]
+            hit = cells > 0
+            regimen_of_pair, rows, columns, offsets = (
+                regimen_of_pair[hit], rows[hit], columns[hit], offsets[hit]
+            )
+            severities = cells[hit].astype(np.int16) - 1
+            positions = self._pair_positions(self._keys_for(all_ids, rows + offsets, columns + offsets))
+        else:
+            positions = self._pair_positions(self._keys_for(all_ids, rows + offsets, columns + offsets))
+            hit = positions >= 0
+            regimen_of_pair, rows, columns, positions = (
+                regimen_of_pair[hit], rows[hit], columns[hit], positions[hit]
+            )
+            severities = self._severities[positions].astype(np.int16)
+
+        # Group by regimen, most severe first, input order within a severity
+        order = np.lexsort((columns, rows, -severities, regimen_of_pair))
+        results = [[] for _ in regimens]
+        for regimen, row, column, position in zip(
+            regimen_of_pair[order].tolist(), rows[order].tolist(), columns[order].tolist(), positions[order].tolist()
+        ):
+            known = resolved[regimen][0]
+            interaction = self._interaction_at(position)
+            results[regimen].append(Finding(known[row], known[column], interaction.severity, interaction.message))
+        return results
+
+    def stats(self):
+        return {
+            'mode': 'dense' if self.is_dense else 'sorted-keys',
+            'kb_version': self.index.version,
+            'drugs': self.index.drug_count,
+            'pairs': len(self._keys),
+            'dense_bytes': self._dense.nbytes if self._dense is not None else 0,
+        }
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def get_severity_matrix():
+    """Return the process-wide severity matrix for the current interaction index"""
+    global _matrix
+    from .interaction_store import get_interaction_index
+    index = get_interaction_index()
+    if _matrix is None or _matrix.index is not index:
+        with _matrix_lock:
+            if _matrix is None or _matrix.index is not index:
+                _matrix = SeverityMatrix(index)
+    return _matrix
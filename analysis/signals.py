@@ -0,0 +1,29 @@
+"""
+Keep in-memory drug indexes and regimen snapshots in step with model edits
+"""
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import DrugDatabase
+
+from .normalization import invalidate_normalizer
+from .regimen import invalidate_snapshots
+
+
+# Other processes notice DrugDatabase edits through get_normalizer()'s periodic check
+@receiver(post_save, sender=DrugDatabase)
+def drug_saved(sender, instance, **kwargs):
+    invalidate_normalizer()
+
+
+@receiver(post_delete, sender=DrugDatabase)
+def drug_deleted(sender, instance, **kwargs):
+    invalidate_normalizer()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, **kwargs):
+    # Other processes notice the changed profile text on their next lookup
+    invalidate_snapshots(instance.pk)
@@ -1 +1,309 @@
-# Create your tests here.
+"""
+Behaviour tests for the drug name, interaction and scoring components
+
+These build their indexes from in-memory data, so they need neither a
+database nor the models: run with `python manage.py test analysis` or
+`python -m unittest analysis.tests`.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from unittest import TestCase, mock
+
+from .extraction import MedicationExtractor
+from .fuzzy import FuzzyDrugMatcher
+from .interaction_store import InteractionIndexWatcher, MappedInteractionStore, build_interaction_store
+from .interactions import DEFAULT_INTERACTIONS, InteractionIndex, Severity, content_version
+from .normalization import BUILTIN_SYNONYMS, DrugNameNormalizer
+from .phonetic import PhoneticDrugIndex, phonetic_key
+from .scoring import POLYPHARMACY_PENALTY, safety_score
+from .severity_matrix import SeverityMatrix
+
+DrugRow = namedtuple('DrugRow', 'pk name generic_name brand_names')
+
+VOCABULARY = ('aspirin', 'warfarin', 'metformin', 'lisinopril', 'ibuprofen', 'amoxicillin', 'potassium')
+
+# Enough drugs and pairs that the dense and sorted-key paths both have work to do
+LARGE_INTERACTIONS = {
+    f"drug{i}": {
+        f"drug{(i * 7 + step) % 60}": f"{('HIGH RISK', 'MODERATE', 'LOW')[step % 3]}: pair {i}/{step}"
+        for step in range(1, 5)
+    }
+    for i in range(60)
+}
+
+
+def make_normalizer():
+    return DrugNameNormalizer(VOCABULARY, BUILTIN_SYNONYMS)
+
+
+def finding_set(findings):
+    """Findings as an order-free set of (unordered pair, severity, message)"""
+    return {(frozenset((f.drug_a, f.drug_b)), f.severity, f.message) for f in findings}
+
+
+class DrugNameNormalizerTests(TestCase):
+    def test_brand_names_and_strengths_map_to_the_generic(self):
+        normalizer = make_normalizer()
+        self.assertEqual(normalizer.normalize('Glucophage 500 mg tablets'), 'metformin')
+        self.assertEqual(normalizer.normalize('COUMADIN'), 'warfarin')
+        self.assertEqual(normalizer.normalize('Advil 200mg'), 'ibuprofen')
+
+    def test_digits_in_a_drug_name_are_kept(self):
+        normalizer = make_normalizer()
+        self.assertEqual(normalizer.normalize('5-Fluorouracil 500 mg'), '5-fluorouracil')
+        self.assertEqual(normalizer.normalize('6-mercaptopurine'), '6-mercaptopurine')
+
+    def test_normalize_list_drops_duplicates_and_keeps_order(self):
+        normalizer = make_normalizer()
+        self.assertEqual(
+            normalizer.normalize_list(['Coumadin', 'aspirin', 'warfarin sodium', '', 'Bayer']),
+            ['warfarin', 'aspirin']
+        )
+
+    def test_database_rows_are_added_replaced_and_removed(self):
+        normalizer = make_normalizer()
+        version = normalizer.version
+
+        normalizer.update_drug(DrugRow(1, 'Sertraline', 'sertraline', ['Zoloft']))
+        self.assertEqual(normalizer.normalize('zoloft'), 'sertraline')
+        self.assertGreater(normalizer.version, version)
+
+        normalizer.update_drug(DrugRow(1, 'Sertraline', 'sertraline', ['Lustral']))
+        self.assertEqual(normalizer.normalize('lustral'), 'sertraline')
+        self.assertIsNone(normalizer.canonical('zoloft'))
+
+        normalizer.remove_drug(1)
+        self.assertIsNone(normalizer.canonical('lustral'))
+
+    def test_removing_a_row_keeps_builtin_synonyms(self):
+        normalizer = make_normalizer()
+        normalizer.update_drug(DrugRow(2, 'Warfarin', 'warfarin', ['Coumadin', 'Marevan']))
+        normalizer.remove_drug(2)
+        self.assertEqual(normalizer.normalize('coumadin'), 'warfarin')
+        self.assertIsNone(normalizer.canonical('marevan'))
+
+    def test_replace_rows_swaps_the_whole_table(self):
+        normalizer = make_normalizer()
+        normalizer.load_rows([DrugRow(1, 'Sertraline', 'sertraline', ['Zoloft'])])
+        version = normalizer.version
+
+        normalizer.replace_rows([DrugRow(2, 'Atorvastatin', 'atorvastatin', ['Lipitor'])])
+        self.assertIsNone(normalizer.canonical('zoloft'))
+        self.assertEqual(normalizer.normalize('lipitor'), 'atorvastatin')
+        self.assertGreater(normalizer.version, version)
+
+
+class MedicationExtractorTests(TestCase):
+    def setUp(self):
+        self.extractor = MedicationExtractor.from_normalizer(make_normalizer())
+
+    def test_finds_mentions_with_offsets_and_dosage(self):
+        text = "Rx: Glucophage 500 mg twice daily, Coumadin 5mg."
+        mentions = self.extractor.find(text)
+        self.assertEqual([m.canonical for m in mentions], ['metformin', 'warfarin'])
+        self.assertEqual([text[m.start:m.end] for m in mentions], ['Glucophage', 'Coumadin'])
+        self.assertEqual([m.dosage for m in mentions], ['500 mg', '5mg'])
+
+    def test_leftmost_longest_multi_word_match(self):
+        mentions = self.extractor.find("Potassium  Chloride, 20 mEq")
+        self.assertEqual(len(mentions), 1)
+        self.assertEqual(mentions[0].canonical, 'potassium')
+        self.assertEqual(mentions[0].text, 'Potassium  Chloride')
+
+    def test_only_whole_words_match(self):
+        self.assertEqual(self.extractor.find("aspirinate and preaspirin"), [])
+        self.assertEqual([m.canonical for m in self.extractor.find("(aspirin)")], ['aspirin'])
+
+
+class PhoneticDrugIndexTests(TestCase):
+    def setUp(self):
+        self.index = PhoneticDrugIndex.from_normalizer(make_normalizer())
+
+    def found(self, text):
+        return [(m.canonical, m.text, m.exact) for m in self.index.find(text)]
+
+    def test_homophones_share_a_key(self):
+        self.assertEqual(phonetic_key('warfarin'), phonetic_key('war fair in'))
+
+    def test_split_homophones_are_found(self):
+        self.assertEqual(
+            self.found("I take war fair in and met for men"),
+            [('warfarin', 'war fair in', False), ('metformin', 'met for men', False)]
+        )
+
+    def test_exact_spelling_beats_a_longer_phonetic_span(self):
+        self.assertEqual(self.found("I am on motrin, a spirin daily"), [('ibuprofen', 'motrin', True)])
+        self.assertEqual(self.found("motrin a day"), [('ibuprofen', 'motrin', True)])
+
+    def test_spans_stop_at_doses(self):
+        self.assertEqual(
+            self.found("coumadin 5 mg and advil"),
+            [('warfarin', 'coumadin', True), ('ibuprofen', 'advil', True)]
+        )
+
+
+class FuzzyDrugMatcherTests(TestCase):
+    def setUp(self):
+        self.matcher = FuzzyDrugMatcher.from_normalizer(make_normalizer())
+
+    def test_exact_term(self):
+        match = self.matcher.lookup('Glucophage')
+        self.assertEqual((match.canonical, match.distance, match.flagged), ('metformin', 0, False))
+
+    def test_garbled_term_within_distance(self):
+        match = self.matcher.lookup('metfornin')
+        self.assertEqual((match.canonical, match.distance), ('metformin', 1))
+        self.assertFalse(match.flagged)
+
+    def test_low_confidence_match_is_flagged(self):
+        match = self.matcher.lookup('asprn')
+        self.assertEqual(match.canonical, 'aspirin')
+        self.assertTrue(match.flagged)
+
+    def test_nothing_within_distance(self):
+        self.assertIsNone(self.matcher.lookup('xyzzyqq'))
+
+    def test_match_text_keeps_best_match_per_drug(self):
+        matches = self.matcher.match_text("Tab. Metfornin 500mg, metformin, Lisinoprl 10 mg")
+        by_drug = {match.canonical: match for match in matches}
+        self.assertEqual(set(by_drug), {'metformin', 'lisinopril'})
+        self.assertEqual(by_drug['metformin'].distance, 0)
+
+
+class MappedInteractionStoreTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def build(self, index):
+        path = os.path.join(self.directory, 'interactions.bin')
+        build_interaction_store(index, path)
+        store = MappedInteractionStore(path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_round_trip_matches_the_in_memory_index(self):
+        version = content_version(json.dumps(DEFAULT_INTERACTIONS).encode())
+        index = InteractionIndex.from_mapping(DEFAULT_INTERACTIONS, version)
+        store = self.build(index)
+
+        self.assertEqual(store.version, version)
+        self.assertEqual(store.drug_count, index.drug_count)
+        self.assertEqual(sorted(store.drug_names()), sorted(index.drug_names()))
+        self.assertEqual(len(store), len(index))
+        for drug_a, drug_b, interaction in index.items():
+            self.assertEqual(store.lookup(drug_b, drug_a), interaction)
+        self.assertIsNone(store.lookup('aspirin', 'not-a-drug'))
+
+        regimen = ['Warfarin', 'aspirin', 'amoxicillin', 'vitamin_k', 'unknown']
+        self.assertEqual(finding_set(store.check(regimen)), finding_set(index.check(regimen)))
+
+
+class SeverityMatrixTests(TestCase):
+    def setUp(self):
+        self.index = InteractionIndex.from_mapping(LARGE_INTERACTIONS, 'test')
+        self.dense = SeverityMatrix(self.index)
+        self.sparse = SeverityMatrix(self.index, dense_limit=0)
+
+    def test_modes(self):
+        self.assertTrue(self.dense.is_dense)
+        self.assertFalse(self.sparse.is_dense)
+
+    def test_dense_and_sorted_keys_agree_with_the_index(self):
+        regimens = [
+            [f"drug{i}" for i in range(0, 60, 3)],
+            [f"drug{i}" for i in range(10, 40)],
+            ['drug1', 'unknown', 'drug8'],
+            [],
+        ]
+        for regimen in regimens:
+            expected = finding_set(self.index.check(regimen))
+            dense, sparse = self.dense.assess(regimen), self.sparse.assess(regimen)
+            self.assertEqual(finding_set(dense.findings), expected)
+            self.assertEqual(dense.findings, sparse.findings)
+            self.assertEqual(dense.severity_counts, sparse.severity_counts)
+            self.assertEqual(sum(dense.severity_counts), len(expected))
+            severities = [finding.severity for finding in dense.findings]
+            self.assertEqual(severities, sorted(severities, reverse=True))
+
+        self.assertEqual(
+            self.dense.check_batch(regimens), [self.sparse.check(regimen) for regimen in regimens]
+        )
+
+    def test_assess_added_matches_a_full_assessment(self):
+        base = [f"drug{i}" for i in range(0, 60, 2)]
+        added = ['drug7', 'drug14', 'drug21', 'drug33']  # drug14 is already in the base regimen
+        for matrix in (self.dense, self.sparse):
+            known, ids = matrix.regimen_ids(base)
+            incremental = matrix.assess_added(added, known, ids, matrix.assess(base))
+            full = matrix.assess(list(dict.fromkeys(added + base)))
+            self.assertEqual(finding_set(incremental.findings), finding_set(full.findings))
+            self.assertEqual(incremental.severity_counts, full.severity_counts)
+
+
+class SafetyScoreTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('analysis.scoring.get_normalizer', return_value=make_normalizer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counts(self, **severities):
+        counts = [0] * len(Severity)
+        for name, count in severities.items():
+            counts[Severity[name.upper()]] = count
+        return counts
+
+    def test_no_interactions(self):
+        self.assertEqual(safety_score(self.counts()), 100.0)
+
+    def test_one_high_finding_is_below_the_danger_threshold(self):
+        self.assertLess(safety_score(self.counts(high=1)), 60.0)
+
+    def test_risk_factors_increase_the_penalty(self):
+        counts = self.counts(moderate=1)
+        self.assertLess(safety_score(counts, {'age': 80}), safety_score(counts, {'age': 40}))
+
+    def test_polypharmacy_counts_each_drug_once(self):
+        profile = {'current_medications': 'Coumadin, aspirin\nGlucophage'}
+        self.assertEqual(safety_score(self.counts(), profile, ['warfarin', 'Bayer', 'metformin']), 100.0)
+
+        five = ['aspirin', 'warfarin', 'metformin', 'lisinopril', 'ibuprofen']
+        self.assertEqual(safety_score(self.counts(), None, five), 100.0 - POLYPHARMACY_PENALTY)
+        self.assertEqual(safety_score(self.counts(), profile, five[3:]), 100.0 - POLYPHARMACY_PENALTY)
+
+
+class InteractionIndexWatcherTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'drug_interactions.json')
+        self.write('{}')
+        self.reloads = []
+        self.watcher = InteractionIndexWatcher([self.path, None], 60, lambda: self.reloads.append(1) or True)
+
+    def write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+
+    def test_poll_reloads_once_per_change(self):
+        self.assertFalse(self.watcher.poll())
+
+        self.write('{"aspirin": {}}')
+        self.assertTrue(self.watcher.poll())
+        self.assertFalse(self.watcher.poll())
+        self.assertEqual(len(self.reloads), 1)
+
+    def test_poll_notices_a_removed_file(self):
+        os.remove(self.path)
+        self.assertTrue(self.watcher.poll())
+        self.assertEqual(len(self.reloads), 1)
+
+    def test_watcher_is_not_alive_until_started(self):
+        self.assertFalse(self.watcher.is_alive())
+        self.watcher.start()
+        self.addCleanup(self.watcher.stop)
+        self.assertTrue(self.watcher.is_alive())
@@ -0,0 +1,42 @@
+"""
+Persist original uploads to storage after the analysis response has been built
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_upload_executor():
+    """Return the process-wide thread pool that writes uploads to storage"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+    return _executor
+
+
+def store_upload(conversation_id, name, data):
+    """Save ``data`` under conversations/ and attach it to the conversation"""
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from django.db import close_old_connections
+
+    from core.models import ConversationHistory
+
+    try:
+        file_name = default_storage.save(f'conversations/{os.path.basename(name)}', ContentFile(data))
+        ConversationHistory.objects.filter(pk=conversation_id).update(input_file=file_name)
+    except Exception as e:
+        print(f"Warning: could not store upload for conversation {conversation_id}: {e}")
+    finally:
+        close_old_connections()
+
+
+def store_upload_later(conversation_id, name, data):
+    """Queue ``store_upload`` so the request does not wait on storage I/O"""
+    return get_upload_executor().submit(store_upload, conversation_id, name, data)
@@ -8,9 +8,14 @@ import tempfile
 import json
 from datetime import date
 
-from .services import HuggingFaceLLM, OCRService, SpeechService
+from .registry import get_llm
+from .services import OCRService, SpeechService
+from .uploads import store_upload_later
 from core.models import ConversationHistory, UserFeedback
 
+# Accepted history ``sort`` values; ascending safety_score lists the riskiest first
+HISTORY_SORT_FIELDS = ('safety_score', '-safety_score', 'created_at', '-created_at')
+
 
 def calculate_age(birth_date):
     """Calculate age from birth date"""
@@ -26,9 +31,10 @@ def get_patient_info(user, include_patient_info=True):
         return None
         
     return {
+        'user_id': user.pk,
         'age': calculate_age(user.date_of_birth),
         'allergies': user.allergies,
-        'chronic_conditions': user.chronic_conditions,
+        'chronic_conditions': user.medical_conditions,
         'current_medications': user.current_medications,
     }
 
@@ -52,28 +58,33 @@ def analyze_text(request):
             return JsonResponse({'error': 'No valid medications found'}, status=400)
             
         include_patient_info = request.POST.get('include_patient_info', 'true').lower() == 'true'
+        decoding_profile = request.POST.get('decoding_profile') or None
         
         # Get patient information
         patient_info = get_patient_info(request.user, include_patient_info)
         
-        # Initialize LLM and analyze
-        llm = HuggingFaceLLM()
-        analysis_result = llm.analyze_drug_interactions(medications, patient_info)
+        # Analyze with the shared, already-loaded LLM
+        llm = get_llm()
+        analysis_result = llm.analyze_drug_interactions(medications, patient_info, profile=decoding_profile)
         
         # Save to conversation history
         conversation = ConversationHistory.objects.create(
             user=request.user,
             analysis_type='text',
             input_text=', '.join(medications),
-            medications_analyzed=str(medications),
-            drug_interactions=analysis_result,
-            recommendations=analysis_result,
-            safety_score=85  # Default score
+            medications_analyzed=analysis_result['medications_analyzed'],
+            drug_interactions=analysis_result['drug_interactions'],
+            recommendations=analysis_result['recommendations'],
+            safety_score=analysis_result['safety_score'],
+            kb_version=analysis_result['kb_version']
         )
         
         # Prepare response
         result = {
-            'analysis_result': analysis_result,
+            'analysis_result': analysis_result['recommendations'],
+            'drug_interactions': analysis_result['drug_interactions'],
+            'safety_score': analysis_result['safety_score'],
+            'kb_version': analysis_result['kb_version'],
             'medications_found': medications,
             'analysis_type': 'text',
             'conversation_id': conversation.id
@@ -91,31 +102,35 @@ def analyze_text(request):
 @csrf_exempt
 @login_required
 def analyze_image(request):
-    """Analyze medications from image OCR"""
+    """Analyze medications from image OCR
+    
+    The upload is decoded in memory; the original is written to storage
+    only when ``keep_upload`` is true, after the response is ready.
+    """
     if request.method != 'POST':
         return JsonResponse({'error': 'Only POST method allowed'}, status=405)
     
     try:
         image_file = request.FILES.get('image')
         include_patient_info = request.POST.get('include_patient_info', 'false').lower() == 'true'
+        keep_upload = request.POST.get('keep_upload', 'false').lower() == 'true'
         
         if not image_file:
             return JsonResponse({'error': 'No image file provided'}, status=400)
         
-        # Save uploaded image temporarily
-        file_name = default_storage.save(f'temp/{image_file.name}', ContentFile(image_file.read()))
-        file_path = default_storage.path(file_name)
+        image_data = image_file.read()
         
         # Process OCR
         ocr_service = OCRService()
-        ocr_text = ocr_service.extract_text_from_image(file_path)
-        medications = ocr_service.extract_medications(ocr_text)
+        ocr_result = ocr_service.recognize(image_data)
+        ocr_text = ocr_result['ocr_text']
+        medications = ocr_result['medications']
         
         # Get patient information
         patient_info = get_patient_info(request.user, include_patient_info)
         
         # Analyze with LLM
-        llm = HuggingFaceLLM()
+        llm = get_llm()
         analysis_result = llm.analyze_drug_interactions(medications, patient_info)
         
         # Save to conversation history
@@ -123,16 +138,21 @@ def analyze_image(request):
             user=request.user,
             analysis_type='image',
             input_text=ocr_text,
-            input_file=file_name,
-            medications_analyzed=str(medications),
-            drug_interactions=analysis_result,
-            recommendations=analysis_result,
-            safety_score=85  # Default score
+            medications_analyzed=analysis_result['medications_analyzed'],
+            drug_interactions=analysis_result['drug_interactions'],
+            recommendations=analysis_result['recommendations'],
+            safety_score=analysis_result['safety_score'],
+            kb_version=analysis_result['kb_version']
         )
+        if keep_upload:
+            store_upload_later(conversation.id, image_file.name, image_data)
         
         # Prepare response
         result = {
-            'analysis_result': analysis_result,
+            'analysis_result': analysis_result['recommendations'],
+            'drug_interactions': analysis_result['drug_interactions'],
+            'safety_score': analysis_result['safety_score'],
+            'kb_version': analysis_result['kb_version'],
             'medications_found': medications,
             'analysis_type': 'image',
             'conversation_id': conversation.id,
@@ -146,11 +166,6 @@ def analyze_image(request):
             'error': 'Image analysis failed',
             'detail': str(e)
         }, status=500)
-        
-    finally:
-        # Clean up temporary file
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
 
 
 @csrf_exempt
@@ -176,48 +191,48 @@ def analyze_voice(request):
         speech_service = SpeechService()
         transcribed_text = speech_service.transcribe_audio(file_path)
         
-        # Simple medication extraction from transcribed text
-        medications = []
-        common_meds = ['aspirin', 'warfarin', 'lisinopril', 'metformin', 'ibuprofen', 'amoxicillin']
-        for med in common_meds:
-            if med.lower() in transcribed_text.lower():
-                medications.append(med)
-            
-            if not medications:
-                return JsonResponse({
-                    'error': 'No medications found in audio',
-                    'detail': f'Transcribed text: {transcribed_text}'
-                }, status=400)
-            
-            # Get patient information
-            patient_info = get_patient_info(request.user, include_patient_info)
-            
-            # Analyze with LLM
-            llm = HuggingFaceLLM()
-            analysis_result = llm.analyze_drug_interactions(medications, patient_info)
-            
-            # Save to conversation history
-            conversation = ConversationHistory.objects.create(
-                user=request.user,
-                analysis_type='voice',
-                input_text=transcribed_text,
-                input_file=file_name,
-                medications_analyzed=str(medications),
-                drug_interactions=analysis_result,
-                recommendations=analysis_result,
-                safety_score=85  # Default score
-            )
-            
-            # Prepare response
-            result = {
-                'analysis_result': analysis_result,
-                'medications_found': medications,
-                'analysis_type': 'voice',
-                'conversation_id': conversation.id,
-                'transcribed_text': transcribed_text
-            }
-            
-            return JsonResponse(result)
+        # Medication extraction from transcribed text
+        medications = speech_service.extract_medications(transcribed_text)
+        
+        if not medications:
+            return JsonResponse({
+                'error': 'No medications found in audio',
+                'detail': f'Transcribed text: {transcribed_text}'
+            }, status=400)
+        
+        # Get patient information
+        patient_info = get_patient_info(request.user, include_patient_info)
+        
+        # Analyze with LLM
+        llm = get_llm()
+        analysis_result = llm.analyze_drug_interactions(medications, patient_info)
+        
+        # Save to conversation history
+        conversation = ConversationHistory.objects.create(
+            user=request.user,
+            analysis_type='voice',
+            input_text=transcribed_text,
+            input_file=file_name,
+            medications_analyzed=analysis_result['medications_analyzed'],
+            drug_interactions=analysis_result['drug_interactions'],
+            recommendations=analysis_result['recommendations'],
+            safety_score=analysis_result['safety_score'],
+            kb_version=analysis_result['kb_version']
+        )
+        
+        # Prepare response
+        result = {
+            'analysis_result': analysis_result['recommendations'],
+            'drug_interactions': analysis_result['drug_interactions'],
+            'safety_score': analysis_result['safety_score'],
+            'kb_version': analysis_result['kb_version'],
+            'medications_found': medications,
+            'analysis_type': 'voice',
+            'conversation_id': conversation.id,
+            'transcribed_text': transcribed_text
+        }
+        
+        return JsonResponse(result)
             
     except Exception as e:
         return JsonResponse({
@@ -248,6 +263,22 @@ def conversation_history(request):
     if favorites_only == 'true':
         conversations = conversations.filter(is_favorite=True)
     
+    try:
+        min_score = request.GET.get('min_score')
+        if min_score:
+            conversations = conversations.filter(safety_score__gte=float(min_score))
+        max_score = request.GET.get('max_score')
+        if max_score:
+            conversations = conversations.filter(safety_score__lte=float(max_score))
+    except ValueError:
+        return JsonResponse({'error': 'min_score and max_score must be numbers'}, status=400)
+    
+    sort = request.GET.get('sort')
+    if sort:
+        if sort not in HISTORY_SORT_FIELDS:
+            return JsonResponse({'error': f"sort must be one of: {', '.join(HISTORY_SORT_FIELDS)}"}, status=400)
+        conversations = conversations.order_by(sort, '-created_at')
+    
     # Serialize and return
     serializer_data = []
     for conv in conversations:
@@ -259,6 +290,7 @@ def conversation_history(request):
             'drug_interactions': conv.drug_interactions,
             'recommendations': conv.recommendations,
             'safety_score': conv.safety_score,
+            'kb_version': conv.kb_version,
             'created_at': conv.created_at,
             'is_favorite': conv.is_favorite,
             'notes': conv.notes,
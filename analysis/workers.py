@@ -0,0 +1,419 @@
+"""
+Out-of-process inference worker pool for the async API
+"""
+
+import asyncio
+import collections
+import inspect
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+
+class WorkerCrashed(RuntimeError):
+    """A worker process died while handling a job"""
+
+
+# Per-process service instances, created on first use inside each worker
+_services = {}
+
+
+def _service(name, factory):
+    if name not in _services:
+        _services[name] = factory()
+    return _services[name]
+
+
+def task_analyze(medications, user_profile=None, profile=None):
+    from .registry import get_llm
+    return get_llm().analyze_drug_interactions(medications, user_profile, profile=profile)
+
+
+def task_stream_analysis(medications, user_profile=None, profile=None):
+    """Yield ('findings', rule-based result) and then ('token', text) items"""
+    from .registry import get_llm
+    llm = get_llm()
+    yield 'findings', llm.rule_based_result(medications, user_profile)
+    for text in llm.stream_analysis(medications, user_profile, profile=profile):
+        yield 'token', text
+
+
+def task_ocr(image):
+    """OCR an encoded image passed as bytes, bytearray or memoryview, or read from a path"""
+    from .services import OCRService
+    ocr_service = _service('ocr', OCRService)
+    if not isinstance(image, (bytes, bytearray, memoryview)):
+        with open(image, 'rb') as f:
+            image = f.read()
+    return ocr_service.recognize(bytes(image))
+
+
+def task_transcribe(audio_path):
+    from .services import SpeechService
+    speech_service = _service('speech', SpeechService)
+    transcribed_text = speech_service.transcribe_audio(audio_path)
+    matches = speech_service.match_medications(transcribed_text)
+    medications = []
+    for match in matches:
+        if match['name'] not in medications:
+            medications.append(match['name'])
+    return {
+        'transcribed_text': transcribed_text,
+        'medications': medications,
+        'medication_matches': matches,
+    }
+
+
+def process_stats():
+    """Stats of the inference components loaded in this process"""
+    from .ocr_engine import ocr_engine_stats
+    from .regimen import get_snapshot_cache
+    from .registry import get_llm, registry
+
+    llm = get_llm() if registry.is_loaded() else None
+    return {
+        'pid': os.getpid(),
+        'backend': llm.backend.stats() if llm and llm.backend else None,
+        'batching': llm.batcher.stats() if llm and llm.batcher else None,
+        'result_cache': llm.result_cache.stats() if llm and llm.result_cache else None,
+        'regimen_snapshots': get_snapshot_cache().stats(),
+        'ocr_engine': ocr_engine_stats(),
+    }
+
+
+TASKS = {
+    'analyze': task_analyze,
+    'stream_analysis': task_stream_analysis,
+    'ocr': task_ocr,
+    'transcribe': task_transcribe,
+}
+
+
+def _worker_main(worker_id, task_queue, results, preload):
+    """Worker process loop: load models once, then serve jobs until a None sentinel
+
+    Results are pickled here rather than in a queue feeder thread, so a
+    result that cannot be pickled fails its job instead of vanishing.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medai.settings')
+    import django
+    django.setup()
+
+    if preload:
+        from .ocr_engine import get_ocr_engine
+        from .registry import registry
+        registry.warm()
+        get_ocr_engine()  # Probe Tesseract and initialize its API handles once
+
+    def send(kind, job_id, payload):
+        try:
+            results.send_bytes(pickle.dumps((kind, job_id, payload)))
+        except Exception as e:
+            results.send_bytes(pickle.dumps(('error', job_id, f"Unpicklable result: {type(e).__name__}: {e}")))
+
+    # Jobs are only dispatched once the models are loaded, so loading never counts against a job
+    send('ready', None, None)
+    send('stats', None, process_stats())
+    while True:
+        job = task_queue.get()
+        if job is None:
+            break
+
+        job_id, task, args, kwargs = job
+        try:
+            result = TASKS[task](*args, **kwargs)
+            if inspect.isgenerator(result):
+                for chunk in result:
+                    send('chunk', job_id, chunk)
+                result = None
+            send('done', job_id, result)
+        except Exception as e:
+            send('error', job_id, f"{type(e).__name__}: {e}")
+        # Models and engines live in the workers, so the parent can only report what they send back
+        send('stats', None, process_stats())
+
+
+def _resolve(future, result, error):
+    """Complete a job's future unless its caller already gave up on it"""
+    try:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+
+class InferenceWorkerPool:
+    """Fixed set of model-holding worker processes, each fed one job at a time
+
+    Jobs wait in the parent until a worker is idle, so the parent always
+    knows which job each worker holds. Every worker has its own task queue
+    and result pipe; a worker that dies, even mid-write, cannot block the
+    others. Dead workers, and workers whose job has run longer than
+    ``job_timeout`` seconds, are restarted and that job fails with
+    WorkerCrashed. With ``size=0`` tasks run in the default thread executor
+    instead, which still keeps them off the event loop.
+    """
+
+    def __init__(self, size=2, start_method='spawn', preload=True, monitor_interval=1.0, job_timeout=None):
+        self.size = max(0, int(size))
+        self.preload = preload
+        self.monitor_interval = monitor_interval
+        self.job_timeout = job_timeout
+        self._context = multiprocessing.get_context(start_method)
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._futures = {}
+        self._chunk_handlers = {}  # job_id -> callable for streamed items
+        self._pending = collections.deque()
+        self._running = {}  # worker_id -> (job_id, dispatched at)
+        self._ready = set()
+        self._worker_stats = {}  # worker_id -> latest stats the worker reported
+        self._workers = {}
+        self._task_queues = {}
+        self._results = {}  # worker_id -> parent end of the result pipe
+        self._started = False
+        self._stopping = False
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'restarts': 0, 'timeouts': 0}
+
+    def start(self):
+        with self._lock:
+            if self._started or self.size == 0:
+                self._started = True
+                return
+            for worker_id in range(self.size):
+                self._spawn(worker_id)
+            self._started = True
+
+        threading.Thread(target=self._collect, name='inference-results', daemon=True).start()
+        threading.Thread(target=self._monitor, name='inference-monitor', daemon=True).start()
+
+    def shutdown(self, timeout=5):
+        self._stopping = True
+        if self.size == 0 or not self._workers:
+            return
+        for task_queue in self._task_queues.values():
+            task_queue.put(None)
+        for process in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def submit(self, task, *args, **kwargs):
+        """Queue a task for a worker process and return a concurrent Future"""
+        return self._submit(task, args, kwargs)
+
+    def _submit(self, task, args, kwargs, on_chunk=None):
+        if task not in TASKS:
+            raise ValueError(f"Unknown inference task: {task}")
+        if not self._started:
+            self.start()
+
+        future = Future()
+        with self._lock:
+            job_id = next(self._job_ids)
+            future.job_id = job_id
+            self._futures[job_id] = future
+            if on_chunk is not None:
+                self._chunk_handlers[job_id] = on_chunk
+            self._counters['submitted'] += 1
+            self._pending.append((job_id, task, args, kwargs))
+            self._dispatch()
+        return future
+
+    def abandon(self, future):
+        """Stop waiting for a job: drop it if not yet dispatched, ignore its result otherwise"""
+        job_id = getattr(future, 'job_id', None)
+        with self._lock:
+            self._pending = collections.deque(job for job in self._pending if job[0] != job_id)
+            self._chunk_handlers.pop(job_id, None)
+            if self._futures.pop(job_id, None) is not None:
+                self._counters['timeouts'] += 1
+
+    async def run(self, task, *args, **kwargs):
+        """Await a task result without blocking the event loop, for at most ``job_timeout`` seconds"""
+        if self.size == 0:
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(None, lambda: TASKS[task](*args, **kwargs))
+            return await asyncio.wait_for(call, self.job_timeout)
+
+        future = self.submit(task, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.job_timeout)
+        except asyncio.TimeoutError:
+            self.abandon(future)
+            raise TimeoutError(f"Inference task {task} did not finish within {self.job_timeout}s")
+
+    def stream(self, task, *args, **kwargs):
+        """Blocking iterator over the items a generator task yields in a worker"""
+        if self.size == 0:
+            yield from TASKS[task](*args, **kwargs)
+            return
+
+        finished = object()
+        chunks = queue.Queue()
+        future = self._submit(task, args, kwargs, on_chunk=chunks.put)
+        future.add_done_callback(lambda _: chunks.put(finished))
+        deadline = time.monotonic() + self.job_timeout if self.job_timeout else None
+        try:
+            while True:
+                try:
+                    chunk = chunks.get(timeout=max(0, deadline - time.monotonic()) if deadline else None)
+                except queue.Empty:
+                    raise TimeoutError(f"Inference task {task} did not finish within {self.job_timeout}s")
+                if chunk is finished:
+                    future.result()  # Raises if the task failed
+                    return
+                yield chunk
+        finally:
+            # Timed out, or the consumer stopped reading (e.g. the client disconnected)
+            if not future.done():
+                self.abandon(future)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.size,
+                'alive': sum(1 for p in self._workers.values() if p.is_alive()),
+                'queue_depth': len(self._pending),
+                'in_flight': len(self._running),
+                **self._counters,
+            }
+
+    def worker_stats(self):
+        """Latest stats each worker reported after loading and after every job"""
+        with self._lock:
+            return dict(self._worker_stats)
+
+    def _spawn(self, worker_id):
+        """Start a worker on fresh channels; called with the lock held"""
+        task_queue = self._context.Queue()
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, task_queue, writer, self.preload),
+            name=f'inference-worker-{worker_id}',
+            daemon=True
+        )
+        process.start()
+        # Only the worker holds the write end, so its death shows up as EOF
+        writer.close()
+        self._ready.discard(worker_id)
+        self._workers[worker_id] = process
+        self._task_queues[worker_id] = task_queue
+        self._results[worker_id] = reader
+
+    def _dispatch(self):
+        """Hand pending jobs to idle workers; called with the lock held"""
+        for worker_id in self._workers:
+            if not self._pending:
+                return
+            if worker_id in self._running or worker_id not in self._ready:
+                continue
+            job = self._pending.popleft()
+            self._running[worker_id] = (job[0], time.monotonic())
+            self._task_queues[worker_id].put(job)
+
+    def _collect(self):
+        while not self._stopping:
+            with self._lock:
+                readers = {reader: worker_id for worker_id, reader in self._results.items()}
+            for reader in multiprocessing.connection.wait(list(readers), timeout=1):
+                worker_id = readers[reader]
+                try:
+                    kind, job_id, payload = pickle.loads(reader.recv_bytes())
+                except (EOFError, OSError):
+                    # The worker is gone; the monitor fails its job and restarts it
+                    with self._lock:
+                        if self._results.get(worker_id) is reader:
+                            del self._results[worker_id]
+                    continue
+                self._handle(worker_id, kind, job_id, payload)
+
+    def _handle(self, worker_id, kind, job_id, payload):
+        with self._lock:
+            if kind == 'ready':
+                self._ready.add(worker_id)
+                self._dispatch()
+                return
+            if kind == 'stats':
+                self._worker_stats[worker_id] = payload
+                return
+            if kind == 'chunk':
+                handler = self._chunk_handlers.get(job_id)
+            else:
+                if self._running.get(worker_id, (None,))[0] == job_id:
+                    del self._running[worker_id]
+                future = self._futures.pop(job_id, None)
+                self._chunk_handlers.pop(job_id, None)
+                self._counters['completed' if kind == 'done' else 'failed'] += 1
+                self._dispatch()
+
+        if kind == 'chunk':
+            if handler is not None:
+                handler(payload)
+        elif future is not None:
+            _resolve(future, payload if kind == 'done' else None, None if kind == 'done' else RuntimeError(payload))
+
+    def _monitor(self):
+        while not self._stopping:
+            time.sleep(self.monitor_interval)
+            now = time.monotonic()
+            for worker_id, process in list(self._workers.items()):
+                if self._stopping:
+                    return
+                with self._lock:
+                    job_id, dispatched_at = self._running.get(worker_id, (None, None))
+                stuck = (
+                    dispatched_at is not None and self.job_timeout
+                    and now - dispatched_at > self.job_timeout
+                )
+                if process.is_alive() and not stuck:
+                    continue
+
+                if stuck:
+                    print(f"Warning: inference worker {worker_id} exceeded {self.job_timeout}s, restarting")
+                    process.kill()
+                    process.join(5)
+                else:
+                    print(f"Warning: inference worker {worker_id} exited with code {process.exitcode}, restarting")
+
+                with self._lock:
+                    self._running.pop(worker_id, None)
+                    future = self._futures.pop(job_id, None) if job_id is not None else None
+                    self._chunk_handlers.pop(job_id, None)
+                    self._counters['restarts'] += 1
+                    if future is not None:
+                        self._counters['failed'] += 1
+                    self._task_queues[worker_id].close()
+                    self._spawn(worker_id)
+                    self._dispatch()
+
+                if future is not None:
+                    _resolve(future, None, WorkerCrashed(f"Inference worker {worker_id} crashed"))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide inference pool configured by INFERENCE_WORKERS"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from django.conf import settings
+                _pool = InferenceWorkerPool(
+                    size=getattr(settings, 'INFERENCE_WORKERS', 2),
+                    start_method=getattr(settings, 'INFERENCE_WORKER_START_METHOD', 'spawn'),
+                    job_timeout=getattr(settings, 'INFERENCE_TIMEOUT', 120) or None
+                )
+    return _pool
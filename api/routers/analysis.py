@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+import json
 import os
 import django
 
@@ -10,15 +12,32 @@ django.setup()
 
 from authentication.models import User
 from api.routers.auth import get_current_user
-from analysis.services import HuggingFaceLLM, OCRProcessor, SpeechProcessor
+from analysis.interaction_store import knowledge_base_stats
+from analysis.registry import registry
+from analysis.uploads import store_upload_later
+from analysis.workers import get_pool, process_stats
 from core.models import ConversationHistory
 
 router = APIRouter()
 
+# OCR cache outcomes as seen by this process; the cache itself lives in the worker processes
+ocr_cache_counts = {'lookups': 0, 'exact': 0, 'near': 0}
+
+
+def ocr_cache_stats():
+    hits = ocr_cache_counts['exact'] + ocr_cache_counts['near']
+    lookups = ocr_cache_counts['lookups']
+    return {
+        **ocr_cache_counts,
+        'misses': lookups - hits,
+        'hit_ratio': round(hits / lookups, 3) if lookups else 0.0,
+    }
+
 
 class TextAnalysisRequest(BaseModel):
     medications: List[str]
     include_patient_info: bool = True
+    decoding_profile: Optional[str] = None  # 'fast' or 'rich'; defaults to LLM_DECODING_PROFILE
 
 
 class AnalysisResponse(BaseModel):
@@ -28,6 +47,7 @@ class AnalysisResponse(BaseModel):
     recommendations: str
     analysis_type: str
     conversation_id: int
+    kb_version: str
 
 
 class ConversationHistoryResponse(BaseModel):
@@ -38,6 +58,7 @@ class ConversationHistoryResponse(BaseModel):
     drug_interactions: Dict[str, Any]
     recommendations: str
     safety_score: float
+    kb_version: str
     created_at: str
     is_favorite: bool
     notes: str
@@ -49,8 +70,10 @@ def get_patient_info(user: User, include_patient_info: bool = True):
         return None
         
     return {
+        'user_id': user.pk,
+        'age': user.age,
         'allergies': user.allergies,
-        'chronic_conditions': user.chronic_conditions,
+        'chronic_conditions': user.medical_conditions,
         'current_medications': user.current_medications,
     }
 
@@ -73,9 +96,10 @@ async def analyze_text(
         # Get patient information
         patient_info = get_patient_info(current_user, request.include_patient_info)
         
-        # Initialize LLM and analyze
-        llm = HuggingFaceLLM()
-        analysis_result = llm.analyze_drug_interactions(medications, patient_info)
+        # Analyze in the inference worker pool so the event loop stays free
+        analysis_result = await get_pool().run(
+            'analyze', medications, patient_info, profile=request.decoding_profile
+        )
         
         # Save to conversation history
         conversation = ConversationHistory.objects.create(
@@ -85,7 +109,8 @@ async def analyze_text(
             medications_analyzed=analysis_result['medications_analyzed'],
             drug_interactions=analysis_result['drug_interactions'],
             recommendations=analysis_result['recommendations'],
-            safety_score=analysis_result['safety_score']
+            safety_score=analysis_result['safety_score'],
+            kb_version=analysis_result['kb_version']
         )
         
         return AnalysisResponse(
@@ -94,7 +119,8 @@ async def analyze_text(
             safety_score=analysis_result['safety_score'],
             recommendations=analysis_result['recommendations'],
             analysis_type='text',
-            conversation_id=conversation.id
+            conversation_id=conversation.id,
+            kb_version=analysis_result['kb_version']
         )
         
     except Exception as e:
@@ -104,13 +130,101 @@ async def analyze_text(
         )
 
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/text/stream")
+async def analyze_text_stream(
+    request: TextAnalysisRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream a text analysis over server-sent events
+    
+    Emits the rule-based findings first, then the LLM output token by
+    token, and a final event once the conversation has been saved. The
+    generation runs in the inference worker pool, like every other route.
+    """
+    medications = request.medications
+    
+    if not medications:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No medications provided"
+        )
+    
+    patient_info = get_patient_info(current_user, request.include_patient_info)
+    
+    def event_stream():
+        items = get_pool().stream(
+            'stream_analysis', medications, patient_info, profile=request.decoding_profile
+        )
+        
+        # Instant findings and score so the client can render before generation starts
+        try:
+            _, rule_result = next(items)
+        except Exception as e:
+            yield sse_event('error', {'detail': f"Analysis failed: {str(e)}"})
+            return
+        findings = rule_result['recommendations']
+        yield sse_event('findings', {
+            'medications': rule_result['medications_analyzed'],
+            'findings': findings,
+            'drug_interactions': rule_result['drug_interactions'],
+            'safety_score': rule_result['safety_score'],
+            'kb_version': rule_result['kb_version'],
+        })
+        
+        chunks = []
+        try:
+            for _, text in items:
+                chunks.append(text)
+                yield sse_event('token', {'text': text})
+        except Exception as e:
+            yield sse_event('error', {'detail': f"Generation failed: {str(e)}"})
+        
+        recommendations = ''.join(chunks).strip() or findings
+        
+        # Persist once the stream has finished
+        conversation = ConversationHistory.objects.create(
+            user=current_user,
+            analysis_type='text',
+            input_text=', '.join(medications),
+            medications_analyzed=rule_result['medications_analyzed'],
+            drug_interactions=rule_result['drug_interactions'],
+            recommendations=recommendations,
+            safety_score=rule_result['safety_score'],
+            kb_version=rule_result['kb_version']
+        )
+        
+        yield sse_event('done', {
+            'conversation_id': conversation.id,
+            'recommendations': recommendations,
+            'safety_score': rule_result['safety_score'],
+            'kb_version': rule_result['kb_version'],
+            'analysis_type': 'text',
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @router.post("/image", response_model=AnalysisResponse)
 async def analyze_image(
     image: UploadFile = File(...),
     include_patient_info: bool = True,
+    keep_upload: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Analyze medications from image OCR"""
+    """Analyze medications from image OCR
+    
+    The upload bytes go straight to the OCR worker; the original is written
+    to storage afterwards, and only when ``keep_upload`` is set.
+    """
     try:
         # Validate file type
         if not image.content_type.startswith('image/'):
@@ -119,64 +233,51 @@ async def analyze_image(
                 detail="File must be an image"
             )
         
-        # Save file temporarily
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp:
-            content = await image.read()
-            tmp.write(content)
-            tmp_path = tmp.name
+        content = await image.read()
         
-        try:
-            # Process OCR
-            ocr_processor = OCRProcessor()
-            ocr_result = ocr_processor.extract_text_from_image(tmp_path)
-            
-            if 'error' in ocr_result:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"OCR processing failed: {ocr_result['error']}"
-                )
-            
-            medications = ocr_result['extracted_medications']
-            
-            if not medications:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="No medications found in image"
-                )
-            
-            # Get patient information
-            patient_info = get_patient_info(current_user, include_patient_info)
-            
-            # Analyze with LLM
-            llm = HuggingFaceLLM()
-            analysis_result = llm.analyze_drug_interactions(medications, patient_info)
-            
-            # Save to conversation history
-            conversation = ConversationHistory.objects.create(
-                user=current_user,
-                analysis_type='image',
-                input_text=ocr_result['cleaned_text'],
-                medications_analyzed=analysis_result['medications_analyzed'],
-                drug_interactions=analysis_result['drug_interactions'],
-                recommendations=analysis_result['recommendations'],
-                safety_score=analysis_result['safety_score']
-            )
-            
-            return AnalysisResponse(
-                medications_analyzed=analysis_result['medications_analyzed'],
-                drug_interactions=analysis_result['drug_interactions'],
-                safety_score=analysis_result['safety_score'],
-                recommendations=analysis_result['recommendations'],
-                analysis_type='image',
-                conversation_id=conversation.id
+        # Process OCR in the inference worker pool, decoding from memory
+        ocr_result = await get_pool().run('ocr', content)
+        ocr_cache_counts['lookups'] += 1
+        if ocr_result.get('cache'):
+            ocr_cache_counts[ocr_result['cache']] += 1
+        medications = ocr_result['medications']
+        
+        if not medications:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No medications found in image"
             )
-            
-        finally:
-            # Clean up temporary file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-                
+        
+        # Get patient information
+        patient_info = get_patient_info(current_user, include_patient_info)
+        
+        # Analyze with LLM
+        analysis_result = await get_pool().run('analyze', medications, patient_info)
+        
+        # Save to conversation history
+        conversation = ConversationHistory.objects.create(
+            user=current_user,
+            analysis_type='image',
+            input_text=ocr_result['ocr_text'],
+            medications_analyzed=analysis_result['medications_analyzed'],
+            drug_interactions=analysis_result['drug_interactions'],
+            recommendations=analysis_result['recommendations'],
+            safety_score=analysis_result['safety_score'],
+            kb_version=analysis_result['kb_version']
+        )
+        if keep_upload:
+            store_upload_later(conversation.id, image.filename or 'upload', content)
+        
+        return AnalysisResponse(
+            medications_analyzed=analysis_result['medications_analyzed'],
+            drug_interactions=analysis_result['drug_interactions'],
+            safety_score=analysis_result['safety_score'],
+            recommendations=analysis_result['recommendations'],
+            analysis_type='image',
+            conversation_id=conversation.id,
+            kb_version=analysis_result['kb_version']
+        )
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -209,17 +310,9 @@ async def analyze_voice(
             tmp_path = tmp.name
         
         try:
-            # Process speech recognition
-            speech_processor = SpeechProcessor()
-            speech_result = speech_processor.process_audio_file(tmp_path)
-            
-            if 'error' in speech_result:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Speech recognition failed: {speech_result['error']}"
-                )
-            
-            medications = speech_result['extracted_medications']
+            # Process speech recognition in the inference worker pool
+            speech_result = await get_pool().run('transcribe', tmp_path)
+            medications = speech_result['medications']
             
             if not medications:
                 raise HTTPException(
@@ -231,18 +324,18 @@ async def analyze_voice(
             patient_info = get_patient_info(current_user, include_patient_info)
             
             # Analyze with LLM
-            llm = HuggingFaceLLM()
-            analysis_result = llm.analyze_drug_interactions(medications, patient_info)
+            analysis_result = await get_pool().run('analyze', medications, patient_info)
             
             # Save to conversation history
             conversation = ConversationHistory.objects.create(
                 user=current_user,
                 analysis_type='voice',
-                input_text=speech_result['recognized_text'],
+                input_text=speech_result['transcribed_text'],
                 medications_analyzed=analysis_result['medications_analyzed'],
                 drug_interactions=analysis_result['drug_interactions'],
                 recommendations=analysis_result['recommendations'],
-                safety_score=analysis_result['safety_score']
+                safety_score=analysis_result['safety_score'],
+                kb_version=analysis_result['kb_version']
             )
             
             return AnalysisResponse(
@@ -251,7 +344,8 @@ async def analyze_voice(
                 safety_score=analysis_result['safety_score'],
                 recommendations=analysis_result['recommendations'],
                 analysis_type='voice',
-                conversation_id=conversation.id
+                conversation_id=conversation.id,
+                kb_version=analysis_result['kb_version']
             )
             
         finally:
@@ -266,3 +360,32 @@ async def analyze_voice(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Voice analysis failed: {str(e)}"
         )
+
+
+# Components that live in the inference workers when the pool is enabled
+WORKER_METRICS = ('backend', 'batching', 'result_cache', 'regimen_snapshots', 'ocr_engine')
+
+
+def worker_metrics():
+    """Component stats of each inference worker, or of this process when tasks run in-process"""
+    pool = get_pool()
+    if pool.size == 0:
+        stats = process_stats()
+        return {key: stats[key] for key in WORKER_METRICS}
+    workers = sorted(pool.worker_stats().items())
+    return {
+        key: {str(worker_id): stats.get(key) for worker_id, stats in workers}
+        for key in WORKER_METRICS
+    }
+
+
+@router.get("/metrics")
+async def analysis_metrics(current_user: User = Depends(get_current_user)):
+    """Report the state of the shared inference components"""
+    return {
+        'model': registry.stats(),
+        'knowledge_base': knowledge_base_stats(),
+        **worker_metrics(),
+        'ocr_cache': ocr_cache_stats(),
+        'worker_pool': get_pool().stats(),
+    }
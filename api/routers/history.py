@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import os
@@ -23,6 +23,7 @@ class ConversationResponse(BaseModel):
     drug_interactions: Dict[str, Any]
     recommendations: str
     safety_score: float
+    kb_version: str
     created_at: str
     is_favorite: bool
     notes: str
@@ -39,9 +40,15 @@ class FeedbackRequest(BaseModel):
 async def get_conversation_history(
     analysis_type: Optional[str] = None,
     favorites_only: bool = False,
+    min_score: Optional[float] = Query(None, ge=0, le=100),
+    max_score: Optional[float] = Query(None, ge=0, le=100),
+    sort: str = Query('-created_at', pattern='^-?(safety_score|created_at)$'),
     current_user: User = Depends(get_current_user)
 ):
-    """Get user's conversation history"""
+    """Get user's conversation history
+    
+    ``sort=safety_score`` lists the riskiest analyses first.
+    """
     try:
         conversations = ConversationHistory.objects.filter(user=current_user)
         
@@ -52,6 +59,14 @@ async def get_conversation_history(
         if favorites_only:
             conversations = conversations.filter(is_favorite=True)
         
+        if min_score is not None:
+            conversations = conversations.filter(safety_score__gte=min_score)
+        
+        if max_score is not None:
+            conversations = conversations.filter(safety_score__lte=max_score)
+        
+        conversations = conversations.order_by(sort, '-created_at')
+        
         # Convert to response format
         result = []
         for conv in conversations:
@@ -63,6 +78,7 @@ async def get_conversation_history(
                 drug_interactions=conv.drug_interactions,
                 recommendations=conv.recommendations,
                 safety_score=conv.safety_score,
+                kb_version=conv.kb_version,
                 created_at=conv.created_at.isoformat(),
                 is_favorite=conv.is_favorite,
                 notes=conv.notes
@@ -94,6 +110,7 @@ async def get_conversation_detail(
             drug_interactions=conversation.drug_interactions,
             recommendations=conversation.recommendations,
             safety_score=conversation.safety_score,
+            kb_version=conversation.kb_version,
             created_at=conversation.created_at.isoformat(),
             is_favorite=conversation.is_favorite,
             notes=conversation.notes
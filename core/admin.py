@@ -4,8 +4,8 @@ from .models import ConversationHistory, DrugDatabase, UserFeedback
 
 @admin.register(ConversationHistory)
 class ConversationHistoryAdmin(admin.ModelAdmin):
-    list_display = ('user', 'analysis_type', 'safety_score', 'is_favorite', 'created_at')
-    list_filter = ('analysis_type', 'is_favorite', 'created_at')
+    list_display = ('user', 'analysis_type', 'safety_score', 'kb_version', 'is_favorite', 'created_at')
+    list_filter = ('analysis_type', 'is_favorite', 'kb_version', 'created_at')
     search_fields = ('user__email', 'input_text', 'recommendations')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
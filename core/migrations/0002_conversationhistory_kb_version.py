@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-16 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversationhistory",
+            name="kb_version",
+            field=models.CharField(
+                blank=True,
+                help_text="Version of the interaction data used",
+                max_length=32,
+            ),
+        ),
+    ]
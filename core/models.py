@@ -24,6 +24,7 @@ class ConversationHistory(models.Model):
     drug_interactions = models.JSONField(help_text="Drug interaction analysis results")
     recommendations = models.TextField(help_text="AI recommendations")
     safety_score = models.FloatField(null=True, blank=True, help_text="Safety score (0-100)")
+    kb_version = models.CharField(max_length=32, blank=True, help_text="Version of the interaction data used")
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
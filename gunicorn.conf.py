@@ -0,0 +1,61 @@
+"""
+Gunicorn configuration for multi-worker deployments
+
+Run with:  gunicorn -c gunicorn.conf.py medai.asgi:app
+
+The LLM is loaded once in the master before forking so that the gunicorn
+workers share its weight pages copy-on-write when they run inference
+in-process (Django views, INFERENCE_WORKERS=0). Only the weights are
+shared: post_fork gives each worker its own interaction data watcher and
+result cache connection. The spawn-started inference pool workers load
+their own weights; only LLM_WEIGHTS_MMAP=True shares pages between them.
+"""
+
+import gc
+import os
+
+from decouple import config
+
+bind = config('GUNICORN_BIND', default='0.0.0.0:8000')
+workers = config('GUNICORN_WORKERS', default=2, cast=int)
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = 120
+
+# Import the application (and the model) in the master process
+preload_app = config('LLM_PRELOAD_BEFORE_FORK', default=True, cast=bool)
+
+
+def on_starting(server):
+    if not preload_app:
+        return
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medai.settings')
+    import django
+    django.setup()
+
+    from analysis.registry import registry
+    stats = registry.warm()
+    server.log.info(f"Preloaded LLM in master: {stats['model_memory_mb']} MB in {stats['load_time_seconds']}s")
+
+    # Keep the garbage collector from writing to (and un-sharing) preloaded objects
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+
+    # The watcher thread and SQLite handles opened in the master are not usable here
+    from analysis.registry import registry
+    registry.after_fork()
+
+
+def post_worker_init(worker):
+    from analysis.registry import memory_breakdown
+
+    memory = memory_breakdown()
+    if memory:
+        worker.log.info(
+            f"Worker {worker.pid} memory: shared {memory['shared_mb']} MB, "
+            f"private {memory['private_mb']} MB, PSS {memory.get('pss_mb')} MB"
+        )
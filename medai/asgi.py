@@ -50,5 +50,28 @@ from fastapi.applications import FastAPI
 from fastapi.middleware.wsgi import WSGIMiddleware
 
 app = FastAPI()
+
+
+@app.on_event("startup")
+async def warm_models():
+    """Start the inference workers (or load the in-process LLM) before serving requests"""
+    from django.conf import settings
+    from analysis.registry import registry
+    from analysis.workers import get_pool
+
+    pool = get_pool()
+    pool.start()
+    # With worker processes the model lives only in the workers
+    if settings.LLM_PRELOAD and pool.size == 0:
+        registry.warm()
+
+
+@app.on_event("shutdown")
+async def stop_inference_workers():
+    from analysis.workers import get_pool
+
+    get_pool().shutdown()
+
+
 app.mount("/api", fastapi_app)
 app.mount("/", WSGIMiddleware(django_asgi_app))
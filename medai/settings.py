@@ -164,6 +164,56 @@ CORS_ALLOW_ALL_ORIGINS = DEBUG
 # HuggingFace API Key
 HUGGINGFACE_API_KEY = config('HUGGINGFACE_API_KEY')
 
+# LLM inference settings
+LLM_MODEL_NAME = config('LLM_MODEL_NAME', default='microsoft/DialoGPT-medium')
+LLM_CACHE_DIR = config('LLM_CACHE_DIR', default=str(BASE_DIR / 'models'))
+LLM_PRELOAD = config('LLM_PRELOAD', default=False, cast=bool)  # Load the model at worker start
+LLM_PRECISION = config('LLM_PRECISION', default='auto')  # auto, fp32, bf16 or int8 (CPU dynamic quantization)
+LLM_BACKEND = config('LLM_BACKEND', default='torch')  # torch, onnx (see `manage.py export_onnx`) or stub
+LLM_ONNX_DIR = config('LLM_ONNX_DIR', default=str(BASE_DIR / 'models' / 'onnx'))
+LLM_DECODING_PROFILE = config('LLM_DECODING_PROFILE', default='fast')  # fast (greedy, bounded) or rich (sampling)
+LLM_LATENCY_BUDGET_MS = config('LLM_LATENCY_BUDGET_MS', default=0, cast=int)  # 0 uses the profile's budget
+LLM_PREFIX_CACHE = config('LLM_PREFIX_CACHE', default=True, cast=bool)  # Reuse past key/values of the prompt prefix
+LLM_NUM_THREADS = config('LLM_NUM_THREADS', default=0, cast=int)  # 0 lets the runtime decide
+LLM_WEIGHTS_MMAP = config('LLM_WEIGHTS_MMAP', default=False, cast=bool)  # Share weight pages across workers
+LLM_MMAP_DIR = config('LLM_MMAP_DIR', default=str(BASE_DIR / 'models' / 'mmap'))  # Written by setup_ai_models.py
+
+# Inference worker processes used by the async API (0 runs tasks in a thread instead)
+INFERENCE_WORKERS = config('INFERENCE_WORKERS', default=2, cast=int)
+INFERENCE_WORKER_START_METHOD = config('INFERENCE_WORKER_START_METHOD', default='spawn')
+INFERENCE_TIMEOUT = config('INFERENCE_TIMEOUT', default=120, cast=float)  # Seconds a request waits for a worker; stuck workers are restarted
+LLM_BATCHING = config('LLM_BATCHING', default=True, cast=bool)  # Micro-batch concurrent generate calls
+LLM_BATCH_MAX_SIZE = config('LLM_BATCH_MAX_SIZE', default=8, cast=int)
+LLM_BATCH_MAX_WAIT_MS = config('LLM_BATCH_MAX_WAIT_MS', default=10, cast=float)
+LLM_RESULT_CACHE = config('LLM_RESULT_CACHE', default=True, cast=bool)
+LLM_RESULT_CACHE_PATH = config('LLM_RESULT_CACHE_PATH', default=str(BASE_DIR / 'cache' / 'analysis_results.sqlite3'))
+LLM_RESULT_CACHE_SIZE = config('LLM_RESULT_CACHE_SIZE', default=1024, cast=int)  # In-memory entries
+LLM_RESULT_CACHE_TTL = config('LLM_RESULT_CACHE_TTL', default=86400, cast=int)  # Seconds
+LLM_DEGRADED_RESULT_TTL = config('LLM_DEGRADED_RESULT_TTL', default=60, cast=int)  # Seconds to keep rule-based fallbacks and deadline-cut answers; 0 never caches them
+
+# Drug knowledge base
+DRUG_INTERACTIONS_FILE = config('DRUG_INTERACTIONS_FILE', default=str(BASE_DIR / 'drug_interactions.json'))
+DRUG_INTERACTIONS_DB = config('DRUG_INTERACTIONS_DB', default=str(BASE_DIR / 'cache' / 'drug_interactions.bin'))  # Built by `manage.py build_interaction_db`
+DRUG_INTERACTIONS_RELOAD_INTERVAL = config('DRUG_INTERACTIONS_RELOAD_INTERVAL', default=5.0, cast=float)  # Seconds between change checks; 0 disables hot reload
+DRUG_DATABASE_RELOAD_INTERVAL = config('DRUG_DATABASE_RELOAD_INTERVAL', default=5.0, cast=float)  # Seconds between checks for DrugDatabase edits made by other processes; 0 disables them
+OCR_ENGINE = config('OCR_ENGINE', default='auto')  # auto, tesserocr (in-process API handles) or subprocess
+OCR_ENGINE_POOL_SIZE = config('OCR_ENGINE_POOL_SIZE', default=0, cast=int)  # Warm Tesseract handles per process; 0 matches OCR_BLOCK_WORKERS
+OCR_LANGUAGE = config('OCR_LANGUAGE', default='eng')
+OCR_MAX_IMAGE_PIXELS = config('OCR_MAX_IMAGE_PIXELS', default=50000000, cast=int)  # Larger uploads are rejected before decoding
+OCR_DECODE_MIN_SIDE = config('OCR_DECODE_MIN_SIDE', default=2000, cast=int)  # Long side kept when decoding photos at reduced scale
+OCR_TARGET_TEXT_HEIGHT = config('OCR_TARGET_TEXT_HEIGHT', default=32, cast=int)  # Pixels; text is rescaled towards this before thresholding
+OCR_PARALLEL_BLOCKS = config('OCR_PARALLEL_BLOCKS', default=True, cast=bool)  # Split pages into columns/paragraphs and OCR them concurrently
+OCR_BLOCK_WORKERS = config('OCR_BLOCK_WORKERS', default=2, cast=int)  # Concurrent block recognitions per process
+OCR_BLOCK_MAX_LINES = config('OCR_BLOCK_MAX_LINES', default=12, cast=int)  # Longer blocks are split between lines
+OCR_CACHE = config('OCR_CACHE', default=True, cast=bool)  # Reuse OCR results for re-uploaded images
+OCR_CACHE_PATH = config('OCR_CACHE_PATH', default=str(BASE_DIR / 'cache' / 'ocr_results.sqlite3'))
+OCR_CACHE_SIZE = config('OCR_CACHE_SIZE', default=256, cast=int)  # In-memory entries
+OCR_CACHE_TTL = config('OCR_CACHE_TTL', default=604800, cast=int)  # Seconds
+OCR_CACHE_NEAR_DUPLICATES = config('OCR_CACHE_NEAR_DUPLICATES', default=False, cast=bool)  # Also match re-encoded/resized copies by perceptual hash
+OCR_MATCH_MAX_DISTANCE = config('OCR_MATCH_MAX_DISTANCE', default=2, cast=int)  # Edit distance for garbled names
+OCR_MATCH_MIN_CONFIDENCE = config('OCR_MATCH_MIN_CONFIDENCE', default=0.75, cast=float)  # Below this a match is flagged
+REGIMEN_SNAPSHOT_CACHE_SIZE = config('REGIMEN_SNAPSHOT_CACHE_SIZE', default=4096, cast=int)  # Per-user parsed current medications
+
 # JWT Settings
 JWT_SECRET_KEY = SECRET_KEY
 JWT_ALGORITHM = 'HS256'
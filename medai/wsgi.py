@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medai.settings')
 
 application = get_wsgi_application()
+
+# Warm the shared LLM before the worker starts serving requests
+from django.conf import settings
+
+if settings.LLM_PRELOAD:
+    from analysis.registry import registry
+    registry.warm()
@@ -14,6 +14,7 @@ import pytesseract
 import speech_recognition as sr
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
+from decouple import config
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
@@ -22,6 +23,7 @@ warnings.filterwarnings('ignore')
 MODEL_NAME = "ibm-granite/granite-3.3-2b-instruct"
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 CACHE_DIR = "./models"
+MMAP_DIR = os.path.join(CACHE_DIR, "mmap")
 
 def setup_directories():
     """Create necessary directories"""
@@ -91,6 +93,41 @@ def download_model():
         print(f"❌ Failed to load model: {e}")
         return None, tokenizer, device
 
+def export_mmap_weights(model, tokenizer):
+    """Save fp32 safetensors weights of the server's model that workers can memory-map and share"""
+    # Export the model the server loads (LLM_MODEL_NAME), to the directory it looks in
+    model_name = config('LLM_MODEL_NAME', default='microsoft/DialoGPT-medium')
+    if model_name != MODEL_NAME:
+        print(f"📥 Loading {model_name} for the safetensors export...")
+        try:
+            tokenizer = AutoTokenizer.from_pretrained(model_name, token=HUGGINGFACE_API_KEY, cache_dir=CACHE_DIR)
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name, token=HUGGINGFACE_API_KEY, torch_dtype=torch.float32, cache_dir=CACHE_DIR
+            )
+        except Exception as e:
+            print(f"❌ Failed to load {model_name}: {e}")
+            return False
+    
+    if model is None or tokenizer is None:
+        print("⚠️ Skipping safetensors export - model not loaded")
+        return False
+    
+    mmap_dir = config('LLM_MMAP_DIR', default=MMAP_DIR)
+    export_dir = os.path.join(mmap_dir, model_name.replace('/', '--'))
+    print(f"💾 Exporting safetensors weights to {export_dir}...")
+    try:
+        os.makedirs(export_dir, exist_ok=True)
+        # One unsharded file keeps the whole model in a single mapping
+        model.to(device='cpu', dtype=torch.float32).save_pretrained(
+            export_dir, safe_serialization=True, max_shard_size='100GB'
+        )
+        tokenizer.save_pretrained(export_dir)
+        print("✅ Weights exported; set LLM_WEIGHTS_MMAP=True to share them across workers")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to export safetensors weights: {e}")
+        return False
+
 def test_llm(model, tokenizer, device):
     """Test LLM functionality"""
     if model is None or tokenizer is None:
@@ -268,6 +305,7 @@ def main():
     print("\n1️⃣ Setting up HuggingFace LLM...")
     model, tokenizer, device = download_model()
     llm_success = test_llm(model, tokenizer, device)
+    export_mmap_weights(model, tokenizer)
     
     # Test OCR
     print("\n2️⃣ Setting up OCR...")
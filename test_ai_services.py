@@ -33,7 +33,8 @@ def test_ai_services():
         
         test_medications = ["aspirin", "warfarin"]
         result = llm_service.analyze_drug_interactions(test_medications)
-        print(f"🧠 LLM Analysis Result:\n{result}")
+        print(f"🧠 LLM Analysis Result:\n{result['recommendations']}")
+        print(f"🛡️ Safety score: {result['safety_score']}")
         
         # Test 2: OCR Service
         print("\n2️⃣ Testing OCR Service...")
@@ -68,7 +69,7 @@ def test_ai_services():
         print(f"  🧠 LLM: ✅ Rule-based system ready")
         print(f"  👁️ OCR: {'✅ Ready' if ocr_service.tesseract_available else '❌ Unavailable'}")
         print(f"  🎤 Speech: {'✅ Ready' if speech_service.microphone_available else '⚠️ No microphone'}")
-        print(f"  📚 Drug DB: ✅ {len(llm_service.drug_interactions)} medications in database")
+        print(f"  📚 Drug DB: ✅ {llm_service.interaction_index.drug_count} medications in database")
         
         return True
         